@@ -0,0 +1,247 @@
+"""
+Benchmarks
+
+Runs the application in-process against a temporary ``DATA_DIR``, with a
+docker stand-in and a local bare repository instead of docker and a git
+host, and prints the results as JSON::
+
+    python benchmarks/bench.py --output results.json
+    python benchmarks/bench.py --quick --only webhook export
+
+- ``webhook``: deploy webhook requests per second, deployments of a project without remote
+- ``export``: render time of ``/export/traefik.json`` with ``--pages`` pages and
+  ``--redirects`` redirects
+- ``upload``: page upload and extraction in MB/s
+- ``lists``: latency of the list endpoints over the exported pages and redirects
+- ``deploys``: ``--deploys`` projects deployed at the same time, docker calls take
+  ``--docker-latency`` seconds
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+ROOT_KEY = 'benchmark'
+
+temp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+os.environ.update(DATA_DIR=temp.name, ROOT_KEY=ROOT_KEY, LOGLEVEL='CRITICAL', HTTPD_CONFIG_DUMP='1')
+os.environ.setdefault('SALT', base64.b64encode(os.urandom(32)).decode())
+# measure the application, not its rate limits
+os.environ.update(WEBHOOK_RATE='0', WEBHOOK_IP_RATE='0', DEPLOY_QUEUE_LIMIT='0')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# pylint: disable=wrong-import-position
+from httpx import ASGITransport, AsyncClient
+from sqlmodel import Session
+
+from fakes import fake_docker, git_server
+
+from canary_cd.database import _engine, Deployment, Page, Project, Redirect, Secret
+from canary_cd.dependencies import ch
+from canary_cd.main import app, lifespan
+
+SCENARIOS = ['webhook', 'export', 'upload', 'lists', 'deploys']
+
+QUICK = {'requests': 20, 'pages': 200, 'redirects': 200, 'upload_mb': 2, 'deploys': 3, 'samples': 5}
+
+
+def summary(samples: list[float]) -> dict:
+    """latency summary in milliseconds"""
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'p50_ms': statistics.median(samples) * 1000,
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+async def timed(request) -> float:
+    start = time.perf_counter()
+    response = await request
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def add_project(db: Session,
+                name: str,
+                remote: str | None = None,
+                variables: dict | None = None) -> str:
+    """project with encrypted variables, returns its webhook token"""
+    token = f'{name}-token'
+    project = Project(name=name, remote=remote, token=ch.hash(token))
+    db.add(project)
+    for key, value in (variables or {}).items():
+        db.add(Secret(project=project, key=key, encrypted=ch.seal(value)))
+    db.commit()
+    return token
+
+
+async def bench_webhook(client: AsyncClient, args) -> dict:
+    with Session(_engine) as db:
+        token = add_project(db, 'bench-webhook')
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def post() -> float:
+        async with semaphore:
+            return await timed(client.post(f'/webhook/project/{token}'))
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*[post() for _ in range(args.requests)])
+    elapsed = time.perf_counter() - start
+    return {'requests_per_second': args.requests / elapsed,
+            'concurrency': args.concurrency,
+            **summary(samples)}
+
+
+async def bench_export(client: AsyncClient, args) -> dict:
+    with Session(_engine) as db:
+        db.add_all(Page(fqdn=f'page-{i}.bench.example.com') for i in range(args.pages))
+        db.add_all(Redirect(source=f'redirect-{i}.bench.example.com',
+                            destination='bench.example.com')
+                   for i in range(args.redirects))
+        db.commit()
+
+    response = await client.get('/export/traefik.json')
+    size = len(response.content)
+    samples = [await timed(client.get('/export/traefik.json')) for _ in range(args.samples)]
+    return {'pages': args.pages, 'redirects': args.redirects, 'bytes': size, **summary(samples)}
+
+
+def page_payload(size: int, files: int = 100) -> bytes:
+    """gzipped tar archive of ``files`` incompressible files, ``size`` bytes in total"""
+    payload = io.BytesIO()
+    with tarfile.open(fileobj=payload, mode='w:gz', compresslevel=1) as archive:
+        for i in range(files):
+            content = os.urandom(size // files)
+            info = tarfile.TarInfo(f'dist/assets/file-{i}.bin')
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return payload.getvalue()
+
+
+async def bench_upload(client: AsyncClient, args) -> dict:
+    fqdn = 'upload.bench.example.com'
+    response = await client.post('/page', json={'fqdn': fqdn})
+    response.raise_for_status()
+    token = (await client.get(f'/page/{fqdn}/refresh-token')).json()['token']
+
+    payload = page_payload(int(args.upload_mb * 1024 * 1024))
+    # the upload returns once the background extraction finished
+    samples = [await timed(client.post(f'/webhook/page/{token}', content=payload))
+               for _ in range(args.samples)]
+    megabytes = len(payload) / 1024 / 1024
+    return {'megabytes': megabytes,
+            'mb_per_second': megabytes / statistics.median(samples),
+            **summary(samples)}
+
+
+async def bench_lists(client: AsyncClient, args) -> dict:
+    results = {}
+    for path in ['/project', '/page', '/redirect', '/page?filter_by=page-1&ordering=updated_at']:
+        samples = [await timed(client.get(path)) for _ in range(args.samples)]
+        results[path] = summary(samples)
+    return results
+
+
+async def bench_deploys(client: AsyncClient, args) -> dict:
+    root = Path(temp.name, 'bench-deploys')
+    remote = git_server(root)
+    variables = fake_docker(root, args.docker_latency)
+    with Session(_engine) as db:
+        tokens = [add_project(db, f'bench-deploy-{i}', remote, variables)
+                  for i in range(args.deploys)]
+
+    start = time.perf_counter()
+    responses = await asyncio.gather(*[client.post(f'/webhook/project/{token}')
+                                       for token in tokens])
+    elapsed = time.perf_counter() - start
+
+    with Session(_engine) as db:
+        deployments = [db.get(Deployment, uuid.UUID(response.json()['deployment']))
+                       for response in responses]
+    failed = [deployment.id for deployment in deployments if deployment.status != 'success']
+    if failed:
+        raise RuntimeError(f"deployments failed: {failed}")
+    return {
+        'deploys': args.deploys,
+        'docker_latency': args.docker_latency,
+        'deploys_per_second': args.deploys / elapsed,
+        **summary([deployment.duration for deployment in deployments]),
+    }
+
+
+async def run(args) -> dict:
+    results = {}
+    headers = {'Authorization': f'Bearer {ROOT_KEY}'}
+    # the export is only served to local clients
+    transport = ASGITransport(app=app, client=('127.0.0.1', 8000))
+    async with lifespan(app):
+        async with AsyncClient(transport=transport, base_url='http://test',
+                               headers=headers, timeout=None) as client:
+            for name in args.only:
+                start = time.perf_counter()
+                results[name] = await globals()[f'bench_{name}'](client, args)
+                results[name]['seconds'] = time.perf_counter() - start
+    return results
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='canary-cd benchmarks')
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--output', type=Path, help='write the results to a file instead of stdout')
+    parser.add_argument('--quick', action='store_true',
+                        help='small sizes, e.g. to check the benchmarks run')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=10000)
+    parser.add_argument('--redirects', type=int, default=10000)
+    parser.add_argument('--upload-mb', type=float, default=50)
+    parser.add_argument('--deploys', type=int, default=20)
+    parser.add_argument('--docker-latency', type=float, default=0.05)
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args(argv)
+    if args.quick:
+        vars(args).update(QUICK)
+    return args
+
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+    try:
+        version = metadata.version('canary-cd')
+    except metadata.PackageNotFoundError:
+        version = None
+    report = {
+        'version': version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'parameters': {key: str(value) if isinstance(value, Path) else value
+                       for key, value in vars(args).items()},
+        'results': asyncio.run(run(args)),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+    temp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
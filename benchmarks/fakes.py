@@ -0,0 +1,51 @@
+"""
+Stand-ins for the external tools of a deployment
+
+- ``fake_docker``: a ``docker`` executable answering the ``docker compose``
+  calls of ``service_deploy`` after a configurable latency
+- ``git_server``: a local bare repository served over ``file://``
+"""
+import os
+from pathlib import Path
+
+import git
+
+FAKE_DOCKER = '''#!/bin/sh
+sleep "$FAKE_DOCKER_LATENCY"
+case "$*" in
+  *"config --hash"*) printf 'web 1111\\nworker 2222\\n' ;;
+  *"config --format json"*) printf '%s' '{"name": "bench", "services": {"web": {"image": "nginx"}, "worker": {"image": "nginx"}}}' ;;
+  *"ps --all --format json"*) ;;
+  "image inspect"*) ;;
+esac
+'''
+
+AUTHOR = git.Actor('canary', 'canary@example.com')
+
+
+def fake_docker(root: Path, latency: float = 0.0) -> dict[str, str]:
+    """install the docker stand-in to ``root/bin``, returns the variables of a project using it"""
+    (root / 'bin').mkdir(parents=True, exist_ok=True)
+    docker = root / 'bin' / 'docker'
+    docker.write_text(FAKE_DOCKER)
+    docker.chmod(0o755)
+    return {
+        'PATH': f"{root / 'bin'}:{os.environ['PATH']}",
+        'FAKE_DOCKER_LATENCY': str(latency),
+    }
+
+
+def git_server(root: Path, files: dict[str, str] | None = None, branch: str = 'main') -> str:
+    """bare repository with a single commit of ``files``, returns its remote"""
+    files = files or {
+        'compose.yml': 'services:\n  web:\n    image: nginx\n  worker:\n    image: nginx\n',
+    }
+    work = git.Repo.init(root / 'work', initial_branch=branch)
+    for name, content in files.items():
+        path = Path(work.working_dir, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    work.index.add(list(files))
+    work.index.commit('initial commit', author=AUTHOR, committer=AUTHOR)
+    bare = work.clone(root / 'upstream.git', bare=True)
+    return f'file://{bare.git_dir}'
@@ -0,0 +1,191 @@
+"""
+Remote deploy agent.
+
+Runs next to a Docker daemon, pulls the deployments of the projects pinned
+to it from the controller, runs them with the controller's ``git_pull`` and
+``service_deploy`` and streams the output back::
+
+    AGENT_CONTROLLER=https://canary.example.com AGENT_TOKEN=... canary-cd-agent
+
+Jobs carry the decrypted secrets of the project, the controller must be
+reached over https.
+"""
+import asyncio
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+from canary_cd.database import Deployment
+from canary_cd.models import AgentJob, AgentResult, DeploymentSpanDetails
+from canary_cd.settings import logger, REPO_CACHE, AGENT_CONTROLLER, AGENT_TOKEN, AGENT_POLL, AGENT_LOG_INTERVAL
+from canary_cd.settings import AGENT_CONCURRENCY
+from canary_cd.utils.stream import DeploymentLog
+from canary_cd.utils.tasks import git_pull, service_deploy, _run_cmd
+
+
+class AgentLog(DeploymentLog):
+    """output of a job, kept for the result and forwarded to the controller in batches"""
+
+    def __init__(self):
+        super().__init__()
+        self.pending: list[str] = []
+
+    def write(self, stream: str, text: str):
+        super().write(stream, text)
+        if text:
+            self.pending.append(text)
+
+    def take(self) -> str:
+        text, self.pending = ''.join(self.pending), []
+        return text
+
+
+class DeployAgent:
+    """
+    Pull and run deployments
+
+    :param controller: url of the controller
+    :param token: token of the agent
+    :param repo_cache: working trees of the projects
+    :param transport: httpx transport, e.g. the controller app in tests
+    """
+
+    def __init__(self,
+                 controller: str = AGENT_CONTROLLER,
+                 token: str = AGENT_TOKEN,
+                 repo_cache: Path = REPO_CACHE,
+                 concurrency: int = AGENT_CONCURRENCY,
+                 poll: float = AGENT_POLL,
+                 log_interval: float = AGENT_LOG_INTERVAL,
+                 transport: httpx.AsyncBaseTransport | None = None):
+        self.repo_cache = repo_cache
+        self.concurrency = max(concurrency, 1)
+        self.poll = poll
+        self.log_interval = log_interval
+        self.client = httpx.AsyncClient(base_url=controller,
+                                        headers={'Authorization': f'Bearer {token}'},
+                                        transport=transport,
+                                        timeout=30)
+
+    async def claim(self) -> AgentJob | None:
+        response = await self.client.post('/agent/jobs/claim')
+        response.raise_for_status()
+        if response.status_code == 204:
+            return None
+        return AgentJob.model_validate(response.json())
+
+    async def _post_log(self, deployment_id: uuid.UUID, text: str) -> bool:
+        response = await self.client.post(f'/agent/jobs/{deployment_id}/log', content=text.encode('utf-8'))
+        if response.status_code == 409:
+            return False
+        response.raise_for_status()
+        return True
+
+    async def _forward(self, deployment_id: uuid.UUID, log: AgentLog):
+        # posts are also the heartbeat keeping the job's lease
+        while True:
+            await asyncio.sleep(self.log_interval)
+            try:
+                if not await self._post_log(deployment_id, log.take()):
+                    logger.error(f"Deployment {deployment_id} was taken over, its result will be rejected")
+                    return
+            except httpx.HTTPError as e:
+                logger.error(f"Deployment {deployment_id} output not forwarded: {e}")
+
+    async def run(self, job: AgentJob) -> AgentResult:
+        """deploy a job with the local docker daemon"""
+        deployment = Deployment(id=job.deployment)
+        log = AgentLog()
+        forward = asyncio.create_task(self._forward(job.deployment, log))
+        repo_path = self.repo_cache / job.project
+        start = time.perf_counter()
+        deployed = False
+        try:
+            if not job.remote:
+                log.write('info', f"[{job.project}] No Remote Found\n")
+            elif await git_pull(repo_path, job.remote, job.branch, job.auth_type, job.auth_key, deployment):
+                stdout, _stderr = await _run_cmd('git rev-parse HEAD', cwd=repo_path)
+                deployment.commit = stdout.strip() or None
+                log.write('info', f"Deploying {job.project}@{deployment.commit}\n")
+                deployed, _out = await service_deploy(repo_path, job.variables, job.branch, deployment, log,
+                                                      job.previous_services, previous_builds=job.previous_builds)
+            else:
+                log.write('info', f"[{job.project}] Cloning not successful, please check logs\n")
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"[{job.project}] Deployment failed: {e}")
+            log.write('info', f"Agent error: {e}\n")
+        finally:
+            forward.cancel()
+
+        try:
+            await self._post_log(job.deployment, log.take())
+        except httpx.HTTPError:
+            pass
+        return AgentResult(
+            status='success' if deployed else 'failed',
+            commit=deployment.commit,
+            duration=time.perf_counter() - start,
+            output=log.text(),
+            services=deployment.services,
+            images=deployment.images,
+            builds=deployment.builds,
+            spans=[DeploymentSpanDetails.model_validate(span, from_attributes=True) for span in deployment.spans],
+        )
+
+    async def execute(self, job: AgentJob):
+        logger.info(f"[{job.project}] Deploying {job.deployment}")
+        result = await self.run(job)
+        for attempt in range(3):
+            try:
+                response = await self.client.post(f'/agent/jobs/{job.deployment}/result',
+                                                  json=result.model_dump(mode='json'))
+                if response.status_code == 409:
+                    logger.error(f"[{job.project}] Result of {job.deployment} rejected")
+                    return
+                response.raise_for_status()
+                logger.info(f"[{job.project}] Deployment {result.status}")
+                return
+            except httpx.HTTPError as e:
+                logger.error(f"[{job.project}] Result not reported: {e}")
+                await asyncio.sleep(2 ** attempt)
+
+    async def run_once(self) -> bool:
+        """claim and run a single job"""
+        job = await self.claim()
+        if job is None:
+            return False
+        await self.execute(job)
+        return True
+
+    async def serve(self):
+        """claim jobs until cancelled, up to ``concurrency`` at the same time"""
+        running: set[asyncio.Task] = set()
+        try:
+            while True:
+                job = None
+                if len(running) < self.concurrency:
+                    try:
+                        job = await self.claim()
+                    except httpx.HTTPError as e:
+                        logger.error(f"Claiming a deployment failed: {e}")
+                if job is None:
+                    await asyncio.sleep(self.poll)
+                    continue
+                task = asyncio.create_task(self.execute(job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+        finally:
+            await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def main():
+    asyncio.run(DeployAgent().serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,12 @@ from datetime import datetime, timezone
 from typing import Annotated, List, Optional
 
 from fastapi import Depends
+from sqlalchemy import event, inspect, text
 from sqlmodel import SQLModel, Field, DateTime, TIMESTAMP, JSON, ARRAY, Column, String
-from sqlmodel import Session, create_engine, select, column, asc, desc
+from sqlmodel import Session, create_engine, select, column, col, asc, desc
 from sqlmodel import UniqueConstraint, Relationship
 
-from canary_cd.settings import SALT, SQLITE, logger
+from canary_cd.settings import SQLITE, logger
 from canary_cd.utils.crypto import random_string, CryptoHelper
 
 
@@ -35,8 +36,9 @@ class Auth(SQLModel, table=True):
 
     name: str = Field(index=True, unique=True, nullable=False, min_length=1, max_length=256)
     auth_type: str = Field()  # ssh, pat, token, app
-    nonce: str = Field()
-    ciphertext: str = Field()
+    encrypted: bytes | None = Field(default=None)  # sealed by CryptoHelper.encrypt_record
+    nonce: str = Field(default='')  # base64 nonce and ciphertext of earlier releases, empty once sealed
+    ciphertext: str = Field(default='')
     public_key: str | None = Field(default=None, nullable=True)
 
     created_at: datetime = Field(default_factory=now)
@@ -60,10 +62,20 @@ class Project(SQLModel, table=True):
 
     token: str | None = Field(default=None)
 
+    # deployed by a remote agent, the named one or any agent with the label
+    agent: str | None = Field(default=None)
+    agent_label: str | None = Field(default=None)
+
     created_at: datetime = Field(default_factory=now)
     updated_at: datetime = Field(default_factory=now, sa_column_kwargs={"onupdate": now})
 
     secrets: list["Secret"] = Relationship(back_populates="project", cascade_delete=True)
+    deployments: list["Deployment"] = Relationship(back_populates="project", cascade_delete=True)
+    canary: Optional["Canary"] = Relationship(back_populates="project", cascade_delete=True)
+
+    @property
+    def agent_pinned(self) -> bool:
+        return bool(self.agent or self.agent_label)
 
 
 class Secret(SQLModel, table=True):
@@ -79,8 +91,9 @@ class Secret(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, unique=True)
 
     key: str = Field(min_length=1, max_length=256)
-    nonce: str = Field()
-    ciphertext: str = Field()
+    encrypted: bytes | None = Field(default=None)  # sealed by CryptoHelper.encrypt_record
+    nonce: str = Field(default='')  # base64 nonce and ciphertext of earlier releases, empty once sealed
+    ciphertext: str = Field(default='')
 
     created_at: datetime = Field(default_factory=now)
     updated_at: datetime = Field(default_factory=now, sa_column_kwargs={"onupdate": now})
@@ -104,12 +117,169 @@ class Redirect(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=now, sa_column_kwargs={"onupdate": now})
 
 
+class Canary(SQLModel, table=True):
+    """
+    Traffic shifting between the blue and green slot of a Project
+    - a deployment starts the idle slot next to the active one
+    - the weight of the candidate slot increases in steps
+    - the old slot is retired when the shift completes
+    """
+    project_id: uuid.UUID = Field(foreign_key="project.id", primary_key=True)
+    project: Project | None = Relationship(back_populates="canary")
+
+    fqdn: str = Field(unique=True)
+    service: str = Field(min_length=1, max_length=256)
+    port: int = Field(default=80)
+    steps: str = Field(default='10,50,100')  # candidate weights in percent
+    interval: int = Field(default=60)  # seconds between steps
+
+    active: str | None = Field(default=None)  # blue, green
+    candidate: str | None = Field(default=None)
+    weight: int = Field(default=0)  # percent of traffic on the candidate
+    status: str = Field(default='idle')  # idle, shifting, done, aborted
+
+    created_at: datetime = Field(default_factory=now)
+    updated_at: datetime = Field(default_factory=now, sa_column_kwargs={"onupdate": now})
+
+
+class Deployment(SQLModel, table=True):
+    """
+    Deployment of a Project, traced per stage
+    """
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+
+    project_id: uuid.UUID = Field(foreign_key="project.id", index=True)
+    project: Project | None = Relationship(back_populates="deployments")
+
+    status: str = Field(default='queued')  # queued, running, success, failed, rolled_back
+    commit: str | None = Field(default=None)  # deployed revision
+    duration: float | None = Field(default=None)
+    output: bytes | None = Field(default=None)  # zlib compressed
+    services: dict | None = Field(default=None, sa_column=Column(JSON(none_as_null=True)))  # service: config hash
+    images: dict | None = Field(default=None, sa_column=Column(JSON(none_as_null=True)))  # image: image id
+    builds: dict | None = Field(default=None, sa_column=Column(JSON(none_as_null=True)))  # service: build context hash
+    agent: str | None = Field(default=None)  # name of the remote agent that ran it
+
+    created_at: datetime = Field(default_factory=now, index=True)
+    finished_at: datetime | None = Field(default=None)
+
+    spans: list["DeploymentSpan"] = Relationship(back_populates="deployment", cascade_delete=True)
+
+
+class DeploymentSpan(SQLModel, table=True):
+    """
+    Timing of a single Deployment stage
+    """
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+
+    deployment_id: uuid.UUID = Field(foreign_key="deployment.id", index=True)
+    deployment: Deployment | None = Relationship(back_populates="spans")
+
+    stage: str = Field(index=True)
+    started_at: datetime = Field(default_factory=now)
+    duration: float = Field(default=0)
+    exit_code: int | None = Field(default=None)
+    bytes: int | None = Field(default=None)
+
+
+class Notification(SQLModel, table=True):
+    """
+    Outbox of pending Notifications
+    """
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+
+    channel: str = Field(index=True)  # discord, slack
+    message: str = Field()
+    status: str = Field(default='pending', index=True)  # pending, failed
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=now)
+
+    created_at: datetime = Field(default_factory=now)
+
+
+class Agent(SQLModel, table=True):
+    """
+    Remote deploy agent, pulls the deployments of projects pinned to it
+    """
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+
+    name: str = Field(index=True, unique=True, min_length=1, max_length=256)
+    labels: str | None = Field(default=None)  # comma separated, e.g. eu,gpu
+    token: str | None = Field(default=None)
+    last_seen: datetime | None = Field(default=None)
+
+    created_at: datetime = Field(default_factory=now)
+    updated_at: datetime = Field(default_factory=now, sa_column_kwargs={"onupdate": now})
+
+
+class Upload(SQLModel, table=True):
+    """
+    Resumable upload of a Page payload, the chunks are written to UPLOAD_CACHE/<id>
+    """
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+
+    page_id: uuid.UUID = Field(foreign_key="page.id", index=True)
+    size: int = Field()
+    checksum: str | None = Field(default=None)  # sha256 of the payload
+
+    created_at: datetime = Field(default_factory=now)
+    updated_at: datetime = Field(default_factory=now, sa_column_kwargs={"onupdate": now})
+
+    chunks: list["UploadChunk"] = Relationship(back_populates="upload", cascade_delete=True)
+
+
+class UploadChunk(SQLModel, table=True):
+    """
+    Byte range of an Upload that was received and verified
+    """
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+
+    upload_id: uuid.UUID = Field(foreign_key="upload.id", index=True)
+    upload: Upload | None = Relationship(back_populates="chunks")
+
+    offset: int = Field()
+    length: int = Field()
+
+
+class Lease(SQLModel, table=True):
+    """
+    Ownership of a task shared by several workers, e.g. the deployments of a project
+    """
+    name: str = Field(primary_key=True)  # deploy:<project id>, notify, prefetch
+    owner: str = Field()
+    expires_at: datetime = Field()
+
+
 _connect_args = {"check_same_thread": False}
-_engine = create_engine(SQLITE, connect_args=_connect_args)
+# running deployments keep a connection each, waiting for a free one would block the event loop
+_engine = create_engine(SQLITE, connect_args=_connect_args, max_overflow=-1)
+
+
+@event.listens_for(_engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, _connection_record):
+    # several workers share the database, readers never block the writer
+    dbapi_connection.execute('PRAGMA journal_mode=WAL')
+    dbapi_connection.execute('PRAGMA busy_timeout=5000')
+
+
+def _add_missing_columns():
+    """add nullable columns to tables created by an earlier version"""
+    inspector = inspect(_engine)
+    quote = _engine.dialect.identifier_preparer.quote
+    with _engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for table_column in table.columns:
+                if table_column.name not in existing and table_column.nullable:
+                    column_type = table_column.type.compile(dialect=_engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {quote(table.name)} '
+                                            f'ADD COLUMN {quote(table_column.name)} {column_type}'))
+                    logger.info(f"Added column {table.name}.{table_column.name}")
 
 
 async def create_db_and_tables():
     SQLModel.metadata.create_all(_engine)
+    _add_missing_columns()
 
     db = Session(_engine)
 
@@ -119,7 +289,7 @@ async def create_db_and_tables():
 
     if not root_key:
         key = os.environ.get("ROOT_KEY", random_string())
-        root_key = Config(key='ROOT_KEY', value=CryptoHelper(SALT).hash(key))
+        root_key = Config(key='ROOT_KEY', value=CryptoHelper().hash(key))
         db.add(root_key)
         db.commit()
         logger.info(f"\nAPI_KEY {key}")
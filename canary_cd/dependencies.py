@@ -17,7 +17,7 @@ from canary_cd.models import *
 from canary_cd.utils.crypto import CryptoHelper
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-ch = CryptoHelper(SALT)
+ch = CryptoHelper()
 
 async def validate_admin(token: Annotated[str, Depends(oauth2_scheme)], db: Database):
     """Validate Bearer for root"""
@@ -29,3 +29,11 @@ async def validate_admin(token: Annotated[str, Depends(oauth2_scheme)], db: Data
 
     if len(root_key.value) == 0 or not ch.hash_verify(token, root_key.value):
         raise HTTPException(status_code=400, detail='Unauthorized')
+
+
+async def validate_agent(token: Annotated[str, Depends(oauth2_scheme)], db: Database) -> Agent:
+    """Validate Bearer of a remote agent"""
+    agent = db.exec(select(Agent).where(Agent.token == ch.hash(token))).first()
+    if not agent:
+        raise HTTPException(status_code=400, detail='Unauthorized')
+    return agent
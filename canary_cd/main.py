@@ -1,27 +1,63 @@
 """
 Main application entry point.
 """
+import asyncio
 import os
 from contextlib import asynccontextmanager
 from datetime import datetime
 
 from fastapi import FastAPI, Request
 
-from canary_cd.settings import REPO_CACHE, PAGES_CACHE, DYN_CONFIG_CACHE
+from canary_cd.settings import REPO_CACHE, MIRROR_CACHE, BUILD_CACHE, PAGES_CACHE, DYN_CONFIG_CACHE, PREFETCH_INTERVAL
+from canary_cd.settings import UPLOAD_CACHE, CACHE_INTERVAL, IMAGE_GC_INTERVAL
+from canary_cd.settings import DATA_DIR, REDIRECT_ENGINE, FORWARDED_ALLOW_IPS
 from canary_cd import __version__
 from canary_cd.routers import routers
-from canary_cd.database import create_db_and_tables
+from canary_cd.database import create_db_and_tables, _engine
+from canary_cd.utils.cache import cache_loop
+from canary_cd.utils.images import image_gc_loop
+from canary_cd.utils.keys import reencryption_job
+from canary_cd.utils.notify import outbox_loop
+from canary_cd.utils.prefetch import prefetch_loop
+from canary_cd.utils.proxy import proxy
+from canary_cd.utils.profiling import TimingMiddleware, instrument_engine
+from canary_cd.utils.redirects import RedirectMiddleware, redirect_map
+from canary_cd.utils.lease import file_lock
+from canary_cd.utils.tasks import shift_resume, deploy_loop
 
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     """lifespan context manager."""
     # startup
-    for cache in [REPO_CACHE, PAGES_CACHE, DYN_CONFIG_CACHE]:
+    for cache in [REPO_CACHE, MIRROR_CACHE, BUILD_CACHE, PAGES_CACHE, DYN_CONFIG_CACHE, UPLOAD_CACHE]:
         os.makedirs(cache, exist_ok=True)
-    await create_db_and_tables()
+    # workers start at the same time, one at a time migrates and sets the ROOT_KEY
+    with file_lock(DATA_DIR / 'startup.lock'):
+        await create_db_and_tables()
+    await proxy.rebuild()
+
+    tasks = [asyncio.create_task(outbox_loop()), asyncio.create_task(deploy_loop()),
+             asyncio.create_task(proxy.refresh_loop())]
+    if PREFETCH_INTERVAL:
+        tasks.append(asyncio.create_task(prefetch_loop()))
+    if CACHE_INTERVAL:
+        tasks.append(asyncio.create_task(cache_loop()))
+    if IMAGE_GC_INTERVAL:
+        tasks.append(asyncio.create_task(image_gc_loop()))
+    # values of earlier releases and keys are re-encrypted once the database is up
+    tasks.append(asyncio.create_task(reencryption_job()))
+    if REDIRECT_ENGINE:
+        redirect_map.load()
+        tasks.append(asyncio.create_task(redirect_map.refresh_loop()))
+    shift_resume()
+
     yield
+
     # shutdown
+    for task in tasks:
+        task.cancel()
+    await proxy.close()
 
 
 fastapi_options = {
@@ -36,6 +72,10 @@ fastapi_options = {
 }
 
 app = FastAPI(**fastapi_options)
+if REDIRECT_ENGINE:
+    app.add_middleware(RedirectMiddleware)
+app.add_middleware(TimingMiddleware)
+instrument_engine(_engine)
 for router in routers:
     app.include_router(router)
 
@@ -64,7 +104,7 @@ def main():
                 host=host,
                 port=int(port),
                 proxy_headers=True,
-                forwarded_allow_ips='*',
+                forwarded_allow_ips=FORWARDED_ALLOW_IPS,
                 log_level="info",
                 )
 
@@ -45,6 +45,8 @@ class ProjectUpdate(BaseModel):
     remote: Optional[str] | None = Field(None, examples=REPO_EXAMPLES, pattern=single_pattern(GIT_REPO_PATTERN))
     branch: Optional[str] = Field(None, examples=['main'])
     key: Optional[str] = Field(None, examples=['key-name'])
+    agent: Optional[str] = Field(None, pattern=NAME_PATTERN, examples=['agent-name'])
+    agent_label: Optional[str] = Field(None, pattern=NAME_PATTERN, examples=['eu'])
 
 
 class ProjectCreate(ProjectUpdate):
@@ -59,6 +61,8 @@ class ProjectDetails(DateBase):
     auth_id: Optional[uuid.UUID] | None = Field()
     auth: Optional["AuthCreate"] | None = Field(exclude=True)
     key: Optional[str] = Field(None, examples=['key-name'])
+    agent: Optional[str] = Field(None, examples=['agent-name'])
+    agent_label: Optional[str] = Field(None, examples=['eu'])
 
     @field_serializer('key')
     def serialize(self, value: Any):
@@ -88,6 +92,23 @@ class VariableValueDetails(VariableDetails):
     value: str | None = Field()
 
 
+class VariableBatch(BaseModel):
+    variables: dict[str, str] = Field(examples=[{"HOST": "example.com", "PORT": "8080"}])
+
+
+class VariableBatchDetails(BaseModel):
+    created: list[str] = Field([], examples=[["HOST"]])
+    updated: list[str] = Field([], examples=[["PORT"]])
+
+
+# Encryption Keys
+class KeyStatus(BaseModel):
+    active: int = Field(examples=[2])
+    versions: dict[int, int] = Field({}, examples=[{0: 0, 1: 12, 2: 188}])  # values per key version
+    legacy: int = Field(0, examples=[0])  # values stored by an earlier release
+    running: bool = Field(False)  # re-encryption in progress
+
+
 # Page
 class PageCreate(BaseModel):
     fqdn: str = Field(min_length=1, max_length=256, pattern=FQDN_PATTERN, examples=FQDN_EXAMPLES)
@@ -96,14 +117,202 @@ class PageCreate(BaseModel):
 class PageDetails(PageCreate, DateBase):
     id: uuid.UUID = Field()
 
+
+# Upload
+class UploadCreate(BaseModel):
+    size: int = Field(ge=1, examples=[2 * 1024 ** 3])
+    checksum: Optional[str] = Field(None, pattern=r"^[0-9a-f]{64}$", description='sha256 of the payload')
+
+
+class UploadDetails(BaseModel):
+    id: uuid.UUID = Field()
+    size: int = Field(examples=[2 * 1024 ** 3])
+    chunk_size: int = Field(examples=[8 * 1024 ** 2], description='suggested chunk size')
+    offset: int = Field(examples=[0], description='bytes received without a gap from the start')
+    received: list[tuple[int, int]] = Field([], examples=[[[0, 8388608]]], description='received byte ranges')
+    missing: list[tuple[int, int]] = Field([], examples=[[[8388608, 2147483648]]], description='missing byte ranges')
+
+
 # Redirect
 class RedirectCreate(BaseModel):
-    source: str = Field(min_length=1, max_length=256, pattern=FQDN_PATTERN, examples=[FQDN_EXAMPLES[1]])
-    destination: str = Field(min_length=1, max_length=256, pattern=FQDN_PATTERN, examples=FQDN_EXAMPLES)
+    source: str = Field(min_length=1, max_length=256, pattern=REDIRECT_SOURCE_PATTERN,
+                        examples=REDIRECT_SOURCE_EXAMPLES)
+    destination: str = Field(min_length=1, max_length=256, pattern=REDIRECT_DESTINATION_PATTERN,
+                             examples=REDIRECT_DESTINATION_EXAMPLES)
 
 class RedirectUpdate(BaseModel):
-    destination: str = Field(min_length=1, max_length=256, pattern=FQDN_PATTERN, examples=FQDN_EXAMPLES)
+    destination: str = Field(min_length=1, max_length=256, pattern=REDIRECT_DESTINATION_PATTERN,
+                             examples=REDIRECT_DESTINATION_EXAMPLES)
 
 
 class RedirectDetails(RedirectCreate, DateBase):
     id: uuid.UUID = Field()
+
+
+# Canary
+class CanaryUpdate(BaseModel):
+    fqdn: str = Field(min_length=1, max_length=256, pattern=FQDN_PATTERN, examples=FQDN_EXAMPLES)
+    service: str = Field(min_length=1, max_length=256, pattern=NAME_PATTERN, examples=['web'])
+    port: int = Field(80, ge=1, le=65535, examples=[80])
+    steps: list[int] = Field([10, 50, 100], min_length=1, examples=[[10, 50, 100]])
+    interval: int = Field(60, ge=0, examples=[60])
+
+    @field_validator('steps', mode='before')
+    @classmethod
+    def split_steps(cls, value: Any) -> Any:
+        return value.split(',') if isinstance(value, str) else value
+
+    @field_validator('steps')
+    @classmethod
+    def validate_steps(cls, value: list[int]) -> list[int]:
+        if any(step < 1 or step > 100 for step in value):
+            raise ValueError('steps must be between 1 and 100')
+        return value
+
+
+class CanaryDetails(CanaryUpdate, DateBase):
+    active: str | None = Field(None, examples=['blue'])
+    candidate: str | None = Field(None, examples=['green'])
+    weight: int = Field(0, examples=[10])
+    status: str = Field(examples=['shifting'])
+
+
+# Deployment
+class DeploymentSpanDetails(BaseModel):
+    stage: str = Field(examples=['compose_up'])
+    started_at: datetime = Field(examples=["1999-12-31T23:59:59.000Z"])
+    duration: float = Field(examples=[4.2])
+    exit_code: int | None = Field(None, examples=[0])
+    bytes: int | None = Field(None, examples=[1024])
+
+
+class DeploymentDetails(BaseModel):
+    id: uuid.UUID = Field()
+    status: str = Field(examples=['success'])
+    commit: str | None = Field(None, examples=['3f2a9c1e8b7d6a5f4e3d2c1b0a9f8e7d6c5b4a39'])
+    duration: float | None = Field(None, examples=[42.0])
+    created_at: datetime = Field(examples=["1999-12-31T23:59:59.000Z"])
+    finished_at: datetime | None = Field(None, examples=["2000-01-01T00:00:00.000Z"])
+    agent: str | None = Field(None, examples=['agent-name'])
+    spans: list[DeploymentSpanDetails] = Field([])
+
+
+class DeploymentOutputDetails(DeploymentDetails):
+    output: str | None = Field(None, examples=['Container example-1 Started'])
+
+
+class StageStats(BaseModel):
+    stage: str = Field(examples=['compose_up'])
+    count: int = Field(examples=[10])
+    mean: float = Field(examples=[4.2])
+    p50: float = Field(examples=[4.0])
+    p90: float = Field(examples=[6.0])
+    p99: float = Field(examples=[9.0])
+    max: float = Field(examples=[9.5])
+
+
+class DeploymentStats(BaseModel):
+    deployments: int = Field(examples=[10])
+    stages: list[StageStats] = Field([])
+
+
+# Agent
+class AgentCreate(BaseModel):
+    name: str = Field(min_length=1, max_length=256, pattern=NAME_PATTERN, examples=['agent-name'])
+    labels: Optional[str] = Field(None, pattern=r"^[\w-]+(,[\w-]+)*$", examples=['eu,gpu'])
+
+
+class AgentDetails(AgentCreate, DateBase):
+    last_seen: datetime | None = Field(None, examples=["2000-01-01T00:00:00.000Z"])
+
+
+class AgentCreatedDetails(AgentDetails):
+    token: str = Field()
+
+
+class AgentJob(BaseModel):
+    """deployment handed to an agent, secrets are decrypted"""
+    deployment: uuid.UUID = Field()
+    project: str = Field(examples=NAME_EXAMPLES)
+    remote: str = Field(examples=REPO_EXAMPLES)
+    branch: str = Field(examples=['main'])
+    auth_type: str | None = Field(None, examples=AUTH_TYPES)
+    auth_key: str | None = Field(None)
+    variables: dict[str, str] = Field({})
+    previous_services: dict | None = Field(None)
+    previous_builds: dict | None = Field(None)
+
+
+class AgentResult(BaseModel):
+    status: str = Field(pattern=r"^(success|failed)$", examples=['success'])
+    commit: str | None = Field(None)
+    duration: float | None = Field(None, examples=[42.0])
+    output: str = Field('')
+    services: dict | None = Field(None)
+    images: dict | None = Field(None)
+    builds: dict | None = Field(None)
+    spans: list[DeploymentSpanDetails] = Field([])
+
+
+# Profiling
+class ProfileCreate(BaseModel):
+    path: str = Field(pattern=r"^/", examples=['/export/traefik.json'])
+    method: str = Field('*', pattern=r"^(\*|GET|POST|PUT|PATCH|DELETE)$", examples=['GET'])
+    count: int = Field(1, ge=1, le=100, examples=[10])
+
+
+class ProfileDetails(BaseModel):
+    id: uuid.UUID = Field()
+    method: str = Field(examples=['GET'])
+    path: str = Field(examples=['/export/traefik.json'])
+    profiler: str = Field(examples=['pyinstrument'])
+    duration: float = Field(examples=[0.42])
+    created_at: datetime = Field(examples=["1999-12-31T23:59:59.000Z"])
+
+
+class ProfileStatus(BaseModel):
+    armed: list[ProfileCreate] = Field([])
+    profiles: list[ProfileDetails] = Field([])
+
+
+# Repository Cache
+class CacheEntryDetails(BaseModel):
+    name: str = Field(examples=['example-project'])
+    bytes: int = Field(examples=[52428800])
+    last_used: datetime = Field(examples=["1999-12-31T23:59:59.000Z"])
+    projects: list[str] = Field([], examples=[['example-project']])
+    mirror: str | None = Field(None, examples=['3f1c...e2.git'])
+
+
+class CacheDetails(BaseModel):
+    budget: int = Field(examples=[0])
+    total: int = Field(examples=[104857600])
+    clones: list[CacheEntryDetails] = Field([])
+    mirrors: list[CacheEntryDetails] = Field([])
+
+
+class ImageDetails(BaseModel):
+    id: str = Field(examples=['sha256:4f1c...'])
+    tags: list[str] = Field([], examples=[['nginx:latest']])
+    bytes: int = Field(examples=[192937984])
+    created_at: datetime = Field(examples=["1999-12-31T23:59:59.000Z"])
+    last_used: datetime | None = Field(None, examples=["1999-12-31T23:59:59.000Z"])
+    projects: list[str] = Field([], examples=[['example-project']])
+    kept: bool = Field(examples=[True])
+
+
+class ImageReportDetails(BaseModel):
+    started_at: datetime = Field(examples=["1999-12-31T23:59:59.000Z"])
+    duration: float = Field(examples=[4.2])
+    kept: int = Field(examples=[6])
+    removed: list[str] = Field([], examples=[['sha256:4f1c...']])
+    failed: int = Field(examples=[0])
+    reclaimed: int = Field(examples=[192937984])
+
+
+class ImageUsage(BaseModel):
+    budget: int = Field(examples=[0])
+    total: int = Field(examples=[1073741824])
+    collectable: int = Field(examples=[192937984])
+    images: list[ImageDetails] = Field([])
+    last_run: ImageReportDetails | None = Field(None)
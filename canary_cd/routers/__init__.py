@@ -1,4 +1,4 @@
-from canary_cd.routers import config, auth, project, secret, page, redirect, deploy, webhook, export
+from canary_cd.routers import config, auth, project, secret, page, redirect, deploy, webhook, export, agent, profile, upload, cache, keys
 
 routers = [
     config.router,
@@ -9,5 +9,11 @@ routers = [
     redirect.router,
     deploy.router,
     webhook.router,
+    upload.router,
+    upload.webhook_router,
     export.router,
+    agent.router,
+    profile.router,
+    cache.router,
+    keys.router,
 ]
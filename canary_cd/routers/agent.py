@@ -0,0 +1,87 @@
+from fastapi import APIRouter, status, Query, Request, Response
+
+from canary_cd.dependencies import *
+from canary_cd.utils.agents import claim_job, job_log, finish_job
+
+router = APIRouter(prefix='/agent',
+                   tags=['Agent'],
+                   responses={404: {"description": "Not found"}},
+                   )
+
+AgentAuth = Annotated[Agent, Depends(validate_agent)]
+
+
+# list agents
+@router.get('', summary='List Agents', dependencies=[Depends(validate_admin)])
+async def agent_list(db: Database,
+                     offset: int = 0,
+                     limit: Annotated[int, Query(le=100)] = 100,
+                     ) -> list[AgentDetails]:
+    return db.exec(select(Agent).order_by(Agent.name).offset(offset).limit(limit)).all()
+
+
+# register agent
+@router.post('', status_code=status.HTTP_201_CREATED, summary='Register an Agent',
+             dependencies=[Depends(validate_admin)])
+async def agent_create(data: AgentCreate, db: Database) -> AgentCreatedDetails:
+    if db.exec(select(Agent).where(Agent.name == data.name)).first():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Agent already exists')
+
+    agent_db = Agent.model_validate(data)
+    token = random_string(64)
+    agent_db.token = ch.hash(token)
+    db.add(agent_db)
+    db.commit()
+    db.refresh(agent_db)
+
+    return AgentCreatedDetails(**agent_db.model_dump(exclude={'token'}), token=token)
+
+
+# delete agent
+@router.delete('/{name}', summary='Delete an Agent', dependencies=[Depends(validate_admin)])
+async def agent_delete(name: str, db: Database) -> {}:
+    agent_db = db.exec(select(Agent).where(Agent.name == name)).first()
+    if not agent_db:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Agent not found')
+
+    db.delete(agent_db)
+    db.commit()
+    return {"detail": f"{name} deleted"}
+
+
+# refresh agent token
+@router.get('/{name}/refresh-token', summary='Refresh Agent Token', dependencies=[Depends(validate_admin)])
+async def agent_refresh_token(name: str, db: Database) -> {}:
+    agent_db = db.exec(select(Agent).where(Agent.name == name)).first()
+    if not agent_db:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Agent not found')
+
+    token = random_string(64)
+    agent_db.token = ch.hash(token)
+    db.commit()
+
+    return {"token": token}
+
+
+# agents pull jobs
+@router.post('/jobs/claim', summary='Claim a Deployment', responses={204: {"description": "No job"}})
+async def agent_job_claim(agent: AgentAuth, db: Database) -> AgentJob:
+    job = claim_job(db, agent)
+    if job is None:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    return job
+
+
+@router.post('/jobs/{deployment_id}/log', summary='Stream Deployment Output')
+async def agent_job_log(deployment_id: uuid.UUID, request: Request, agent: AgentAuth, db: Database) -> {}:
+    text = (await request.body()).decode('utf-8', errors='replace')
+    if not job_log(db, agent, deployment_id, text):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Deployment is not claimed by this agent')
+    return {"detail": "ok"}
+
+
+@router.post('/jobs/{deployment_id}/result', summary='Report a Deployment Result')
+async def agent_job_result(deployment_id: uuid.UUID, result: AgentResult, agent: AgentAuth, db: Database) -> {}:
+    if not finish_job(db, agent, deployment_id, result):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Deployment is not claimed by this agent')
+    return {"detail": f"deployment {result.status}"}
@@ -60,7 +60,7 @@ async def auth_create(data: AuthCreate, db: Database) -> AuthDetails:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='No key provided')
 
     db_key = Auth(name=data.name, auth_type=data.auth_type, public_key=public_key)
-    db_key.nonce, db_key.ciphertext = ch.encrypt(data.auth_key)
+    ch.encrypt_record(db_key, data.auth_key)
     db.add(db_key)
     db.commit()
     db.refresh(db_key)
@@ -0,0 +1,70 @@
+from fastapi import APIRouter, status, BackgroundTasks
+
+from canary_cd.dependencies import *
+from canary_cd.utils import images
+from canary_cd.utils.cache import CacheEntry, cache_usage, cache_run
+from canary_cd.utils.images import local_images, deployed_images, collectable, image_gc
+from canary_cd.utils.lease import lease
+
+router = APIRouter(prefix='/cache',
+                   tags=['Repository Cache'],
+                   dependencies=[Depends(validate_admin)],
+                   responses={404: {"description": "Not found"}},
+                   )
+
+
+def entry_details(entry: CacheEntry) -> CacheEntryDetails:
+    return CacheEntryDetails(name=entry.path.name, bytes=entry.bytes, last_used=entry.last_used,
+                             projects=list(entry.projects), mirror=entry.mirror.name if entry.mirror else None)
+
+
+async def cache_maintenance():
+    async with lease('cache') as owned:
+        if owned:
+            await cache_run()
+
+
+async def image_collection():
+    async with lease('image-gc') as owned:
+        if owned:
+            await image_gc()
+
+
+# disk usage of clones and mirrors
+@router.get('', summary='Repository Cache Usage')
+async def cache_get(db: Database) -> CacheDetails:
+    clones, mirrors = await cache_usage(db)
+    return CacheDetails(budget=CACHE_BUDGET,
+                        total=sum(entry.bytes for entry in clones + mirrors),
+                        clones=[entry_details(entry) for entry in clones],
+                        mirrors=[entry_details(entry) for entry in mirrors])
+
+
+# maintain mirrors and evict now
+@router.post('/maintenance', status_code=status.HTTP_202_ACCEPTED, summary='Run Repository Cache Maintenance')
+async def cache_maintenance_run(background_tasks: BackgroundTasks) -> {}:
+    background_tasks.add_task(cache_maintenance)
+    return {"detail": "cache maintenance started"}
+
+
+# docker images and the ones the deploy history still needs
+@router.get('/images', summary='Docker Image Usage')
+async def cache_images(db: Database) -> ImageUsage:
+    local = await local_images()
+    if local is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Docker is not available')
+    deployed_images(db, local, IMAGE_KEEP)
+    report = images.last_report
+    return ImageUsage(budget=IMAGE_BUDGET,
+                      total=sum(image.bytes for image in local.values()),
+                      collectable=sum(image.bytes for image in collectable(local, IMAGE_BUDGET)),
+                      images=[ImageDetails(**{**vars(image), 'projects': sorted(image.projects)})
+                              for image in sorted(local.values(), key=lambda image: image.created_at)],
+                      last_run=ImageReportDetails(**vars(report)) if report else None)
+
+
+# remove images the deploy history no longer needs now
+@router.post('/images', status_code=status.HTTP_202_ACCEPTED, summary='Run Docker Image Garbage Collection')
+async def cache_images_collect(background_tasks: BackgroundTasks) -> {}:
+    background_tasks.add_task(image_collection)
+    return {"detail": "image garbage collection started"}
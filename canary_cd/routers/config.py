@@ -1,7 +1,7 @@
-from fastapi import APIRouter, Response, status, BackgroundTasks
+from fastapi import APIRouter, Response, status
 from fastapi.responses import JSONResponse
 
-from canary_cd.utils.notify import discord_webhook
+from canary_cd.utils.notify import notify, CHANNELS
 from canary_cd.dependencies import *
 from canary_cd.models import ConfigUpdate
 from canary_cd.utils.pattern import CONFIG_KEYS
@@ -22,16 +22,12 @@ async def list_config(db: Database) -> list[ConfigUpdate]:
 
 # set config
 @router.put('', summary='Update Configuration')
-async def config_set(data: ConfigUpdate, db: Database, background_task: BackgroundTasks) -> ConfigUpdate:
+async def config_set(data: ConfigUpdate, db: Database) -> ConfigUpdate:
     if data.key not in CONFIG_KEYS:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Invalid Config key')
 
     if data.key == 'ROOT_KEY':
-        data.value = CryptoHelper(SALT).hash(data.value)
-
-    if data.key == 'DISCORD_WEBHOOK':
-        message = f"### :information_source: Notification Setup Successful"
-        background_task.add_task(discord_webhook, data.value, message)
+        data.value = ch.hash(data.value)
 
     q = select(Config).where(Config.key == data.key)
     config = db.exec(q).first()
@@ -44,6 +40,10 @@ async def config_set(data: ConfigUpdate, db: Database, background_task: Backgrou
     db.commit()
     db.refresh(config)
 
+    for channel, (key, _limit) in CHANNELS.items():
+        if data.key == key:
+            notify(db, "### :information_source: Notification Setup Successful", channels=[channel])
+
     return config
 
 
@@ -1,10 +1,15 @@
 import tempfile
 
 from fastapi import APIRouter, status, BackgroundTasks, Query, Path
+from fastapi.responses import StreamingResponse
+from sqlmodel import col
 from starlette.requests import Request
 
 from canary_cd.dependencies import *
+from canary_cd.utils.canary import slot_projects
 from canary_cd.utils.tasks import deploy_init, extract_page, deploy_stop, deploy_status
+from canary_cd.utils.stream import deployment_events, decompress
+from canary_cd.utils.trace import stage_stats
 
 router = APIRouter(tags=['Deployment'],
                    dependencies=[Depends(validate_admin)],
@@ -19,9 +24,14 @@ async def project_deploy(name: str, db: Database, background_tasks: BackgroundTa
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
 
-    background_tasks.add_task(deploy_init, db, project.id)
+    deployment = Deployment(project_id=project.id)
+    db.add(deployment)
+    db.commit()
+    db.refresh(deployment)
 
-    return {"detail": f"deployment started for {name}"}
+    background_tasks.add_task(deploy_init, db, project.id, deployment.id)
+
+    return {"detail": f"deployment started for {name}", "deployment": str(deployment.id)}
 
 
 # stop deploy project
@@ -31,7 +41,7 @@ async def project_deploy_stop(name: str, db: Database, background_tasks: Backgro
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
 
-    background_tasks.add_task(deploy_stop, REPO_CACHE / project.name)
+    background_tasks.add_task(deploy_stop, REPO_CACHE / project.name, slot_projects(project.canary, project.name))
 
     return {"detail": f"stopping deployment for {name}"}
 
@@ -43,13 +53,73 @@ async def project_status(name: str, db: Database) -> {}:
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
 
-    result = await deploy_status(REPO_CACHE / project.name, project.branch)
+    result = await deploy_status(REPO_CACHE / project.name, project.branch, slot_projects(project.canary, project.name))
 
     if not result:
         result = {'detail': 'not running'}
     return result
 
 
+# list deployment traces of a project
+@router.get('/deploy/{name}/traces', summary='Deployment Traces of a Project')
+async def project_traces(name: str,
+                         db: Database,
+                         offset: int = 0,
+                         limit: Annotated[int, Query(le=100)] = 10,
+                         ) -> list[DeploymentDetails]:
+    project = db.exec(select(Project).where(Project.name == name)).first()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
+
+    return db.exec(select(Deployment)
+                   .where(Deployment.project_id == project.id)
+                   .order_by(desc(Deployment.created_at))
+                   .offset(offset)
+                   .limit(limit)
+                   ).all()
+
+
+# deployment stage statistics of a project
+@router.get('/deploy/{name}/stats', summary='Deployment Stage Statistics of a Project')
+async def project_stats(name: str,
+                        db: Database,
+                        limit: Annotated[int, Query(le=1000)] = 100,
+                        ) -> DeploymentStats:
+    project = db.exec(select(Project).where(Project.name == name)).first()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
+
+    deployment_ids = db.exec(select(Deployment.id)
+                             .where(Deployment.project_id == project.id)
+                             .order_by(desc(Deployment.created_at))
+                             .limit(limit)
+                             ).all()
+    spans = db.exec(select(DeploymentSpan).where(col(DeploymentSpan.deployment_id).in_(deployment_ids))).all()
+
+    return DeploymentStats(deployments=len(deployment_ids), stages=stage_stats(spans))
+
+
+# get deployment details including output
+@router.get('/deployment/{deployment_id}', summary='Deployment Details')
+async def deployment_get(deployment_id: uuid.UUID, db: Database) -> DeploymentOutputDetails:
+    deployment = db.get(Deployment, deployment_id)
+    if not deployment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Deployment not found')
+
+    details = DeploymentDetails.model_validate(deployment, from_attributes=True)
+    return DeploymentOutputDetails(**details.model_dump(), output=decompress(deployment.output))
+
+
+# stream deployment output
+@router.get('/deployment/{deployment_id}/stream', summary='Stream Deployment Output')
+async def deployment_stream(deployment_id: uuid.UUID, db: Database) -> StreamingResponse:
+    deployment = db.get(Deployment, deployment_id)
+    if not deployment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Deployment not found')
+
+    return StreamingResponse(deployment_events(deployment), media_type='text/event-stream')
+
+
 @router.post("/upload/{page}", summary="Upload Page Payload")
 async def page_deploy_stream(page: str, request: Request, background_tasks: BackgroundTasks):
     job_id = uuid.uuid4()
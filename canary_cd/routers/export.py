@@ -5,9 +5,11 @@ from fastapi import APIRouter, Request, Response, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from sqlmodel import select
 
-from canary_cd.database import Database, Page, Redirect
-from canary_cd.settings import HTTPD
+from canary_cd.database import Database, Page, Redirect, Canary
+from canary_cd.settings import HTTPD, REDIRECT_ENGINE, REDIRECT_ENGINE_URL
+from canary_cd.utils.canary import add_canary
 from canary_cd.utils.httpd_conf import TraefikConfig
+from canary_cd.utils.proxy.base import redirect_host, is_pattern
 
 
 async def local_or_httpd_container(request: Request):
@@ -38,7 +40,18 @@ async def traefik_config(db: Database) -> Response:
         tc.add_page(page.fqdn, page.cors_hosts, add_service=False)
 
     redirects = db.exec(select(Redirect)).all()
-    for redirect in redirects:
-        tc.add_redirect(redirect.source, redirect.destination)
+    if REDIRECT_ENGINE:
+        if redirects:
+            tc.add_redirect_engine(sorted({redirect_host(redirect.source) for redirect in redirects}),
+                                   REDIRECT_ENGINE_URL)
+    else:
+        for redirect in redirects:
+            if is_pattern(redirect.source):
+                continue
+            tc.add_redirect(redirect.source, redirect.destination)
+
+    canaries = db.exec(select(Canary)).all()
+    for canary in canaries:
+        add_canary(tc, canary, canary.project.name)
 
     return JSONResponse(tc.render())
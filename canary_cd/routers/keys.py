@@ -0,0 +1,45 @@
+from fastapi import APIRouter, status, BackgroundTasks
+
+from canary_cd.dependencies import *
+from canary_cd.utils.keys import add_key, remove_key, key_usage, rotation_running, reencryption_job
+
+router = APIRouter(prefix='/keys',
+                   tags=['Encryption Keys'],
+                   dependencies=[Depends(validate_admin)],
+                   responses={404: {"description": "Not found"}},
+                   )
+
+
+def key_status(db: Session) -> KeyStatus:
+    usage = key_usage(db)
+    return KeyStatus(active=ch.active_version,
+                     versions={version: usage.get(version, 0) for version in sorted(ch.keys())},
+                     legacy=usage.get(None, 0),
+                     running=rotation_running(db))
+
+
+# keys and the values encrypted with each
+@router.get('', summary='Encryption Key Status')
+async def key_get(db: Database) -> KeyStatus:
+    return key_status(db)
+
+
+# encrypt with a new key and re-encrypt all values in the background
+@router.post('', status_code=status.HTTP_201_CREATED, summary='Rotate Encryption Key')
+async def key_rotate(db: Database, background_tasks: BackgroundTasks) -> KeyStatus:
+    add_key()
+    background_tasks.add_task(reencryption_job)
+    return key_status(db)
+
+
+# remove a key no value is encrypted with anymore
+@router.delete('/{version}', summary='Retire Encryption Key')
+async def key_delete(version: int, db: Database) -> {}:
+    if version not in ch.keys():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Key not found')
+    if version in (0, ch.active_version):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Active key and SALT can not be retired')
+    if key_usage(db).get(version):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Key is still in use')
+    remove_key(version)
+    return {"detail": f"key {version} retired"}
@@ -1,7 +1,9 @@
 import shutil
 
 from sqlmodel import col
+from canary_cd.utils.proxy import proxy
 from canary_cd.utils.tasks import page_init
+from canary_cd.utils.uploads import remove_upload
 
 from fastapi import APIRouter, status, BackgroundTasks, Query
 
@@ -67,13 +69,14 @@ async def page_delete(fqdn: str, db: Database) -> {}:
     if not page:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Page not found')
 
+    for upload in db.exec(select(Upload).where(Upload.page_id == page.id)).all():
+        remove_upload(db, upload)
     db.delete(page)
     db.commit()
 
     # Cleanup static files and config
     shutil.rmtree(PAGES_CACHE / fqdn)
-    if HTTPD_CONFIG_DUMP and HTTPD == 'traefik':
-        os.remove(DYN_CONFIG_CACHE / f'{fqdn}.yml')
+    proxy.remove(fqdn)
 
     return {"detail": f"{fqdn} deleted"}
 
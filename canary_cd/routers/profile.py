@@ -0,0 +1,43 @@
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+from canary_cd.dependencies import *
+from canary_cd.utils.profiling import profiler
+
+router = APIRouter(prefix='/profile',
+                   tags=['Profiling'],
+                   dependencies=[Depends(validate_admin)],
+                   responses={404: {"description": "Not found"}},
+                   )
+
+
+# armed paths and captured profiles
+@router.get('', summary='List Profiles')
+async def profile_list() -> ProfileStatus:
+    return ProfileStatus(
+        armed=[ProfileCreate(path=path, method=method, count=count) for (method, path), count in profiler.armed.items()],
+        profiles=[ProfileDetails(**vars(profile)) for profile in reversed(profiler.profiles)],
+    )
+
+
+# profile the next requests to a path
+@router.post('', status_code=status.HTTP_201_CREATED, summary='Profile Requests')
+async def profile_create(data: ProfileCreate) -> ProfileCreate:
+    profiler.arm(data.path, data.count, data.method)
+    return data
+
+
+# stop profiling
+@router.delete('', summary='Stop Profiling')
+async def profile_delete() -> {}:
+    profiler.disarm()
+    return {"detail": "profiling stopped"}
+
+
+# profile output
+@router.get('/{profile_id}', summary='Get Profile Output', response_class=PlainTextResponse)
+async def profile_get(profile_id: uuid.UUID) -> PlainTextResponse:
+    profile = profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Profile not found')
+    return PlainTextResponse(profile.output)
@@ -4,6 +4,8 @@ from fastapi import APIRouter, status, Query
 
 from canary_cd.dependencies import *
 from canary_cd.utils.crypto import random_words
+from canary_cd.utils.proxy import proxy
+from canary_cd.utils.tasks import canary_init, shift_cancel
 
 router = APIRouter(prefix='/project',
                    tags=['Project'],
@@ -133,3 +135,58 @@ async def project_refresh_token(name: str, db: Database) -> {}:
 
     return {"token": token}
 
+
+
+# get canary rollout
+@router.get('/{name}/canary', summary='Get Canary Rollout')
+async def project_canary_get(name: str, db: Database) -> CanaryDetails:
+    project = db.exec(select(Project).where(Project.name == name)).first()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
+    if not project.canary:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Canary not configured')
+    return project.canary
+
+
+# configure canary rollout
+@router.put('/{name}/canary', summary='Configure Canary Rollout')
+async def project_canary_update(name: str, data: CanaryUpdate, db: Database) -> CanaryDetails:
+    project = db.exec(select(Project).where(Project.name == name)).first()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
+
+    if db.exec(select(Canary).where(Canary.fqdn == data.fqdn).where(Canary.project_id != project.id)).first():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Canary with this FQDN already exists')
+    if db.exec(select(Page).where(Page.fqdn == data.fqdn)).first():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Page with this FQDN already exists')
+    if db.exec(select(Redirect).where(Redirect.source == data.fqdn)).first():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Redirect with this FQDN already exists')
+
+    canary = project.canary or Canary(project_id=project.id)
+    previous_fqdn = canary.fqdn
+    canary.sqlmodel_update(data.model_dump(exclude={'steps'}))
+    canary.steps = ','.join(str(step) for step in data.steps)
+    db.add(canary)
+    db.commit()
+    db.refresh(canary)
+
+    canary_init(canary, project.name, previous_fqdn)
+    return canary
+
+
+# remove canary rollout
+@router.delete('/{name}/canary', summary='Remove Canary Rollout')
+async def project_canary_delete(name: str, db: Database) -> {}:
+    project = db.exec(select(Project).where(Project.name == name)).first()
+    if not project or not project.canary:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Canary not found')
+
+    shift_cancel(project.id)
+    fqdn = project.canary.fqdn
+    db.delete(project.canary)
+    db.commit()
+
+    # Cleanup config
+    proxy.remove(fqdn)
+
+    return {"detail": f"{name} canary removed"}
@@ -1,6 +1,10 @@
 from fastapi import APIRouter, status, BackgroundTasks, Query
 
 from canary_cd.dependencies import *
+from canary_cd.settings import REDIRECT_ENGINE
+from canary_cd.utils.proxy import proxy
+from canary_cd.utils.proxy.base import is_pattern
+from canary_cd.utils.redirects import redirect_map
 from canary_cd.utils.tasks import redirect_init
 
 router = APIRouter(prefix='/redirect',
@@ -25,6 +29,10 @@ async def redirect_create(redirect: RedirectCreate, db: Database, background_tas
     if db.exec(select(Redirect).where(Redirect.source == redirect.source)).first():
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Redirect already exists')
 
+    if is_pattern(redirect.source) and not REDIRECT_ENGINE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail='Wildcard and path redirects need the redirect engine')
+
     if db.exec(select(Page).where(Page.fqdn == redirect.source)).first():
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Page with this FQDN already exists')
 
@@ -38,7 +46,7 @@ async def redirect_create(redirect: RedirectCreate, db: Database, background_tas
     return db_redirect
 
 
-@router.put('/{fqdn}', status_code=status.HTTP_200_OK, summary="Update a Redirect")
+@router.put('/{fqdn:path}', status_code=status.HTTP_200_OK, summary="Update a Redirect")
 async def redirect_update(fqdn: str,
                           redirect: RedirectUpdate,
                           db: Database,
@@ -58,7 +66,7 @@ async def redirect_update(fqdn: str,
     return db_redirect
 
 
-@router.delete('/{fqdn}', status_code=status.HTTP_200_OK, summary="Delete a Redirect")
+@router.delete('/{fqdn:path}', status_code=status.HTTP_200_OK, summary="Delete a Redirect")
 async def redirect_delete(fqdn: str, db: Database):
     db_redirect = db.exec(select(Redirect).where(Redirect.source == fqdn)).first()
     if not db_redirect:
@@ -68,7 +76,7 @@ async def redirect_delete(fqdn: str, db: Database):
     db.commit()
 
     # Cleanup config
-    if HTTPD_CONFIG_DUMP and HTTPD == 'traefik':
-        os.remove(DYN_CONFIG_CACHE / f'{fqdn}.yml')
+    redirect_map.remove(fqdn)
+    proxy.remove(fqdn)
 
     return {"detail": f"{fqdn} deleted"}
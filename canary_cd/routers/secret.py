@@ -1,7 +1,11 @@
+import io
 import shutil
 from typing import Annotated
 
+from dotenv import dotenv_values
 from fastapi import APIRouter, status, BackgroundTasks, Depends, HTTPException, Query, UploadFile
+from pydantic import ValidationError
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm.sync import update
 
 from canary_cd.dependencies import *
@@ -32,7 +36,7 @@ async def secret_list(db: Database,
             id=v.id,
             # project_id=v.project_id,
             key=v.key,
-            value=ch.decrypt(v.nonce, v.ciphertext),
+            value=ch.decrypt_record(v),
             created_at=v.created_at,
             updated_at=v.updated_at,
         )
@@ -49,19 +53,77 @@ async def secret_set(project: str, data: VariableUpdate, db: Database) -> Variab
     if not db_project:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Project does not exists')
 
-    db_var = db.exec(select(Secret).where(Secret.key == data.key.upper())).first()
+    q = select(Secret).where(Secret.project_id == db_project.id).where(Secret.key == data.key.upper())
+    db_var = db.exec(q).first()
 
     if not db_var:
         data.key = data.key.upper()
         db_var = Secret(key=data.key.upper(), project_id=db_project.id)
 
-    db_var.nonce, db_var.ciphertext = ch.encrypt(data.value)
+    ch.encrypt_record(db_var, data.value)
     db.add(db_var)
     db.commit()
     db.refresh(db_var)
     return db_var
 
 
+def upsert_secrets(db: Database, project: Project, variables: dict[str, str | None]) -> VariableBatchDetails:
+    """validate and encrypt all variables, then insert or update them in a single transaction"""
+    secrets, errors = {}, []
+    for key, value in variables.items():
+        try:
+            secrets[key.upper()] = VariableUpdate(key=key.upper(), value=value)
+        except ValidationError:
+            errors.append(key)
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f'Invalid variables: {", ".join(errors)}')
+    if not secrets:
+        return VariableBatchDetails()
+
+    existing = set(db.exec(select(Secret.key)
+                           .where(Secret.project_id == project.id)
+                           .where(col(Secret.key).in_(secrets))).all())
+    timestamp = now()
+    rows = []
+    for key, data in secrets.items():
+        rows.append({'project_id': project.id, 'id': uuid.uuid4(), 'key': key, 'encrypted': ch.seal(data.value),
+                     'nonce': '', 'ciphertext': '', 'created_at': timestamp, 'updated_at': timestamp})
+    # the (project_id, key) unique constraint finds the secrets to update
+    for start in range(0, len(rows), 500):
+        statement = insert(Secret).values(rows[start:start + 500])
+        db.exec(statement.on_conflict_do_update(
+            index_elements=['project_id', 'key'],
+            set_={'encrypted': statement.excluded.encrypted,
+                  'nonce': statement.excluded.nonce,
+                  'ciphertext': statement.excluded.ciphertext,
+                  'updated_at': statement.excluded.updated_at}))
+    db.commit()
+    return VariableBatchDetails(created=sorted(set(secrets) - existing), updated=sorted(existing))
+
+
+# set many environment variables
+@router.put('/{project}/batch', summary='Update Secrets')
+async def secret_set_batch(project: str, data: VariableBatch, db: Database) -> VariableBatchDetails:
+    db_project = db.exec(select(Project).where(Project.name == project)).first()
+    if not db_project:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Project does not exists')
+    return upsert_secrets(db, db_project, data.variables)
+
+
+# import environment variables from a .env file
+@router.put('/{project}/env', summary='Import Secrets from .env')
+async def secret_import_env(project: str, file: UploadFile, db: Database) -> VariableBatchDetails:
+    db_project = db.exec(select(Project).where(Project.name == project)).first()
+    if not db_project:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Project does not exists')
+    try:
+        content = (await file.read()).decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='.env is not utf-8') from e
+    return upsert_secrets(db, db_project, dotenv_values(stream=io.StringIO(content), interpolate=False))
+
+
 # delete secret
 @router.delete('/{project}/{variable}', summary='Delete Secret')
 async def secret_delete(project: str, variable: str, db: Database) -> {}:
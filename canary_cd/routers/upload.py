@@ -0,0 +1,128 @@
+import asyncio
+
+from fastapi import APIRouter, status, BackgroundTasks, Header, Query, Request, Response
+
+from canary_cd.dependencies import *
+from canary_cd.utils.ratelimit import token_limiter, upload_limiter, webhook_ip_limit
+from canary_cd.utils.tasks import extract_page
+from canary_cd.utils.uploads import create_upload, remove_upload, write_chunk, add_chunk, discard_range
+from canary_cd.utils.uploads import received_ranges, received_offset, missing_ranges, parse_checksum
+from canary_cd.utils.uploads import file_sha256, claim_payload, payload_path, release_payload
+
+
+def page_by_fqdn(page: str, db: Database) -> Page:
+    page_db = db.exec(select(Page).where(Page.fqdn == page)).first()
+    if not page_db:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Page does not exists')
+    return page_db
+
+
+def page_by_token(token: str, db: Database) -> Page:
+    page_db = db.exec(select(Page).where(Page.token == ch.hash(token))).first()
+    if not page_db:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Page not found')
+    return page_db
+
+
+def upload_router(page_dependency, rate_limit: bool = False, **kwargs) -> APIRouter:
+    """resumable upload routes of the page resolved by ``page_dependency``"""
+    UploadPage = Annotated[Page, Depends(page_dependency)]
+
+    def page_limit(page: UploadPage):
+        upload_limiter.check(f'page:{page.id}')
+
+    dependencies = kwargs.pop('dependencies', [])
+    if rate_limit:
+        dependencies = [*dependencies, Depends(webhook_ip_limit), Depends(page_limit)]
+    upload_routes = APIRouter(tags=['Upload'], responses={404: {"description": "Not found"}},
+                              dependencies=dependencies, **kwargs)
+
+    def get_upload(upload_id: uuid.UUID, page: UploadPage, db: Database) -> Upload:
+        upload = db.get(Upload, upload_id)
+        if not upload or upload.page_id != page.id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Upload not found')
+        return upload
+
+    PageUpload = Annotated[Upload, Depends(get_upload)]
+
+    def details(db: Session, upload: Upload, response: Response) -> UploadDetails:
+        ranges = received_ranges(db, upload)
+        offset = received_offset(ranges)
+        response.headers['Upload-Offset'] = str(offset)
+        return UploadDetails(id=upload.id, size=upload.size, chunk_size=UPLOAD_CHUNK_SIZE, offset=offset,
+                             received=ranges, missing=missing_ranges(ranges, upload.size))
+
+    # start an upload
+    @upload_routes.post('/uploads', status_code=status.HTTP_201_CREATED, summary='Start a Resumable Upload')
+    async def upload_create(data: UploadCreate, page: UploadPage, db: Database, response: Response) -> UploadDetails:
+        if data.size > UPLOAD_MAX_SIZE:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f'Upload larger than {UPLOAD_MAX_SIZE} bytes')
+        if rate_limit:
+            token_limiter.check(f'page:{page.id}')
+        upload = create_upload(db, page, data.size, data.checksum)
+        logger.debug(f"Upload {upload.id}: {page.fqdn} {upload.size} bytes")
+        return details(db, upload, response)
+
+    # received and missing ranges, to resume an upload
+    @upload_routes.get('/uploads/{upload_id}', summary='Upload Status')
+    async def upload_get(upload: PageUpload, db: Database, response: Response) -> UploadDetails:
+        return details(db, upload, response)
+
+    # write a chunk
+    @upload_routes.put('/uploads/{upload_id}', summary='Upload a Chunk')
+    async def upload_chunk(upload: PageUpload,
+                           request: Request,
+                           db: Database,
+                           response: Response,
+                           offset: Annotated[int, Query(ge=0)] = 0,
+                           upload_checksum: Annotated[str | None, Header(examples=['sha256 <base64>'])] = None,
+                           ) -> UploadDetails:
+        if offset >= upload.size:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Offset beyond the upload size')
+        try:
+            expected = parse_checksum(upload_checksum)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+
+        written, digest = await write_chunk(upload, offset, request.stream())
+        if expected is not None and digest != expected:
+            discard_range(db, upload, offset, written)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Checksum mismatch')
+        if written:
+            add_chunk(db, upload, offset, written)
+        return details(db, upload, response)
+
+    # extract a complete upload
+    @upload_routes.post('/uploads/{upload_id}/finish', summary='Finish an Upload')
+    async def upload_finish(upload: PageUpload,
+                            page: UploadPage,
+                            db: Database,
+                            background_tasks: BackgroundTasks) -> {}:
+        missing = missing_ranges(received_ranges(db, upload), upload.size)
+        if missing:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'Upload incomplete, missing {missing}')
+        temp_dir = claim_payload(upload)
+        if temp_dir is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Upload is already finished')
+        if upload.checksum and await asyncio.to_thread(file_sha256, payload_path(temp_dir)) != upload.checksum:
+            release_payload(upload, temp_dir)
+            discard_range(db, upload, 0, upload.size)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Checksum mismatch')
+
+        job_id = upload.id
+        remove_upload(db, upload)
+        background_tasks.add_task(extract_page, page.fqdn, temp_dir, job_id)
+        return {"detail": f"{page.fqdn} uploaded"}
+
+    # cancel an upload
+    @upload_routes.delete('/uploads/{upload_id}', summary='Cancel an Upload')
+    async def upload_delete(upload: PageUpload, db: Database) -> {}:
+        remove_upload(db, upload)
+        return {"detail": "upload removed"}
+
+    return upload_routes
+
+
+router = upload_router(page_by_fqdn, prefix='/upload/{page}', dependencies=[Depends(validate_admin)])
+webhook_router = upload_router(page_by_token, rate_limit=True, prefix='/webhook/page/{token}')
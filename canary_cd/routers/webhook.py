@@ -1,13 +1,16 @@
 import tempfile
 
 from fastapi import APIRouter, status, BackgroundTasks, Path, Response, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from canary_cd.dependencies import *
 from canary_cd.utils.tasks import deploy_init, extract_page
+from canary_cd.utils.stream import deployment_events
+from canary_cd.utils.ratelimit import webhook_ip_limit, token_limiter, admit_deployment
 
 router = APIRouter(prefix='/webhook',
                    tags=['Webhooks'],
+                   dependencies=[Depends(webhook_ip_limit)],
                    responses={404: {"description": "Not found"}},
                    )
 
@@ -21,10 +24,34 @@ async def token_deploy_project(token: str,
     project = db.exec(select(Project).where(Project.token == ch.hash(token))).first()
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
+    token_limiter.check(f'project:{project.id}')
+    admit_deployment(db)
 
-    background_tasks.add_task(deploy_init, db, project.id)
+    deployment = Deployment(project_id=project.id)
+    db.add(deployment)
+    db.commit()
+    db.refresh(deployment)
 
-    return JSONResponse({"detail": f"deployment started {project.name}"})
+    background_tasks.add_task(deploy_init, db, project.id, deployment.id)
+
+    return JSONResponse({"detail": f"deployment started {project.name}", "deployment": str(deployment.id)})
+
+
+# stream project deployment
+@router.get('/project/{token}/deployment/{deployment_id}/stream', summary='Stream Deployment Output')
+async def token_deployment_stream(token: str,
+                                  deployment_id: uuid.UUID,
+                                  db: Annotated[Session, Depends(get_session)],
+                                  ) -> StreamingResponse:
+    project = db.exec(select(Project).where(Project.token == ch.hash(token))).first()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Project not found')
+
+    deployment = db.get(Deployment, deployment_id)
+    if not deployment or deployment.project_id != project.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Deployment not found')
+
+    return StreamingResponse(deployment_events(deployment), media_type='text/event-stream')
 
 
 # deploy page
@@ -37,6 +64,7 @@ async def token_deploy_page(token: str,
     page = db.exec(select(Page).where(Page.token == ch.hash(token))).first()
     if not page:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Page not found')
+    token_limiter.check(f'page:{page.id}')
 
     job_id = uuid.uuid4()
     logger.debug(f"Page {job_id}: uploading")
@@ -13,23 +13,143 @@ BASE_DIR = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATA_DIR = Path(os.getenv('DATA_DIR', BASE_DIR / 'data'))
 
 REPO_CACHE = Path(DATA_DIR / 'repositories')
+MIRROR_CACHE = Path(DATA_DIR / 'mirrors')
+BUILD_CACHE = Path(DATA_DIR / 'build-cache')
 PAGES_CACHE = Path(DATA_DIR / 'pages')
 DYN_CONFIG_CACHE = Path(DATA_DIR / 'dynamic')
+UPLOAD_CACHE = Path(DATA_DIR / 'uploads')
 
 STATIC_BACKEND_NAME = os.environ.get('STATIC_BACKEND_NAME', 'http://static-pages')
 
 SQLITE = 'sqlite:///{}/database.sqlite'.format(DATA_DIR.absolute())
 
-# generate salt
+# salt of hashes and encryption, generated by get_salt() on first use
 SALT = os.getenv("SALT", None)
-if SALT is None:
-    from canary_cd.utils.crypto import generate_salt
-    SALT = generate_salt()
-    with open('.env', 'w', encoding='utf-8') as env:
-        env.write(f'SALT={SALT}\n')
+# generated SALT, shared by all workers
+SALT_FILE = Path(os.getenv('SALT_FILE', DATA_DIR / 'salt'))
 
-HTTPD = os.getenv('HTTPD', 'traefik')
+
+def get_salt() -> str:
+    """SALT, if not set the one in SALT_FILE, generated by the first worker"""
+    global SALT  # pylint: disable=global-statement
+    if SALT is None:
+        from canary_cd.utils.crypto import generate_salt
+        from canary_cd.utils.lease import file_lock
+        # workers starting together wait for the first one and read its salt
+        with file_lock(SALT_FILE.with_name(f'{SALT_FILE.name}.lock')):
+            salt = SALT_FILE.read_text(encoding='utf-8').strip() if SALT_FILE.exists() else ''
+            if not salt:
+                salt = generate_salt()
+                fd = os.open(SALT_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    file.write(f'{salt}\n')
+                    file.flush()
+                    os.fsync(file.fileno())
+        SALT = salt
+        os.environ['SALT'] = SALT
+    return SALT
+
+
+# encryption keys added by key rotations, SALT is key version 0
+KEYRING = Path(os.getenv('KEYRING', DATA_DIR / 'keyring'))
+# values re-encrypted per transaction after a key rotation, and seconds between transactions
+KEY_ROTATION_BATCH = int(os.getenv('KEY_ROTATION_BATCH', 100))
+KEY_ROTATION_PAUSE = float(os.getenv('KEY_ROTATION_PAUSE', 0.05))
+
+
+# background fetch of project remotes, disabled with 0
+PREFETCH_INTERVAL = int(os.getenv('PREFETCH_INTERVAL', 0))
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', 4))
+PREFETCH_JITTER = float(os.getenv('PREFETCH_JITTER', 10))
+
+# seconds between repository cache maintenance runs, disabled with 0
+CACHE_INTERVAL = int(os.getenv('CACHE_INTERVAL', 3600))
+# bytes of clones and mirrors kept before idle ones are evicted, 0 for no limit
+CACHE_BUDGET = int(os.getenv('CACHE_BUDGET', 0))
+# days without a deployment after which a project's clone may be evicted
+CACHE_IDLE_DAYS = float(os.getenv('CACHE_IDLE_DAYS', 7))
+
+# seconds between docker image garbage collections, disabled with 0
+IMAGE_GC_INTERVAL = int(os.getenv('IMAGE_GC_INTERVAL', 3600))
+# latest deployments per project whose images are always kept
+IMAGE_KEEP = int(os.getenv('IMAGE_KEEP', 3))
+# bytes of older images kept, least recently deployed are removed first, 0 removes all of them
+IMAGE_BUDGET = int(os.getenv('IMAGE_BUDGET', 0))
+# seconds between two image removals, the docker daemon keeps serving deployments
+IMAGE_GC_PAUSE = float(os.getenv('IMAGE_GC_PAUSE', 1))
+
+# characters of deployment output kept while streaming and in the history
+DEPLOY_LOG_LIMIT = int(os.getenv('DEPLOY_LOG_LIMIT', 1024 * 1024))
+# seconds between stored snapshots of a running deployment's output, followed by clients of other workers
+DEPLOY_LOG_FLUSH = float(os.getenv('DEPLOY_LOG_FLUSH', 1))
+
+# seconds a worker owns a task without renewing it, e.g. the deployments of a project
+LEASE_TTL = float(os.getenv('LEASE_TTL', 30))
+# seconds between checks for queued deployments no worker runs
+DEPLOY_POLL = float(os.getenv('DEPLOY_POLL', 5))
+
+# resumable page uploads: suggested chunk size and largest payload in bytes, hours an unfinished upload is kept
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 10 * 1024 ** 3))
+UPLOAD_EXPIRY = float(os.getenv('UPLOAD_EXPIRY', 24))
+
+# webhook requests per second and burst per token and per client ip, 0 disables
+WEBHOOK_RATE = float(os.getenv('WEBHOOK_RATE', 0.2))
+WEBHOOK_BURST = int(os.getenv('WEBHOOK_BURST', 5))
+WEBHOOK_IP_RATE = float(os.getenv('WEBHOOK_IP_RATE', 2))
+WEBHOOK_IP_BURST = int(os.getenv('WEBHOOK_IP_BURST', 20))
+# proxies trusted to set the client ip with X-Forwarded-For, the per client ip limit relies on it
+FORWARDED_ALLOW_IPS = os.getenv('FORWARDED_ALLOW_IPS', '*')
+# resumable upload requests per second and burst per page token, an upload sends a request per chunk
+WEBHOOK_UPLOAD_RATE = float(os.getenv('WEBHOOK_UPLOAD_RATE', 10))
+WEBHOOK_UPLOAD_BURST = int(os.getenv('WEBHOOK_UPLOAD_BURST', 50))
+# deployments queued or running on all projects before deploy webhooks are rejected, 0 disables
+DEPLOY_QUEUE_LIMIT = int(os.getenv('DEPLOY_QUEUE_LIMIT', 50))
+
+# remote agent: controller url and agent token, seconds between claims and between output posts
+AGENT_CONTROLLER = os.getenv('AGENT_CONTROLLER', 'http://canary-cd')
+AGENT_TOKEN = os.getenv('AGENT_TOKEN', '')
+AGENT_POLL = float(os.getenv('AGENT_POLL', 5))
+AGENT_LOG_INTERVAL = float(os.getenv('AGENT_LOG_INTERVAL', 1))
+AGENT_CONCURRENCY = int(os.getenv('AGENT_CONCURRENCY', 1))  # deployments an agent runs at the same time
+
+# notification outbox, seconds between retries and between posts per channel
+NOTIFY_INTERVAL = float(os.getenv('NOTIFY_INTERVAL', 2))
+NOTIFY_RATE = float(os.getenv('NOTIFY_RATE', 1))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 8))
+
+# images pulled at the same time before a deployment
+PULL_CONCURRENCY = int(os.getenv('PULL_CONCURRENCY', 4))
+
+# images built at the same time during a deployment
+BUILD_CONCURRENCY = int(os.getenv('BUILD_CONCURRENCY', 2))
+
+# seconds to wait for containers to become healthy after a deployment, 0 disables
+HEALTH_TIMEOUT = int(os.getenv('HEALTH_TIMEOUT', 120))
+HEALTH_INTERVAL = float(os.getenv('HEALTH_INTERVAL', 2))
+
+HTTPD = os.getenv('HTTPD', 'traefik')  # traefik, caddy, nginx
 HTTPD_CONFIG_DUMP = os.getenv('HTTPD_CONFIG_DUMP', False)
+# dynamic config files the hosts are spread over, and seconds to collect changes before writing
+HTTPD_CONFIG_SHARDS = int(os.getenv('HTTPD_CONFIG_SHARDS', 1))
+HTTPD_CONFIG_DEBOUNCE = float(os.getenv('HTTPD_CONFIG_DEBOUNCE', 0.5))
+HTTPD_CONFIG_REFRESH = int(os.getenv('HTTPD_CONFIG_REFRESH', 5))  # seconds, picks up changes of other workers
+# caddy admin API and the server the routes are added to
+CADDY_ADMIN = os.getenv('CADDY_ADMIN', 'http://caddy:2019')
+CADDY_SERVER = os.getenv('CADDY_SERVER', 'canary')
+# command reloading nginx after its map files changed
+NGINX_RELOAD = os.getenv('NGINX_RELOAD', 'nginx -s reload')
+
+# serve redirects from an in-memory host map behind a single proxy route
+REDIRECT_ENGINE = os.getenv('REDIRECT_ENGINE', False)
+REDIRECT_ENGINE_URL = os.getenv('REDIRECT_ENGINE_URL', 'http://canary-cd')  # how the proxy reaches canary-cd
+REDIRECT_REFRESH = int(os.getenv('REDIRECT_REFRESH', 5))  # seconds, picks up changes of other workers
+
+# request instrumentation: Server-Timing header, requests and queries logged above the thresholds in ms, 0 disables
+SERVER_TIMING = os.getenv('SERVER_TIMING', False)
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 0))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 0))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 20))  # captured request profiles kept per worker
 
 log_formatter = logging.Formatter("%(levelname)s: %(asctime)s %(name)s: %(message)s")
 loglevel = logging.getLevelName(os.environ.get('LOGLEVEL', 'DEBUG'))
@@ -0,0 +1,129 @@
+"""Remote Deploy Agents
+
+Projects pinned to an agent (``Project.agent``) or to a label of agents
+(``Project.agent_label``) are not deployed by the controller, agents on the
+Docker hosts pull their queued deployments instead:
+
+- a claim hands out the oldest queued deployment of a matching project and
+  the project's deploy lease, so a project is deployed by one agent at a time
+- output posted by the agent is stored with the deployment, followed by
+  clients of every worker, and renews the lease
+- the result is stored like a local deployment and releases the lease
+
+An agent that stops reporting loses the lease, its deployment is failed by
+the next owner like any interrupted deployment.
+"""
+import uuid
+
+from sqlmodel import Session, select, col, or_
+
+from canary_cd.database import Agent, Deployment, DeploymentSpan, Project, now
+from canary_cd.dependencies import ch
+from canary_cd.models import AgentJob, AgentResult
+from canary_cd.settings import logger, LEASE_TTL
+from canary_cd.utils.lease import acquire, renew, release
+from canary_cd.utils.notify import notify
+from canary_cd.utils.stream import append_output, compress
+from canary_cd.utils.tasks import fail_interrupted, previous_deployment
+
+
+def job_owner(agent: Agent, deployment_id: uuid.UUID) -> str:
+    return f'agent:{agent.name}:{deployment_id}'
+
+
+def agent_labels(agent: Agent) -> list[str]:
+    return [label for label in (agent.labels or '').split(',') if label]
+
+
+def claim_job(db: Session, agent: Agent) -> AgentJob | None:
+    """take the oldest queued deployment of a project pinned to the agent"""
+    agent.last_seen = now()
+    db.add(agent)
+    db.commit()
+
+    queued = db.exec(select(Deployment)
+                     .join(Project)
+                     .where(Deployment.status == 'queued')
+                     .where(or_(Project.agent == agent.name, col(Project.agent_label).in_(agent_labels(agent))))
+                     .order_by(Deployment.created_at)
+                     ).all()
+    tried = set()
+    for deployment in queued:
+        if deployment.project_id in tried:
+            continue
+        tried.add(deployment.project_id)
+        if not acquire(f'deploy:{deployment.project_id}', job_owner(agent, deployment.id)):
+            continue
+
+        fail_interrupted(db, deployment.project_id)
+        project = deployment.project
+        deployment.status = 'running'
+        deployment.agent = agent.name
+        db.add(deployment)
+        db.commit()
+        logger.info(f"[{project.name}] Deployment {deployment.id} claimed by agent {agent.name}")
+        notify(db, f"### :arrow_forward: [{project.name}] @{project.branch} Deployment started on {agent.name}")
+
+        auth_type, auth_key = None, None
+        if project.auth:
+            auth_type, auth_key = project.auth.auth_type, ch.decrypt_record(project.auth)
+        previous = previous_deployment(db, project.id)
+        return AgentJob(
+            deployment=deployment.id,
+            project=project.name,
+            remote=project.remote or '',
+            branch=project.branch or 'main',
+            auth_type=auth_type,
+            auth_key=auth_key,
+            variables={var.key: ch.decrypt_record(var) for var in project.secrets},
+            previous_services=previous.services if previous else None,
+            previous_builds=previous.builds if previous else None,
+        )
+    return None
+
+
+def _job(db: Session, agent: Agent, deployment_id: uuid.UUID) -> Deployment | None:
+    deployment = db.get(Deployment, deployment_id)
+    if deployment is None or deployment.agent != agent.name or deployment.status != 'running':
+        return None
+    return deployment
+
+
+def job_log(db: Session, agent: Agent, deployment_id: uuid.UUID, text: str) -> bool:
+    """
+    Append output of a job, also its heartbeat
+
+    :return: False if the job is not the agent's anymore, e.g. its lease expired
+    """
+    deployment = _job(db, agent, deployment_id)
+    if deployment is None or not renew(f'deploy:{deployment.project_id}', job_owner(agent, deployment_id), LEASE_TTL):
+        return False
+    return not text or append_output(db, deployment_id, text)
+
+
+def finish_job(db: Session, agent: Agent, deployment_id: uuid.UUID, result: AgentResult) -> bool:
+    """store the result of a job and release the project"""
+    deployment = _job(db, agent, deployment_id)
+    if deployment is None:
+        return False
+
+    deployment.status = result.status
+    deployment.commit = result.commit
+    deployment.duration = result.duration
+    deployment.output = compress(result.output)
+    deployment.services = result.services
+    deployment.images = result.images
+    deployment.builds = result.builds
+    deployment.finished_at = now()
+    deployment.spans = [DeploymentSpan(**span.model_dump()) for span in result.spans]
+    db.add(deployment)
+    db.commit()
+    release(f'deploy:{deployment.project_id}', job_owner(agent, deployment_id))
+
+    project = deployment.project
+    logger.info(f"[{project.name}] Deployment {deployment.status} on agent {agent.name}")
+    outcome = ':white_check_mark: Deployed' if result.status == 'success' else ':x: Deployment failed'
+    notify(db, f"### :information_source: {project.name}:{project.remote}@{project.branch} Status\n"
+               f"```{result.output[-1900:]}```\n"
+               f"### {outcome} {project.name}:{project.remote}@{project.branch} on {agent.name}")
+    return True
@@ -0,0 +1,168 @@
+"""Repository Cache
+
+Project clones in ``REPO_CACHE`` and the mirrors in ``MIRROR_CACHE`` they
+borrow their objects from. Every ``CACHE_INTERVAL`` seconds one worker:
+
+- runs ``git maintenance`` on the mirrors, off the deployment path
+- evicts clones of deleted projects, and above ``CACHE_BUDGET`` bytes the
+  clones of idle projects, least recently deployed first
+- evicts mirrors no clone borrows from anymore, of deleted projects right
+  away, of idle projects while above the budget
+
+A project is idle without a deployment for ``CACHE_IDLE_DAYS`` and with
+nothing queued or running. A clone is kept as long as docker knows a
+container created from it, running containers may need its files. Evicted
+clones and mirrors are fetched again by the next deployment.
+"""
+import asyncio
+import shlex
+import shutil
+import uuid
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import func
+from sqlmodel import Session, select, col
+
+from canary_cd.database import Deployment, Project, _engine, now
+from canary_cd.settings import logger, REPO_CACHE, MIRROR_CACHE, CACHE_INTERVAL, CACHE_BUDGET, CACHE_IDLE_DAYS
+from canary_cd.utils.lease import lease
+from canary_cd.utils.mirror import _locks, alternate_mirror, disk_usage, mirror_maintenance, mirror_path
+from canary_cd.utils.stream import RUNNING
+from canary_cd.utils.tasks import _run_cmd
+from canary_cd.utils.trace import trace_span
+
+
+@dataclass
+class CacheEntry:
+    path: Path
+    bytes: int
+    last_used: datetime
+    projects: dict[str, uuid.UUID] = field(default_factory=dict)  # name: id of the projects using it
+    mirror: Path | None = None  # mirror a clone borrows from
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _modified(path: Path) -> datetime:
+    return datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+
+
+async def cache_usage(db: Session) -> tuple[list[CacheEntry], list[CacheEntry]]:
+    """clones and mirrors with their size and the time they were last deployed"""
+    deployed = {project_id: _utc(created_at) for project_id, created_at in
+                db.exec(select(Deployment.project_id, func.max(Deployment.created_at))
+                        .group_by(Deployment.project_id)).all()}
+    projects = db.exec(select(Project)).all()
+
+    def last_used(path: Path, users: list[Project]) -> datetime:
+        return max([_modified(path)] + [deployed[project.id] for project in users if project.id in deployed])
+
+    clones = []
+    for path in sorted(REPO_CACHE.iterdir()) if REPO_CACHE.exists() else []:
+        if not path.is_dir():
+            continue
+        users = [project for project in projects if project.name == path.name]
+        clones.append(CacheEntry(path, await asyncio.to_thread(disk_usage, path), last_used(path, users),
+                                 {project.name: project.id for project in users}, alternate_mirror(path)))
+
+    mirrors = []
+    for path in sorted(MIRROR_CACHE.glob('*.git')) if MIRROR_CACHE.exists() else []:
+        users = [project for project in projects if project.remote and mirror_path(project.remote) == path]
+        mirrors.append(CacheEntry(path, await asyncio.to_thread(disk_usage, path), last_used(path, users),
+                                  {project.name: project.id for project in users}))
+    return clones, mirrors
+
+
+async def containers_exist(path: Path) -> bool:
+    """whether docker knows a container of a compose project in path, True if docker cannot tell"""
+    label = shlex.quote(f'label=com.docker.compose.project.working_dir={path}')
+    with trace_span(None, 'cache') as span:
+        stdout, _stderr = await _run_cmd(f'docker ps --all --quiet --filter {label}', span=span)
+    return span.exit_code != 0 or bool(stdout.strip())
+
+
+def _busy(db: Session) -> set[uuid.UUID]:
+    return set(db.exec(select(Deployment.project_id).where(col(Deployment.status).in_(RUNNING))).all())
+
+
+async def evict(db: Session, budget: int = CACHE_BUDGET, idle_days: float = CACHE_IDLE_DAYS) -> list[Path]:
+    """
+    Remove clones and mirrors of deleted and idle projects
+
+    :return: removed paths
+    """
+    clones, mirrors = await cache_usage(db)
+    total = sum(entry.bytes for entry in clones + mirrors)
+    busy = _busy(db)
+    idle_since = now() - timedelta(days=idle_days)
+    evicted = []
+
+    def over_budget() -> bool:
+        return bool(budget) and total > budget
+
+    async def remove(entry: CacheEntry, is_mirror: bool = False) -> bool:
+        nonlocal total
+        # deployments of its projects, and fetches into a mirror, wait for the removal
+        async with AsyncExitStack() as stack:
+            for project_id in entry.projects.values():
+                if not await stack.enter_async_context(lease(f'deploy:{project_id}')):
+                    return False
+            if is_mirror:
+                await stack.enter_async_context(_locks.setdefault(entry.path, asyncio.Lock()))
+            await asyncio.to_thread(shutil.rmtree, entry.path, ignore_errors=True)
+        logger.info(f"Evicted {entry.path.name} from the repository cache, {entry.bytes} bytes")
+        total -= entry.bytes
+        evicted.append(entry.path)
+        return True
+
+    def evictable(entry: CacheEntry) -> bool:
+        if not entry.projects:
+            return True
+        if not over_budget() or entry.last_used > idle_since:
+            return False
+        return not any(project_id in busy for project_id in entry.projects.values())
+
+    # deleted projects first, then least recently used
+    for clone in sorted(clones, key=lambda entry: (bool(entry.projects), entry.last_used)):
+        if evictable(clone) and not await containers_exist(clone.path):
+            await remove(clone)
+
+    borrowed = {clone.mirror for clone in clones if clone.path not in evicted}
+    for mirror in sorted(mirrors, key=lambda entry: (bool(entry.projects), entry.last_used)):
+        if mirror.path not in borrowed and evictable(mirror):
+            await remove(mirror, is_mirror=True)
+    return evicted
+
+
+async def cache_run() -> tuple[int, list[Path]]:
+    """
+    Maintain the mirrors and evict what the budget does not allow
+
+    :return: number of maintained mirrors, removed paths
+    """
+    maintained = 0
+    for path in sorted(MIRROR_CACHE.glob('*.git')) if MIRROR_CACHE.exists() else []:
+        maintained += await mirror_maintenance(path)
+    with Session(_engine) as db:
+        evicted = await evict(db)
+    return maintained, evicted
+
+
+async def cache_loop(interval: int = CACHE_INTERVAL):
+    """maintain the repository cache every interval, by a single worker"""
+    logger.info(f"Maintaining the repository cache every {interval}s")
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with lease('cache') as owned:
+                if not owned:
+                    continue
+                maintained, evicted = await cache_run()
+            logger.debug(f"Repository cache: {maintained} mirrors maintained, {len(evicted)} evicted")
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Repository cache maintenance failed: {e}")
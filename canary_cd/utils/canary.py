@@ -0,0 +1,81 @@
+"""Blue-Green / Canary Slots
+
+Every slot is a separate compose project, ``<name>-blue`` and
+``<name>-green``, running side by side while traffic shifts. A compose file
+can only be deployed into slots if:
+
+- no service publishes host ports, sets a ``container_name`` or mounts a
+  named volume, both slots would claim them
+- the routed service joins an external network the proxy is attached to,
+  the default network of a slot is not reachable by the proxy
+"""
+from canary_cd.database import Canary
+from canary_cd.utils.httpd_conf import TraefikConfig
+
+SLOTS = ('blue', 'green')
+
+
+def parse_steps(steps: str) -> list[int]:
+    """ascending candidate weights, always ending with 100"""
+    weights = sorted({min(max(int(step), 1), 100) for step in steps.split(',') if step.strip()})
+    if not weights or weights[-1] != 100:
+        weights.append(100)
+    return weights
+
+
+def idle_slot(canary: Canary) -> str:
+    """slot the next deployment is started in"""
+    return SLOTS[1] if canary.active == SLOTS[0] else SLOTS[0]
+
+
+def slot_project(name: str, slot: str) -> str:
+    """compose project name of a slot"""
+    return f'{name}-{slot}'.lower()
+
+
+def slot_projects(canary: Canary | None, name: str) -> list[str]:
+    """compose project names of the running slots, none without a canary"""
+    if canary is None:
+        return []
+    return [slot_project(name, slot) for slot in (canary.active, canary.candidate) if slot]
+
+
+def slot_conflicts(config: dict, service: str) -> list[str]:
+    """what keeps two slots of a resolved compose configuration from running side by side"""
+    services = config.get('services', {})
+    networks = config.get('networks', {})
+    conflicts = []
+    for name, definition in services.items():
+        if any(port.get('published') for port in definition.get('ports', [])):
+            conflicts.append(f'{name} publishes host ports')
+        if definition.get('container_name'):
+            conflicts.append(f'{name} sets a container_name')
+        if any(volume.get('type') == 'volume' and volume.get('source') for volume in definition.get('volumes', [])):
+            conflicts.append(f'{name} mounts a named volume')
+    if service not in services:
+        conflicts.append(f'{service} is not defined')
+    elif not any((networks.get(network) or {}).get('external') for network in services[service].get('networks') or {}):
+        conflicts.append(f'{service} is not attached to an external network')
+    return conflicts
+
+
+def slot_url(canary: Canary, name: str, slot: str) -> str:
+    """url of the first container of the routed service in a slot"""
+    return f'http://{slot_project(name, slot)}-{canary.service}-1:{canary.port}'
+
+
+def slot_weights(canary: Canary) -> dict[str, int]:
+    """traffic weight per running slot"""
+    if not canary.active:
+        return {}
+    if not canary.candidate:
+        return {canary.active: 100}
+    return {canary.active: 100 - canary.weight, canary.candidate: canary.weight}
+
+
+def add_canary(tc: TraefikConfig, canary: Canary, name: str):
+    """add the weighted routing of a canary to a traefik config"""
+    weights = slot_weights(canary)
+    if weights:
+        servers = {slot: (slot_url(canary, name, slot), weight) for slot, weight in weights.items()}
+        tc.add_weighted(canary.fqdn, name, servers)
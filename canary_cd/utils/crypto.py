@@ -1,12 +1,26 @@
-"""Crypto Helper Functions"""
+"""Crypto Helper Functions
+
+Auth keys and secrets are sealed into a single binary value: the 2 byte
+version of the key, the 12 byte nonce and the AES-GCM ciphertext, the version
+is authenticated as associated data. Key version 0 is the ``SALT``, later
+versions are read from the ``KEYRING`` file, the highest one encrypts. Values
+of earlier releases are base64 nonces and ciphertexts encrypted with the
+``SALT``, they are decrypted as before until they are re-encrypted.
+"""
 
 import hashlib
 import os
+import struct
+import tempfile
 from base64 import b64encode, b64decode
+from functools import cached_property
+from pathlib import Path
 from random import SystemRandom
 from string import punctuation, ascii_letters, digits
 
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+# key version in front of a sealed value
+KEY_HEADER = struct.Struct('>H')
+NONCE_SIZE = 12
 
 
 def random_string(length: int = 64, p: bool = False) -> str:
@@ -80,15 +94,85 @@ def random_words(length: int = 2, sep: str = '-') -> str:
 
 def generate_salt(key_size: int = 256):
     """generate a random salt."""
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
     return b64encode(AESGCM.generate_key(key_size)).decode('utf-8')
 
 
+def read_keyring(keyring: Path) -> dict[int, str]:
+    """base64 keys by version, ``<version>:<key>`` per line"""
+    try:
+        lines = keyring.read_text(encoding='utf-8').split()
+    except FileNotFoundError:
+        return {}
+    return {int(version): key for version, _, key in (line.partition(':') for line in lines)}
+
+
+def write_keyring(keyring: Path, keys: dict[int, str]):
+    """replace the keyring at once, readable by its owner only"""
+    keyring.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=keyring.parent, prefix=f'.{keyring.name}')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(''.join(f'{version}:{key}\n' for version, key in sorted(keys.items())))
+    os.replace(temp_path, keyring)
+
+
+def key_version(sealed: bytes) -> int:
+    return KEY_HEADER.unpack_from(sealed)[0]
+
+
 class CryptoHelper:
-    """CryptoHelper Class"""
-    def __init__(self, salt: str):
-        self.salt = b64decode(salt.encode('utf-8'))
+    """
+    CryptoHelper Class, without a salt the SALT and KEYRING settings are used, resolved on first use
+
+    The keyring is read again once it changed, a key added by another worker
+    encrypts from the next value on.
+    """
+    def __init__(self, salt: str | None = None, keyring: Path | None = None):
+        self._salt = salt
+        self._keyring = keyring
+        self._settings = salt is None
+        self._keyring_version = None
+        self._keys = {}
         self.associated_data = b"aad"
-        self.aesgcm = AESGCM(self.salt)
+
+    @cached_property
+    def salt(self) -> bytes:
+        if self._salt is None:
+            from canary_cd.settings import get_salt
+            self._salt = get_salt()
+        return b64decode(self._salt.encode('utf-8'))
+
+    @cached_property
+    def aesgcm(self):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        return AESGCM(self.salt)
+
+    @cached_property
+    def keyring(self) -> Path | None:
+        if self._keyring is None and self._settings:
+            from canary_cd.settings import KEYRING
+            self._keyring = KEYRING
+        return self._keyring
+
+    def keys(self) -> dict:
+        """AES-GCM keys by version"""
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        try:
+            # the keyring is replaced on every change, a new inode
+            stat = self.keyring.stat() if self.keyring else None
+            version = (stat.st_ino, stat.st_mtime_ns, stat.st_size) if stat else None
+        except FileNotFoundError:
+            version = None
+        if not self._keys or version != self._keyring_version:
+            keys = {0: self.aesgcm}
+            if version is not None:
+                keys.update({number: AESGCM(b64decode(key)) for number, key in read_keyring(self.keyring).items()})
+            self._keys, self._keyring_version = keys, version
+        return self._keys
+
+    @property
+    def active_version(self) -> int:
+        return max(self.keys())
 
     def hash(self, password: str) -> str:
         """generate hashed password"""
@@ -111,6 +195,35 @@ class CryptoHelper:
                                    b64decode(ciphertext),
                                    self.associated_data).decode('utf-8')
 
+    def seal(self, data: str) -> bytes:
+        """encrypt data with the active key, prefixed with its version and the nonce"""
+        keys = self.keys()
+        version = max(keys)
+        header = KEY_HEADER.pack(version)
+        nonce = os.urandom(NONCE_SIZE)
+        return header + nonce + keys[version].encrypt(nonce, data.encode('utf-8'), self.associated_data + header)
+
+    def unseal(self, sealed: bytes) -> str:
+        """decrypt a sealed value, raises KeyError if its key is not in the keyring"""
+        keys = self.keys()
+        version = key_version(sealed)
+        if version not in keys:
+            raise KeyError(f'Unknown key version {version}')
+        header, nonce = sealed[:KEY_HEADER.size], sealed[KEY_HEADER.size:KEY_HEADER.size + NONCE_SIZE]
+        return keys[version].decrypt(nonce, sealed[KEY_HEADER.size + NONCE_SIZE:],
+                                     self.associated_data + header).decode('utf-8')
+
+    def encrypt_record(self, record, data: str):
+        """seal the value of an Auth or Secret"""
+        record.encrypted = self.seal(data)
+        record.nonce = record.ciphertext = ''
+
+    def decrypt_record(self, record) -> str:
+        """value of an Auth or Secret, sealed or stored by an earlier release"""
+        if record.encrypted is not None:
+            return self.unseal(record.encrypted)
+        return self.decrypt(record.nonce, record.ciphertext)
+
 
 if __name__ == '__main__':
     print("random string ", random_string())
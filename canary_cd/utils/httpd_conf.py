@@ -73,6 +73,65 @@ class TraefikConfig:
             }
         }
 
+    def add_redirect_engine(self, hosts: list[str], url: str):
+        """
+        Route all redirect hosts to the redirect engine with a single router
+
+        :param hosts: redirect sources, certificates are requested for each
+        :param url: url of the redirect engine
+        """
+        self.routers['redirect-engine-router'] = {
+            'service': 'redirect-engine-service',
+            'rule': 'PathPrefix(`/`)',
+            'entryPoints': 'tls',
+            'tls': {
+                'certResolver': 'letsencrypt',
+                'domains': [{'main': host} for host in hosts],
+            },
+            'priority': 1,
+        }
+        self.services['redirect-engine-service'] = {
+            'loadBalancer': {
+                'passHostHeader': True,
+                'servers': [{
+                    'url': url,
+                }]
+            }
+        }
+
+    def add_weighted(self, fqdn: str, name: str, servers: dict[str, tuple[str, int]]):
+        """
+        Route a host to weighted services
+
+        :param fqdn: host
+        :param name: unique name of the weighted service
+        :param servers: slot: (url, weight)
+        """
+        self.routers[f'canary-router-{name}'] = {
+            'service': f'canary-service-{name}',
+            'rule': f'Host(`{fqdn}`)',
+            'entryPoints': 'tls',
+            'tls': {
+                'certResolver': 'letsencrypt'
+            }
+        }
+        self.services[f'canary-service-{name}'] = {
+            'weighted': {
+                'services': [
+                    {'name': f'canary-service-{name}-{slot}', 'weight': weight}
+                    for slot, (_url, weight) in servers.items()
+                ]
+            }
+        }
+        for slot, (url, _weight) in servers.items():
+            self.services[f'canary-service-{name}-{slot}'] = {
+                'loadBalancer': {
+                    'passHostHeader': True,
+                    'servers': [{
+                        'url': url,
+                    }]
+                }
+            }
 
     def render(self):
         config = {'http': {}}
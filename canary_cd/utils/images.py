@@ -0,0 +1,171 @@
+"""Docker Image Garbage Collection
+
+Every deployment records the ids of the images it ran. Images of the last
+``IMAGE_KEEP`` deployments and of the last successful deployment of every
+project are kept, they are what a rollback redeploys. Older images of the
+deploy history, tagged or left dangling by rebuilt and re-pulled tags, are
+removed least recently deployed first until they fit into ``IMAGE_BUDGET``
+bytes. Images not in the deploy history, dangling or not, are never removed,
+they may belong to anything else running on the host.
+
+A single worker collects every ``IMAGE_GC_INTERVAL`` seconds. Images are
+removed one at a time, ``IMAGE_GC_PAUSE`` seconds apart, and a run stops as
+soon as a deployment is queued. Images still used by a container are never
+forced out, docker refuses to remove them. Image sizes include layers shared
+with other images, the reclaimed space is an upper bound. The report of the
+last run is kept per worker.
+"""
+import asyncio
+import shlex
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+from sqlmodel import Session, select, col
+
+from canary_cd.database import Deployment, Project, _engine, now
+from canary_cd.settings import logger, IMAGE_GC_INTERVAL, IMAGE_KEEP, IMAGE_BUDGET, IMAGE_GC_PAUSE
+from canary_cd.utils.lease import lease
+from canary_cd.utils.ratelimit import deploy_backlog
+from canary_cd.utils.tasks import _run_cmd
+from canary_cd.utils.trace import trace_span
+
+
+@dataclass
+class Image:
+    id: str
+    bytes: int
+    created_at: datetime
+    tags: list[str] = field(default_factory=list)
+    projects: set[str] = field(default_factory=set)  # projects that deployed it
+    last_used: datetime | None = None  # last deployment using it
+    kept: bool = False
+
+
+@dataclass
+class ImageReport:
+    started_at: datetime
+    duration: float = 0
+    kept: int = 0
+    removed: list[str] = field(default_factory=list)
+    failed: int = 0
+    reclaimed: int = 0  # bytes
+
+
+last_report: ImageReport | None = None
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _created(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value[:19]).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return now()
+
+
+async def _docker(cmd: str) -> str | None:
+    with trace_span(None, 'image_gc') as span:
+        stdout, stderr = await _run_cmd(f'docker {cmd}', span=span)
+    if span.exit_code != 0:
+        logger.debug(f"docker {' '.join(cmd.split()[:2])} failed: {stderr.strip()}")
+        return None
+    return stdout
+
+
+async def local_images() -> dict[str, Image] | None:
+    """tagged and dangling images by id, None if docker is not available"""
+    stdout = await _docker("image ls --no-trunc --quiet")
+    if stdout is None:
+        return None
+    ids = sorted(set(stdout.split()))
+    if not ids:
+        return {}
+    stdout = await _docker("image inspect --format '{{.Id}} {{.Size}} {{.Created}} {{join .RepoTags \",\"}}' "
+                           + ' '.join(shlex.quote(image_id) for image_id in ids))
+    images = {}
+    for line in (stdout or '').splitlines():
+        image_id, size, created, *tags = line.strip().split(' ', 3)
+        images[image_id] = Image(image_id, int(size), _created(created), [tag for tag in ''.join(tags).split(',') if tag])
+    return images
+
+
+def deployed_images(db: Session, images: dict[str, Image], keep: int = IMAGE_KEEP):
+    """mark images of the last ``keep`` deployments per project, its last successful and running ones as kept"""
+    position = func.row_number().over(partition_by=Deployment.project_id,
+                                      order_by=col(Deployment.created_at).desc()).label('position')
+    # 1 for the last deployment of a project with its status
+    status_position = func.row_number().over(partition_by=[Deployment.project_id, Deployment.status],
+                                             order_by=col(Deployment.created_at).desc()).label('status_position')
+    history = (select(Deployment.images, Deployment.status, Deployment.created_at, Project.name, position,
+                      status_position)
+               .join(Project)
+               .where(col(Deployment.images).is_not(None)))
+    for deployed, status, created_at, project, number, status_number in db.exec(history).all():
+        for image_id in deployed.values():
+            image = images.get(image_id)
+            if image is None:
+                continue
+            image.projects.add(project)
+            image.last_used = max(image.last_used or _utc(created_at), _utc(created_at))
+            image.kept |= (number <= keep or status in ('queued', 'running')
+                           or (status == 'success' and status_number == 1))
+
+
+def collectable(images: dict[str, Image], budget: int = IMAGE_BUDGET) -> list[Image]:
+    """images of the deploy history to remove, least recently deployed first until the others fit into the budget"""
+    candidates = sorted([image for image in images.values() if not image.kept and image.projects],
+                        key=lambda image: image.last_used or image.created_at)
+    remaining = sum(image.bytes for image in candidates)
+    removals = []
+    for image in candidates:
+        if budget and remaining <= budget:
+            break
+        removals.append(image)
+        remaining -= image.bytes
+    return removals
+
+
+async def image_gc(keep: int = IMAGE_KEEP, budget: int = IMAGE_BUDGET, pause: float = IMAGE_GC_PAUSE) -> ImageReport:
+    """remove the images the deploy history no longer needs"""
+    global last_report  # pylint: disable=global-statement
+    report = ImageReport(started_at=now())
+    start = time.perf_counter()
+    images = await local_images()
+    with Session(_engine) as db:
+        if images:
+            deployed_images(db, images, keep)
+            report.kept = sum(image.kept for image in images.values())
+        for image in collectable(images or {}, budget):
+            # deployments may pull the same image again, they go first
+            if deploy_backlog(db):
+                logger.info("Image GC stopped, a deployment is queued")
+                break
+            if await _docker(f"image rm {' '.join(shlex.quote(tag) for tag in image.tags or [image.id])}") is None:
+                report.failed += 1
+            else:
+                report.removed.append(image.id)
+                report.reclaimed += image.bytes
+            await asyncio.sleep(pause)
+    report.duration = time.perf_counter() - start
+    if report.removed:
+        logger.info(f"Image GC removed {len(report.removed)} images, reclaimed {report.reclaimed} bytes")
+    last_report = report
+    return report
+
+
+async def image_gc_loop(interval: int = IMAGE_GC_INTERVAL):
+    """collect images every interval, by a single worker"""
+    logger.info(f"Collecting docker images every {interval}s")
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with lease('image-gc') as owned:
+                if not owned:
+                    continue
+                await image_gc()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Image GC failed: {e}")
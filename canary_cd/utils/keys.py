@@ -0,0 +1,140 @@
+"""Master Key Rotation
+
+A rotation adds a key to the ``KEYRING``, every worker encrypts with it from
+its next write on. The values sealed with an earlier key, or stored as base64
+by an earlier release, are re-encrypted in the background by a single
+worker:
+
+- ``KEY_ROTATION_BATCH`` values per transaction, ``KEY_ROTATION_PAUSE``
+  seconds apart, writers never wait for more than a single batch
+- a value is only replaced if it is unchanged since it was read, a writer
+  updating it meanwhile wins
+- passes repeat until no value is left on an earlier key
+
+Progress is the number of values per key version, read from the database by
+any worker. Keys no value uses anymore can be retired, the ``SALT`` (version
+0) stays, it is the salt of all hashes as well.
+"""
+import asyncio
+import uuid
+
+from sqlalchemy import and_, func, or_, update
+from sqlmodel import Session, select, col
+
+from canary_cd.database import Auth, Secret, Lease, _engine, now
+from canary_cd.dependencies import ch
+from canary_cd.settings import logger, KEYRING, KEY_ROTATION_BATCH, KEY_ROTATION_PAUSE
+from canary_cd.utils.crypto import KEY_HEADER, generate_salt, key_version, read_keyring, write_keyring
+from canary_cd.utils.lease import file_lock, lease
+
+ENCRYPTED = [Auth, Secret]
+
+
+def add_key() -> int:
+    """add a key to the keyring, returns its version"""
+    with file_lock(KEYRING.with_name(f'{KEYRING.name}.lock')):
+        keys = read_keyring(KEYRING)
+        version = max(keys, default=0) + 1
+        write_keyring(KEYRING, {**keys, version: generate_salt()})
+    logger.info(f"Added encryption key version {version}")
+    return version
+
+
+def remove_key(version: int):
+    with file_lock(KEYRING.with_name(f'{KEYRING.name}.lock')):
+        keys = read_keyring(KEYRING)
+        keys.pop(version, None)
+        write_keyring(KEYRING, keys)
+    logger.info(f"Retired encryption key version {version}")
+
+
+def key_usage(db: Session) -> dict[int | None, int]:
+    """values per key version, None for values of earlier releases"""
+    usage = {}
+    for model in ENCRYPTED:
+        for header, count in db.exec(select(func.substr(model.encrypted, 1, KEY_HEADER.size), func.count())
+                                     .group_by(func.substr(model.encrypted, 1, KEY_HEADER.size))).all():
+            version = key_version(header) if header is not None else None
+            usage[version] = usage.get(version, 0) + count
+    return usage
+
+
+def rotation_running(db: Session) -> bool:
+    running = db.get(Lease, 'key-rotation')
+    return running is not None and running.expires_at.replace(tzinfo=None) > now().replace(tzinfo=None)
+
+
+def _stale(model, version: int):
+    return or_(col(model.encrypted).is_(None),
+               func.substr(model.encrypted, 1, KEY_HEADER.size) != KEY_HEADER.pack(version))
+
+
+def _reencrypt_batch(model, after: uuid.UUID | None, batch_size: int) -> tuple[int, uuid.UUID | None]:
+    """
+    Re-encrypt a batch of values not sealed with the active key
+
+    :return: values re-encrypted, id to continue after or None at the end
+    """
+    reencrypted = 0
+    with Session(_engine) as db:
+        query = select(model.id, model.encrypted, model.nonce, model.ciphertext).where(_stale(model, ch.active_version))
+        if after is not None:
+            query = query.where(col(model.id) > after)
+        rows = db.exec(query.order_by(model.id).limit(batch_size)).all()
+        for row in rows:
+            unchanged = (model.encrypted == row.encrypted if row.encrypted is not None else
+                         and_(col(model.encrypted).is_(None), model.ciphertext == row.ciphertext))
+            result = db.exec(update(model)
+                             .where(model.id == row.id, unchanged)
+                             .values(encrypted=ch.seal(ch.decrypt_record(row)), nonce='', ciphertext='',
+                                     updated_at=model.updated_at))
+            reencrypted += result.rowcount
+        db.commit()
+    return reencrypted, rows[-1].id if len(rows) == batch_size else None
+
+
+async def reencrypt(batch_size: int = KEY_ROTATION_BATCH, pause: float = KEY_ROTATION_PAUSE) -> int:
+    """re-encrypt every value with the active key, returns the values re-encrypted"""
+    total = 0
+    while True:
+        reencrypted = 0
+        for model in ENCRYPTED:
+            after = None
+            while True:
+                count, after = await asyncio.to_thread(_reencrypt_batch, model, after, batch_size)
+                reencrypted += count
+                if count:
+                    logger.debug(f"Re-encrypted {total + reencrypted} values")
+                if after is None:
+                    break
+                await asyncio.sleep(pause)
+        total += reencrypted
+        # a key added during the pass leaves values behind
+        if not reencrypted:
+            break
+    return total
+
+
+def _pending() -> bool:
+    """whether a value is not sealed with the active key"""
+    with Session(_engine) as db:
+        return any(db.exec(select(model.id).where(_stale(model, ch.active_version)).limit(1)).first()
+                   for model in ENCRYPTED)
+
+
+async def reencryption_job(poll: float = 1):
+    """re-encrypt values on earlier keys, by a single worker"""
+    try:
+        while True:
+            async with lease('key-rotation') as owned:
+                if owned:
+                    reencrypted = await reencrypt()
+                    break
+            # the running job may have finished its last pass before the key was added
+            if not await asyncio.to_thread(_pending):
+                return
+            await asyncio.sleep(poll)
+        if reencrypted:
+            logger.info(f"Re-encrypted {reencrypted} values with key version {ch.active_version}")
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.error(f"Re-encryption failed: {e}")
@@ -0,0 +1,106 @@
+"""Leases
+
+Several API workers share the database and ``DATA_DIR``. A task that must
+run in a single worker at a time, e.g. the deployments of a project, is
+guarded by a lease row:
+
+- a lease is acquired by a single upsert that only succeeds if the lease is
+  free or expired, so exactly one worker owns it
+- the owner renews it every third of ``LEASE_TTL`` while the task runs
+- a worker that dies stops renewing, its leases expire and are taken over
+
+Startup steps running before the lease table exists use ``file_lock``.
+"""
+import asyncio
+import fcntl
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session
+
+from canary_cd.database import Lease, _engine, now
+from canary_cd.settings import logger, LEASE_TTL
+
+WORKER_ID = f'{socket.gethostname()}-{os.getpid()}'
+
+
+def acquire(name: str, owner: str, ttl: float = LEASE_TTL) -> bool:
+    """take a lease that is free or expired"""
+    current = now()
+    statement = insert(Lease).values(name=name, owner=owner, expires_at=current + timedelta(seconds=ttl))
+    statement = statement.on_conflict_do_update(
+        index_elements=[Lease.name],
+        set_={'owner': statement.excluded.owner, 'expires_at': statement.excluded.expires_at},
+        where=Lease.expires_at < current,
+    )
+    with Session(_engine) as db:
+        db.exec(statement)
+        db.commit()
+        lease = db.get(Lease, name)
+        return lease is not None and lease.owner == owner
+
+
+def renew(name: str, owner: str, ttl: float = LEASE_TTL) -> bool:
+    """extend a lease, False if it was lost"""
+    with Session(_engine) as db:
+        result = db.exec(update(Lease)
+                         .where(Lease.name == name, Lease.owner == owner)
+                         .values(expires_at=now() + timedelta(seconds=ttl)))
+        db.commit()
+        return result.rowcount == 1
+
+
+def release(name: str, owner: str):
+    with Session(_engine) as db:
+        db.exec(delete(Lease).where(Lease.name == name, Lease.owner == owner))
+        db.commit()
+
+
+@asynccontextmanager
+async def lease(name: str, ttl: float = LEASE_TTL):
+    """
+    Hold a lease while the block runs
+
+    Yields whether the lease was acquired, the block is responsible for
+    skipping its work otherwise. Every acquisition has its own owner, so
+    tasks of the same worker exclude each other as well.
+    """
+    owner = f'{WORKER_ID}-{uuid.uuid4().hex[:8]}'
+    if not await asyncio.to_thread(acquire, name, owner, ttl):
+        yield False
+        return
+
+    async def keep_alive():
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                if not await asyncio.to_thread(renew, name, owner, ttl):
+                    logger.error(f"Lease {name} lost")
+                    return
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(f"Lease {name} renewal failed: {e}")
+
+    renewal = asyncio.create_task(keep_alive())
+    try:
+        yield True
+    finally:
+        renewal.cancel()
+        await asyncio.to_thread(release, name, owner)
+
+
+@contextmanager
+def file_lock(path: Path):
+    """exclusive advisory lock on a file, blocks until acquired"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
@@ -1,11 +1,67 @@
-"""Notification Helper"""
+"""Notification Helper
 
-import requests
+Notifications are written to a persistent outbox and delivered by a
+background worker, so sending never blocks a deployment.
 
-def discord_webhook(webhook: str, message: str) -> bool:
+- messages queued within a flush are batched into one post per channel
+- each channel is rate limited to one post per ``NOTIFY_RATE`` seconds
+- failed posts are retried with exponential backoff
+"""
+import asyncio
+from datetime import timedelta
+from typing import TYPE_CHECKING
+
+from sqlmodel import Session, select, col
+
+from canary_cd.database import Config, Notification, _engine, now
+from canary_cd.settings import logger, NOTIFY_INTERVAL, NOTIFY_RATE, NOTIFY_MAX_ATTEMPTS
+from canary_cd.utils.lease import lease
+
+# channel: (config key, maximum message length)
+CHANNELS = {
+    'discord': ('DISCORD_WEBHOOK', 2000),
+    'slack': ('SLACK_WEBHOOK', 4000),
+}
+
+# httpx is imported with the first notification
+if TYPE_CHECKING:
+    import httpx
+
+_client: 'httpx.AsyncClient | None' = None
+_wakeup = asyncio.Event()
+_flush_lock = asyncio.Lock()
+_last_sent: dict[str, float] = {}
+
+
+def _http_client() -> 'httpx.AsyncClient':
+    global _client  # pylint: disable=global-statement
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(timeout=5, limits=httpx.Limits(max_connections=10))
+    return _client
+
+
+def notify(db: Session, message: str, channels: list[str] | None = None):
+    """
+    Queue a message for every configured channel
+
+    :param db: database session, the outbox rows are committed with it
+    :param message: message text, markdown is passed through
+    :param channels: restrict to these channels, defaults to all configured
+    """
+    configured = db.exec(select(Config.key).where(col(Config.key).in_([key for key, _ in CHANNELS.values()]))).all()
+    for channel, (key, _limit) in CHANNELS.items():
+        if key in configured and (channels is None or channel in channels):
+            db.add(Notification(channel=channel, message=message))
+    db.commit()
+    _wakeup.set()
+
+
+async def discord_webhook(client: 'httpx.AsyncClient', webhook: str, message: str) -> bool:
     """
     Send a Discord Webhook message
 
+    :param client:
     :param webhook:
     :param message:
     :return:
@@ -15,8 +71,119 @@ def discord_webhook(webhook: str, message: str) -> bool:
         "avatar_url": "https://cdn.rehborn.org/images/canary-birb.png",
         "content": message[:2000],
     }
+    response = await client.post(webhook, json=data)
+    return response.status_code == 204
+
+
+async def slack_webhook(client: 'httpx.AsyncClient', webhook: str, message: str) -> bool:
+    """
+    Send a Slack Webhook message
+
+    :param client:
+    :param webhook:
+    :param message:
+    :return:
+    """
+    response = await client.post(webhook, json={"text": message})
+    return response.status_code == 200
+
+
+SENDERS = {
+    'discord': discord_webhook,
+    'slack': slack_webhook,
+}
+
+
+async def _flush_channel(db: Session, channel: str, notifications: list[Notification]) -> int:
+    key, limit = CHANNELS[channel]
+    config = db.get(Config, key)
+    if not config:
+        # channel was removed, drop its queue
+        for notification in notifications:
+            db.delete(notification)
+        return 0
+
+    loop = asyncio.get_running_loop()
+    if loop.time() - _last_sent.get(channel, -NOTIFY_RATE) < NOTIFY_RATE:
+        return 0
+    _last_sent[channel] = loop.time()
+
+    # batch as many messages as fit into a single post, the rest waits for the next slot
+    post, included = '', []
+    for notification in notifications:
+        message = notification.message[:limit]
+        if included and len(post) + len(message) + 1 > limit:
+            break
+        post = f'{post}\n{message}' if included else message
+        included.append(notification)
+
+    import httpx
+    try:
+        delivered = await SENDERS[channel](_http_client(), config.value, post)
+    except httpx.HTTPError as e:
+        logger.debug(f"Notification {channel} error: {e}")
+        delivered = False
+
+    for notification in included:
+        if delivered:
+            db.delete(notification)
+            continue
+        notification.attempts += 1
+        if notification.attempts >= NOTIFY_MAX_ATTEMPTS:
+            notification.status = 'failed'
+            logger.error(f"Notification {channel} failed after {notification.attempts} attempts")
+        else:
+            notification.next_attempt_at = now() + timedelta(seconds=min(2 ** notification.attempts, 300))
+        db.add(notification)
+    return len(included) if delivered else 0
+
+
+async def outbox_flush() -> int:
+    """
+    Deliver due notifications
+
+    :return: number of delivered notifications
+    """
+    delivered = 0
+    # one worker at a time, a notification is never sent twice
+    async with _flush_lock, lease('notify') as owned:
+        if not owned:
+            return 0
+        with Session(_engine) as db:
+            pending = db.exec(select(Notification)
+                              .where(Notification.status == 'pending')
+                              .where(Notification.next_attempt_at <= now())
+                              .order_by(Notification.created_at)
+                              ).all()
+            channels: dict[str, list[Notification]] = {}
+            for notification in pending:
+                channels.setdefault(notification.channel, []).append(notification)
+
+            for channel, notifications in channels.items():
+                delivered += await _flush_channel(db, channel, notifications)
+            db.commit()
+    return delivered
+
+
+async def outbox_loop(interval: float = NOTIFY_INTERVAL):
+    """deliver notifications when queued, retry pending ones every interval"""
     try:
-        response = requests.post(webhook, data, timeout=1)
-        return True if response.status_code == '204' else False
-    except requests.exceptions.RequestException:
-        return False
+        while True:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), interval)
+            except TimeoutError:
+                pass
+            _wakeup.clear()
+            try:
+                await outbox_flush()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(f"Notification outbox failed: {e}")
+    finally:
+        await _close_client()
+
+
+async def _close_client():
+    global _client  # pylint: disable=global-statement
+    if _client is not None:
+        await _client.aclose()
+        _client = None
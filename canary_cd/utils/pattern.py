@@ -21,6 +21,12 @@ AUTH_TYPES = [
 FQDN_PATTERN = r"^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9][a-z0-9-]{0,61}[a-z0-9]$"
 FQDN_EXAMPLES = ['example.com', 'www.example.com']
 
+# redirect sources may be a wildcard (any depth of subdomains) and end in a path prefix
+REDIRECT_SOURCE_PATTERN = r"^(?:\*\.)?" + FQDN_PATTERN[1:-1] + r"(?:/[\w.~%-]+)*$"
+REDIRECT_SOURCE_EXAMPLES = ['www.example.com', '*.old-example.com', 'example.com/blog']
+REDIRECT_DESTINATION_PATTERN = FQDN_PATTERN[:-1] + r"(?:/[\w.~%-]+)*$"
+REDIRECT_DESTINATION_EXAMPLES = ['example.com', 'example.com/news']
+
 # NAME_PATTERN = r"^([\w]{1})[\w\d-]+$"
 NAME_PATTERN = r"^[\w-]+$"
 NAME_EXAMPLES = ['example-name']
@@ -0,0 +1,61 @@
+"""Background Prefetch of Project Remotes"""
+import asyncio
+import random
+
+from sqlmodel import Session, select, col
+
+from canary_cd.database import Project, _engine
+from canary_cd.dependencies import ch
+from canary_cd.settings import logger, PREFETCH_INTERVAL, PREFETCH_CONCURRENCY, PREFETCH_JITTER
+from canary_cd.utils.lease import lease
+from canary_cd.utils.mirror import mirror_fetch, mirror_path
+
+
+async def prefetch(projects: list[Project], concurrency: int = PREFETCH_CONCURRENCY, jitter: float = PREFETCH_JITTER) -> int:
+    """
+    Fetch the remotes of projects into their mirrors
+
+    Each mirror is fetched once, even if several projects share its remote.
+    Fetches are started with a random delay of up to ``jitter`` seconds and at
+    most ``concurrency`` run at the same time.
+
+    :return: number of successfully refreshed mirrors
+    """
+    remotes = {}
+    for project in projects:
+        if not project.remote:
+            continue
+        auth_type, auth_key = None, None
+        if project.auth:
+            auth_type = project.auth.auth_type
+            auth_key = ch.decrypt_record(project.auth)
+        remotes.setdefault(mirror_path(project.remote), (project.remote, auth_type, auth_key))
+    remotes.pop(None, None)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(remote: str, auth_type: str | None, auth_key: str | None) -> bool:
+        await asyncio.sleep(random.uniform(0, jitter))
+        async with semaphore:
+            return await mirror_fetch(remote, auth_type, auth_key) is not None
+
+    results = await asyncio.gather(*[fetch(*args) for args in remotes.values()])
+    return sum(results)
+
+
+async def prefetch_loop(interval: int = PREFETCH_INTERVAL):
+    """periodically prefetch all project remotes"""
+    logger.info(f"Prefetching remotes every {interval}s")
+    while True:
+        await asyncio.sleep(interval + random.uniform(0, PREFETCH_JITTER))
+        try:
+            # a single worker prefetches per round
+            async with lease('prefetch') as owned:
+                if not owned:
+                    continue
+                with Session(_engine) as db:
+                    projects = db.exec(select(Project).where(col(Project.remote).is_not(None))).all()
+                    refreshed = await prefetch(projects)
+            logger.debug(f"Prefetched {refreshed} of {len(projects)} project remotes")
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Prefetch failed: {e}")
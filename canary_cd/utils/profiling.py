@@ -0,0 +1,183 @@
+"""Request Instrumentation
+
+- ``TimingMiddleware`` adds a ``Server-Timing`` header with the time spent in
+  the application and in the database (``SERVER_TIMING``), and logs requests
+  slower than ``SLOW_REQUEST_MS``
+- ``instrument_engine`` times every query of an engine for the header and
+  logs queries slower than ``SLOW_QUERY_MS``
+- ``profiler`` captures a profile of the next requests to a path once armed
+  by an admin, with pyinstrument if installed, cProfile otherwise
+
+Timing costs two ``perf_counter`` calls per request and per query. Armed
+profiles and captures are kept per worker.
+"""
+import cProfile
+import io
+import pstats
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from canary_cd.database import now
+from canary_cd.settings import logger, SERVER_TIMING, SLOW_REQUEST_MS, SLOW_QUERY_MS, PROFILE_KEEP
+
+
+@dataclass
+class RequestTiming:
+    start: float = field(default_factory=time.perf_counter)
+    db: float = 0.0
+    queries: int = 0
+
+    def header(self, profile_id: uuid.UUID | None = None) -> str:
+        elapsed = (time.perf_counter() - self.start) * 1000
+        metrics = [f'app;dur={elapsed:.1f}', f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"']
+        if profile_id:
+            metrics.append(f'profile;desc="{profile_id}"')
+        return ', '.join(metrics)
+
+
+_timing: ContextVar[RequestTiming | None] = ContextVar('request_timing', default=None)
+
+
+def instrument_engine(engine: Engine, slow_query_ms: float = SLOW_QUERY_MS):
+    """time the queries of the current request and log slow ones"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, _cursor, _statement, _parameters, _context, _executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, _cursor, statement, _parameters, _context, _executemany):
+        duration = time.perf_counter() - conn.info['query_start'].pop()
+        timing = _timing.get()
+        if timing is not None:
+            timing.db += duration
+            timing.queries += 1
+        if slow_query_ms and duration * 1000 >= slow_query_ms:
+            logger.warning(f"Slow query {duration * 1000:.1f}ms: {' '.join(statement.split())[:500]}")
+
+
+@dataclass
+class Profile:
+    id: uuid.UUID
+    method: str
+    path: str
+    profiler: str
+    duration: float
+    output: str
+    created_at: datetime = field(default_factory=now)
+
+
+class Profiler:
+    """capture profiles of the next ``count`` requests to a path"""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.armed: dict[tuple[str, str], int] = {}  # (method, path): requests left, method '*' for any
+        self.profiles: deque[Profile] = deque(maxlen=keep)
+        self.running = False
+
+    def arm(self, path: str, count: int = 1, method: str = '*'):
+        self.armed[(method.upper(), path)] = count
+
+    def disarm(self):
+        self.armed.clear()
+
+    def take(self, method: str, path: str) -> bool:
+        """whether to profile this request, counts it"""
+        if self.running:
+            return False
+        for key in [(method, path), ('*', path)]:
+            if key in self.armed:
+                self.armed[key] -= 1
+                if not self.armed[key]:
+                    del self.armed[key]
+                return True
+        return False
+
+    def get(self, profile_id: uuid.UUID) -> Profile | None:
+        return next((profile for profile in self.profiles if profile.id == profile_id), None)
+
+    def start(self):
+        """start a sampling profiler, a tracing one if pyinstrument is not installed"""
+        self.running = True
+        try:
+            import pyinstrument  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            session = cProfile.Profile()
+            session.enable()
+            return session
+        session = pyinstrument.Profiler(async_mode='enabled')
+        session.start()
+        return session
+
+    def stop(self, session, profile_id: uuid.UUID, method: str, path: str, duration: float) -> Profile:
+        self.running = False
+        if isinstance(session, cProfile.Profile):
+            session.disable()
+            output = io.StringIO()
+            pstats.Stats(session, stream=output).sort_stats('cumulative').print_stats(50)
+            name, text = 'cProfile', output.getvalue()
+        else:
+            session.stop()
+            name, text = 'pyinstrument', session.output_text(unicode=True)
+        profile = Profile(profile_id, method, path, name, duration, text)
+        self.profiles.append(profile)
+        return profile
+
+
+profiler = Profiler()
+
+
+class TimingMiddleware:
+    """Server-Timing header, slow request log and armed profiles"""
+
+    def __init__(self,
+                 app: ASGIApp,
+                 timing: bool = bool(SERVER_TIMING),
+                 slow_request_ms: float = SLOW_REQUEST_MS,
+                 profiles: Profiler = profiler):
+        self.app = app
+        self.timing = timing
+        self.slow_request_ms = slow_request_ms
+        self.profiles = profiles
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = None
+        if self.profiles.armed and self.profiles.take(scope['method'], scope['path']):
+            profile_id = uuid.uuid4()
+        elif not self.timing and not self.slow_request_ms:
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _timing.set(timing)
+        session = self.profiles.start() if profile_id else None
+
+        async def send_timing(message: Message):
+            if message['type'] == 'http.response.start' and (self.timing or profile_id):
+                MutableHeaders(scope=message).append('Server-Timing', timing.header(profile_id))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timing)
+        finally:
+            _timing.reset(token)
+            duration = time.perf_counter() - timing.start
+            if session is not None:
+                self.profiles.stop(session, profile_id, scope['method'], scope['path'], duration)
+                logger.info(f"Profiled {scope['method']} {scope['path']} in {duration * 1000:.1f}ms: {profile_id}")
+            if self.slow_request_ms and duration * 1000 >= self.slow_request_ms:
+                logger.warning(f"Slow request {scope['method']} {scope['path']} {duration * 1000:.1f}ms, "
+                               f"{timing.queries} queries {timing.db * 1000:.1f}ms")
@@ -0,0 +1,23 @@
+"""Proxy Backends
+
+The routing of pages, redirects and canaries is pushed to the proxy selected
+by ``HTTPD``: traefik (dynamic config files), caddy (admin API) or nginx
+(map files).
+"""
+from canary_cd.settings import DYN_CONFIG_CACHE, HTTPD, HTTPD_CONFIG_DUMP, HTTPD_CONFIG_SHARDS, REDIRECT_ENGINE
+from canary_cd.utils.proxy.base import ProxyBackend
+from canary_cd.utils.proxy.caddy import CaddyBackend
+from canary_cd.utils.proxy.nginx import NginxBackend
+from canary_cd.utils.proxy.traefik import DynamicConfigWriter
+
+
+def get_backend(httpd: str = HTTPD) -> ProxyBackend:
+    if httpd == 'caddy':
+        return CaddyBackend(redirect_engine=bool(REDIRECT_ENGINE))
+    if httpd == 'nginx':
+        return NginxBackend(DYN_CONFIG_CACHE, redirect_engine=bool(REDIRECT_ENGINE))
+    return DynamicConfigWriter(DYN_CONFIG_CACHE, shards=HTTPD_CONFIG_SHARDS, enabled=bool(HTTPD_CONFIG_DUMP),
+                               redirect_engine=bool(REDIRECT_ENGINE))
+
+
+proxy = get_backend()
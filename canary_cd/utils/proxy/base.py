@@ -0,0 +1,233 @@
+"""Proxy Backend Base"""
+import asyncio
+from typing import Any
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from canary_cd.database import Page, Redirect, Canary, _engine
+from canary_cd.settings import logger, HTTPD_CONFIG_DEBOUNCE, HTTPD_CONFIG_REFRESH
+
+# entry of the redirect engine, not a valid fqdn so it never collides with a host
+ENGINE_HOST = 'redirect-engine'
+
+
+def redirect_host(source: str) -> str:
+    """host of a redirect source, wildcards are kept"""
+    return source.partition('/')[0]
+
+
+def is_pattern(source: str) -> bool:
+    """wildcard or path prefix source"""
+    return source.startswith('*.') or '/' in source
+
+
+class ProxyBackend:
+    """
+    Routing of every host, pushed to the proxy in batches
+
+    Backends render an entry per host for pages, redirects and canaries and
+    push the entries of changed hosts. Changes are collected for ``debounce``
+    seconds before they are pushed, failed pushes are retried with backoff.
+
+    With ``redirect_engine``, redirects are not routed one by one, a single
+    entry sends all redirect hosts to canary-cd's redirect engine instead,
+    only the engine serves wildcard and path prefix sources.
+
+    Once loaded from the database by ``rebuild``, the hosts are reloaded
+    before every push if another worker changed them, so a push never drops
+    the hosts of other workers.
+
+    :param debounce: seconds to collect changes before pushing
+    :param enabled: without, changes are only kept in memory
+    :param redirect_engine: route redirects to the redirect engine
+    """
+
+    def __init__(self, debounce: float = HTTPD_CONFIG_DEBOUNCE, enabled: bool = True, redirect_engine: bool = False):
+        self.debounce = debounce
+        self.enabled = enabled
+        self.redirect_engine = redirect_engine
+        # redirect source to its host, several path prefixes share a host
+        self.redirect_hosts: dict[str, str] = {}
+        self.hosts: dict[str, Any] = {}
+        self.dirty: set[str] = set()
+        self.full = False
+        # of the hosts last loaded from the database, None if never loaded
+        self.signature: tuple | None = None
+        self._flush_task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    # rendering
+    def page(self, fqdn: str, cors_hosts: str | None = None) -> Any:
+        raise NotImplementedError
+
+    def redirect(self, source: str, destination: str) -> Any:
+        raise NotImplementedError
+
+    def canary(self, canary: Canary, name: str) -> Any:
+        raise NotImplementedError
+
+    def engine(self, hosts: list[str]) -> Any:
+        """entry routing all redirect hosts to the redirect engine"""
+        raise NotImplementedError
+
+    async def push(self, changed: set[str] | None) -> int:
+        """
+        Push the entries of changed hosts, removed hosts have no entry anymore
+
+        :param changed: hosts, None to replace the whole configuration
+        :return: number of pushed units, e.g. files or routes
+        """
+        raise NotImplementedError
+
+    # mutations
+    def set_page(self, fqdn: str, cors_hosts: str | None = None):
+        self._set(fqdn, self.page(fqdn, cors_hosts))
+
+    def set_redirect(self, source: str, destination: str):
+        if not self.redirect_engine:
+            self._set(source, self.redirect(source, destination))
+        elif source not in self.redirect_hosts:
+            self.redirect_hosts[source] = redirect_host(source)
+            self._set(ENGINE_HOST, self.engine(self.engine_hosts()))
+
+    def engine_hosts(self) -> list[str]:
+        return sorted(set(self.redirect_hosts.values()))
+
+    def set_canary(self, canary: Canary, name: str):
+        self._set(canary.fqdn, self.canary(canary, name))
+
+    def remove(self, host: str):
+        if host in self.redirect_hosts:
+            del self.redirect_hosts[host]
+            if self.redirect_hosts:
+                self._set(ENGINE_HOST, self.engine(self.engine_hosts()))
+            else:
+                self.remove(ENGINE_HOST)
+        elif self.hosts.pop(host, None) is not None:
+            self._changed(host)
+
+    def _set(self, host: str, entry: Any):
+        self.hosts[host] = entry
+        self._changed(host)
+
+    def _changed(self, host: str):
+        self.dirty.add(host)
+        self._schedule()
+
+    def _schedule(self):
+        if not self.enabled:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+            except RuntimeError:
+                # no event loop, pushed by the next flush
+                pass
+
+    async def _delayed_flush(self):
+        # changes made while pushing are picked up by another round
+        failures = 0
+        while True:
+            await asyncio.sleep(min(self.debounce * 2 ** failures, 30))
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                failures += 1
+                logger.error(f"Proxy config push failed: {e}")
+            if not self.dirty and not self.full:
+                return
+
+    async def flush(self) -> int:
+        """push pending changes"""
+        if not self.enabled:
+            return 0
+        async with self._lock:
+            await self.refresh()
+            changed, self.dirty = (None if self.full else self.dirty), set()
+            self.full = False
+            if changed is not None and not changed:
+                return 0
+            try:
+                pushed = await self.push(changed)
+            except BaseException:
+                # retried by the next flush
+                if changed is None:
+                    self.full = True
+                else:
+                    self.dirty |= changed
+                raise
+        logger.debug(f"Proxy config: pushed {pushed}, {len(self.hosts)} hosts")
+        return pushed
+
+    @staticmethod
+    def _signature(db: Session) -> tuple:
+        # changes with every insert, update and delete of a routed host
+        return tuple(value for model in (Page, Redirect, Canary)
+                     for value in db.exec(select(func.count(), func.max(model.updated_at)).select_from(model)).one())
+
+    def load(self) -> tuple[dict[str, Any], dict[str, str], tuple]:
+        """
+        Every host from the database
+
+        :return: entries by host, redirect hosts by source, signature
+        """
+        hosts, redirect_hosts = {}, {}
+        with Session(_engine) as db:
+            signature = self._signature(db)
+            for page in db.exec(select(Page)).all():
+                hosts[page.fqdn] = self.page(page.fqdn, page.cors_hosts)
+            for redirect in db.exec(select(Redirect)).all():
+                if self.redirect_engine:
+                    redirect_hosts[redirect.source] = redirect_host(redirect.source)
+                elif is_pattern(redirect.source):
+                    logger.warning(f"Redirect {redirect.source} needs the redirect engine, skipped")
+                else:
+                    hosts[redirect.source] = self.redirect(redirect.source, redirect.destination)
+            for canary in db.exec(select(Canary)).all():
+                hosts[canary.fqdn] = self.canary(canary, canary.project.name)
+        if redirect_hosts:
+            hosts[ENGINE_HOST] = self.engine(sorted(set(redirect_hosts.values())))
+        return hosts, redirect_hosts, signature
+
+    def changed_elsewhere(self) -> bool:
+        """whether the hosts in the database changed since they were loaded"""
+        with Session(_engine) as db:
+            return self._signature(db) != self.signature
+
+    async def refresh(self) -> bool:
+        """reload the hosts if they changed since the last load, changed hosts are pushed by the next flush"""
+        if self.signature is None or not await asyncio.to_thread(self.changed_elsewhere):
+            return False
+        hosts, self.redirect_hosts, self.signature = await asyncio.to_thread(self.load)
+        self.dirty |= {host for host in hosts.keys() | self.hosts.keys() if hosts.get(host) != self.hosts.get(host)}
+        self.hosts = hosts
+        return True
+
+    async def refresh_loop(self, interval: int = HTTPD_CONFIG_REFRESH):
+        """push the changes of other workers"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.refresh():
+                    self._schedule()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(f"Proxy config refresh failed: {e}")
+
+    async def rebuild(self):
+        """load every host from the database and replace the proxy configuration"""
+        self.hosts, self.redirect_hosts, self.signature = await asyncio.to_thread(self.load)
+        self.full = True
+        try:
+            await self.flush()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Proxy config push failed: {e}")
+            self._schedule()
+
+    async def close(self):
+        """push pending changes on shutdown"""
+        try:
+            await self.flush()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Proxy config push failed: {e}")
@@ -0,0 +1,138 @@
+"""Caddy Admin API
+
+Every host is a route tagged with an ``@id`` in the server ``CADDY_SERVER``.
+A change patches, appends or deletes the route of that host through the admin
+API at ``CADDY_ADMIN``, only a rebuild replaces the whole route list.
+"""
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from canary_cd.database import Canary
+from canary_cd.settings import STATIC_BACKEND_NAME, CADDY_ADMIN, CADDY_SERVER, REDIRECT_ENGINE_URL
+from canary_cd.utils.canary import slot_url, slot_weights
+from canary_cd.utils.proxy.base import ProxyBackend, ENGINE_HOST
+
+if TYPE_CHECKING:
+    import httpx
+
+
+def dial(url: str) -> str:
+    """host:port of an url"""
+    parts = urlsplit(url)
+    return f"{parts.hostname}:{parts.port or (443 if parts.scheme == 'https' else 80)}"
+
+
+class CaddyBackend(ProxyBackend):
+    """
+    Incremental routes through the Caddy admin API
+
+    :param admin: url of the admin API
+    :param server: name of the http server holding the routes
+    :param transport: httpx transport, e.g. a mock admin endpoint
+    """
+
+    def __init__(self, admin: str = CADDY_ADMIN, server: str = CADDY_SERVER,
+                 transport: 'httpx.AsyncBaseTransport | None' = None, **kwargs):
+        super().__init__(**kwargs)
+        self.admin = admin
+        self.server = server
+        self.transport = transport
+        self._client: 'httpx.AsyncClient | None' = None
+
+    @property
+    def client(self) -> 'httpx.AsyncClient':
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(base_url=self.admin, transport=self.transport, timeout=10)
+        return self._client
+
+    @staticmethod
+    def route_id(host: str) -> str:
+        return f'canary-cd-{host}'
+
+    def _route(self, host: str, handle: list[dict]) -> dict:
+        return {
+            '@id': self.route_id(host),
+            'match': [{'host': [host]}],
+            'handle': handle,
+            'terminal': True,
+        }
+
+    def page(self, fqdn: str, cors_hosts: str | None = None) -> dict:
+        handle = []
+        if cors_hosts:
+            origins = [host if host.startswith('http') else f'https://{host}' for host in cors_hosts.split(',')]
+            # allowed origins are echoed back, like traefik's accessControlAllowOriginList
+            handle.append({'handler': 'subroute', 'routes': [{
+                'match': [{'header': {'Origin': [origin]}}],
+                'handle': [{
+                    'handler': 'headers',
+                    'response': {'set': {
+                        'Access-Control-Allow-Origin': [origin],
+                        'Access-Control-Allow-Methods': ['GET, OPTIONS, PUT'],
+                        'Access-Control-Allow-Headers': ['*'],
+                        'Access-Control-Max-Age': ['100'],
+                        'Vary': ['Origin'],
+                    }},
+                }],
+            } for origin in origins]})
+        handle.append({'handler': 'reverse_proxy', 'upstreams': [{'dial': dial(STATIC_BACKEND_NAME)}]})
+        return self._route(fqdn, handle)
+
+    def redirect(self, source: str, destination: str) -> dict:
+        return self._route(source, [{
+            'handler': 'static_response',
+            'status_code': 301,
+            'headers': {'Location': [f'https://{destination}{{http.request.uri}}']},
+        }])
+
+    def canary(self, canary: Canary, name: str) -> dict:
+        weights = {slot: weight for slot, weight in slot_weights(canary).items() if weight}
+        if not weights:
+            return self._route(canary.fqdn, [{'handler': 'static_response', 'status_code': 503}])
+        return self._route(canary.fqdn, [{
+            'handler': 'reverse_proxy',
+            'upstreams': [{'dial': dial(slot_url(canary, name, slot))} for slot in weights],
+            'load_balancing': {'selection_policy': {
+                'policy': 'weighted_round_robin',
+                'weights': list(weights.values()),
+            }},
+        }])
+
+    def engine(self, hosts: list[str]) -> dict:
+        # one route matching every redirect host, caddy looks large host lists up by binary search,
+        # its wildcards cover a single label
+        route = self._route(ENGINE_HOST, [{'handler': 'reverse_proxy', 'upstreams': [{'dial': dial(REDIRECT_ENGINE_URL)}]}])
+        route['match'] = [{'host': hosts}]
+        return route
+
+    async def push(self, changed: set[str] | None) -> int:
+        routes_path = f'/config/apps/http/servers/{self.server}/routes'
+        if changed is None:
+            routes = list(self.hosts.values())
+            response = await self.client.patch(routes_path, json=routes)
+            if response.status_code >= 400:
+                # server does not exist yet
+                response = await self.client.put(f'/config/apps/http/servers/{self.server}',
+                                                 json={'listen': [':443'], 'routes': routes})
+            response.raise_for_status()
+            return len(routes)
+
+        for host in sorted(changed):
+            route = self.hosts.get(host)
+            if route is None:
+                response = await self.client.delete(f'/id/{self.route_id(host)}')
+                if response.status_code != 404:
+                    response.raise_for_status()
+                continue
+            response = await self.client.patch(f'/id/{self.route_id(host)}', json=route)
+            if response.status_code == 404:
+                response = await self.client.post(routes_path, json=route)
+            response.raise_for_status()
+        return len(changed)
+
+    async def close(self):
+        await super().close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
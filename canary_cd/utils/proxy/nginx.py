@@ -0,0 +1,116 @@
+"""nginx Map Files
+
+The routing of every host is written to map files in ``DYN_CONFIG_CACHE``,
+nginx is reloaded once per batch of changes with ``NGINX_RELOAD``.
+
+- ``backends.map``: host to upstream url, redirect hosts to the redirect
+  engine with ``REDIRECT_ENGINE``
+- ``redirects.map``: host to redirect destination
+- ``canary.conf``: ``split_clients`` blocks of weighted canaries
+
+The files are included by the nginx configuration, e.g.::
+
+    include /data/dynamic/canary.conf;
+    map $host $canary_backend { hostnames; include /data/dynamic/backends.map; }
+    map $host $canary_redirect { include /data/dynamic/redirects.map; }
+
+    server {
+        listen 443 ssl;
+        if ($canary_redirect) { return 301 https://$canary_redirect$request_uri; }
+        location / { proxy_pass $canary_backend; }
+    }
+"""
+import asyncio
+import re
+from pathlib import Path
+
+from canary_cd.database import Canary
+from canary_cd.settings import logger, STATIC_BACKEND_NAME, NGINX_RELOAD, REDIRECT_ENGINE_URL
+from canary_cd.utils.canary import slot_url, slot_weights
+from canary_cd.utils.proxy.base import ProxyBackend
+from canary_cd.utils.proxy.traefik import write_atomic
+
+
+def variable(host: str) -> str:
+    """nginx variable of a canary host"""
+    return '$canary_' + re.sub(r'\W', '_', host)
+
+
+class NginxBackend(ProxyBackend):
+    """
+    Map files with batched reloads
+
+    :param directory: directory of the map files
+    :param reload: command reloading nginx
+    """
+
+    def __init__(self, directory: Path, reload: str = NGINX_RELOAD, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.reload = reload
+        self.reloads = 0
+
+    def page(self, fqdn: str, cors_hosts: str | None = None) -> tuple:
+        return 'backend', STATIC_BACKEND_NAME
+
+    def redirect(self, source: str, destination: str) -> tuple:
+        return 'redirect', destination
+
+    def canary(self, canary: Canary, name: str) -> tuple:
+        weights = {slot_url(canary, name, slot): weight for slot, weight in slot_weights(canary).items() if weight}
+        return 'canary', tuple(weights.items())
+
+    def engine(self, hosts: list[str]) -> tuple:
+        return 'engine', tuple(hosts)
+
+    def render(self) -> dict[str, str]:
+        """content of every map file"""
+        backends, redirects, splits = [], [], []
+        for host, (kind, value) in sorted(self.hosts.items()):
+            if kind == 'backend':
+                backends.append(f'{host} {value};\n')
+            elif kind == 'redirect':
+                redirects.append(f'{host} {value};\n')
+            elif kind == 'engine':
+                # wildcards need `hostnames` in the map block
+                backends.extend(f'{source} {REDIRECT_ENGINE_URL};\n' for source in value)
+            elif value:
+                backends.append(f'{host} {variable(host)};\n')
+                # the largest share takes the remainder
+                upstreams = sorted(value, key=lambda upstream: upstream[1])
+                lines = [f'    {weight}% {url};\n' for url, weight in upstreams[:-1]]
+                lines.append(f'    * {upstreams[-1][0]};\n')
+                splits.append(f'split_clients $request_id {variable(host)} {{\n{"".join(lines)}}}\n')
+        return {
+            'backends.map': ''.join(backends),
+            'redirects.map': ''.join(redirects),
+            'canary.conf': ''.join(splits),
+        }
+
+    async def push(self, changed: set[str] | None) -> int:
+        files = self.render()
+        written = await asyncio.to_thread(self._write, files)
+        if written:
+            await self._reload()
+        return written
+
+    def _write(self, files: dict[str, str]) -> int:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        written = 0
+        for name, content in files.items():
+            path = self.directory / name
+            if path.is_file() and path.read_text() == content:
+                continue
+            write_atomic(path, content)
+            written += 1
+        return written
+
+    async def _reload(self):
+        process = await asyncio.create_subprocess_shell(self.reload,
+                                                        stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.PIPE)
+        _stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"nginx reload failed: {stderr.decode().strip()}")
+        self.reloads += 1
+        logger.debug("nginx reloaded")
@@ -0,0 +1,119 @@
+"""Traefik Dynamic Configuration Files
+
+The routing of every host is written to ``DYN_CONFIG_CACHE`` for the
+Traefik file provider:
+
+- hosts are spread over ``HTTPD_CONFIG_SHARDS`` files by a hash of their name
+- only the files of changed hosts are written
+- files are written to a temporary file and renamed, so the proxy never
+  reads a partially written file
+- other files in the directory, e.g. middlewares of the proxy setup, are
+  left alone
+"""
+import asyncio
+import os
+import re
+import tempfile
+import zlib
+from pathlib import Path
+
+from canary_cd.database import Canary
+from canary_cd.settings import REDIRECT_ENGINE_URL
+from canary_cd.utils.canary import add_canary
+from canary_cd.utils.httpd_conf import TraefikConfig
+from canary_cd.utils.proxy.base import ProxyBackend
+
+
+class DynamicConfigWriter(ProxyBackend):
+    """
+    Batched writer of the dynamic configuration files
+
+    :param directory: directory watched by the proxy
+    :param shards: number of files, a single ``dynamic.yml`` by default
+    """
+
+    def __init__(self, directory: Path, shards: int = 1, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.shards = max(shards, 1)
+
+    def page(self, fqdn: str, cors_hosts: str | None = None) -> dict:
+        tc = TraefikConfig()
+        tc.add_page(fqdn, cors_hosts)
+        return tc.render()['http']
+
+    def redirect(self, source: str, destination: str) -> dict:
+        tc = TraefikConfig()
+        tc.add_redirect(source, destination)
+        return tc.render()['http']
+
+    def canary(self, canary: Canary, name: str) -> dict:
+        tc = TraefikConfig()
+        add_canary(tc, canary, name)
+        return tc.render()['http']
+
+    def engine(self, hosts: list[str]) -> dict:
+        tc = TraefikConfig()
+        tc.add_redirect_engine(hosts, REDIRECT_ENGINE_URL)
+        return tc.render()['http']
+
+    def shard_name(self, index: int) -> str:
+        return 'dynamic.yml' if self.shards == 1 else f'dynamic-{index:03d}.yml'
+
+    def shard(self, host: str) -> int:
+        return zlib.crc32(host.encode()) % self.shards
+
+    def render_shard(self, index: int) -> dict:
+        """merged configuration of all hosts in a shard"""
+        config = {}
+        for host, sections in self.hosts.items():
+            if self.shard(host) != index:
+                continue
+            for section, items in sections.items():
+                config.setdefault(section, {}).update(items)
+        return {'http': config} if config else {}
+
+    def owned(self, name: str) -> bool:
+        """shard files of any shard count, and the per host files of earlier versions"""
+        if re.fullmatch(r'dynamic(-\d{3})?\.yml', name):
+            return True
+        host = name.removesuffix('.yml')
+        return host in self.hosts or host in self.redirect_hosts
+
+    async def push(self, changed: set[str] | None) -> int:
+        if changed is None:
+            shards = set(range(self.shards))
+        else:
+            shards = {self.shard(host) for host in changed}
+        snapshots = {self.shard_name(index): self.render_shard(index) for index in sorted(shards)}
+        stale = []
+        if changed is None and self.directory.exists():
+            stale = [file for file in self.directory.glob('*.yml') if file.name not in snapshots and self.owned(file.name)]
+        await asyncio.to_thread(self._write, snapshots, stale)
+        return len(snapshots)
+
+    def _write(self, snapshots: dict[str, dict], stale: list[Path]):
+        import yaml
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for file in stale:
+            file.unlink(missing_ok=True)
+
+        for name, config in snapshots.items():
+            if not config:
+                (self.directory / name).unlink(missing_ok=True)
+                continue
+            write_atomic(self.directory / name, yaml.safe_dump(config))
+
+
+def write_atomic(path: Path, content: str):
+    """write a file through a temporary file in the same directory"""
+    fd, temp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as dump:
+            dump.write(content)
+        # temporary files are private, the proxy may run as another user
+        os.chmod(temp, 0o644)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
@@ -0,0 +1,108 @@
+"""Webhook Rate Limits
+
+Webhooks are limited by token buckets per client IP and per token: a bucket
+holds up to ``burst`` requests and refills at ``rate`` requests per second.
+Resumable uploads send a request per chunk, their requests are limited by a
+bucket per page token of their own, starting an upload counts as a webhook.
+Deploy webhooks are also rejected while ``DEPLOY_QUEUE_LIMIT`` deployments
+are queued or running on all projects. Rejected callers get ``429`` with a
+``Retry-After`` in seconds.
+
+Buckets are kept per worker, the deploy backlog is read from the database
+and shared by all workers.
+
+The client IP is the one uvicorn resolved from ``X-Forwarded-For``. Any
+client can set that header, the per IP limit only holds when
+``FORWARDED_ALLOW_IPS`` is limited to the proxy in front of canary-cd. With
+the default ``*`` a client changing the header gets a new bucket, the per
+token limits and the deploy backlog still apply.
+"""
+import math
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import func
+from sqlmodel import Session, select, col
+
+from canary_cd.database import Deployment
+from canary_cd.settings import WEBHOOK_RATE, WEBHOOK_BURST, WEBHOOK_IP_RATE, WEBHOOK_IP_BURST, DEPLOY_QUEUE_LIMIT
+from canary_cd.settings import WEBHOOK_UPLOAD_RATE, WEBHOOK_UPLOAD_BURST
+from canary_cd.utils.stream import RUNNING
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """take a token, returns 0 or the seconds until one is available"""
+        current = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (current - self.updated) * self.rate)
+        self.updated = current
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Token buckets by key
+
+    :param rate: requests per second, 0 disables the limit
+    :param burst: requests at once
+    :param max_keys: buckets kept, the least recently used one is dropped
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def take(self, key: str) -> float:
+        if not self.rate:
+            return 0
+        bucket = self.buckets.pop(key, None) or TokenBucket(self.rate, self.burst)
+        self.buckets[key] = bucket
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return bucket.take()
+
+    def check(self, key: str, detail: str = 'Too many requests'):
+        """raise 429 if the bucket of ``key`` is empty"""
+        wait = self.take(key)
+        if wait:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail,
+                                headers={'Retry-After': str(math.ceil(wait))})
+
+
+ip_limiter = RateLimiter(WEBHOOK_IP_RATE, WEBHOOK_IP_BURST)
+token_limiter = RateLimiter(WEBHOOK_RATE, WEBHOOK_BURST)
+upload_limiter = RateLimiter(WEBHOOK_UPLOAD_RATE, WEBHOOK_UPLOAD_BURST)
+
+
+async def webhook_ip_limit(request: Request):
+    ip_limiter.check(request.client.host if request.client else '-')
+
+
+def deploy_backlog(db: Session) -> int:
+    """deployments queued or running on all projects"""
+    return db.exec(select(func.count()).select_from(Deployment).where(col(Deployment.status).in_(RUNNING))).one()
+
+
+def admit_deployment(db: Session, limit: int = DEPLOY_QUEUE_LIMIT):
+    """raise 429 while the deploy backlog is full, retry after about one deployment finished"""
+    if not limit or deploy_backlog(db) < limit:
+        return
+    recent = db.exec(select(Deployment.duration)
+                     .where(col(Deployment.duration).is_not(None))
+                     .order_by(col(Deployment.created_at).desc())
+                     .limit(20)).all()
+    wait = sum(recent) / len(recent) if recent else 30
+    raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Deployment queue is full',
+                        headers={'Retry-After': str(max(math.ceil(wait), 1))})
@@ -0,0 +1,211 @@
+"""Redirect Engine
+
+With ``REDIRECT_ENGINE``, redirects are answered by canary-cd itself: the
+proxy sends every redirect host to canary-cd and the request is matched
+against an in-memory trie.
+
+Sources are exact hosts (``example.com``), wildcards covering every subdomain
+at any depth (``*.example.com``) and either of both with a path prefix
+(``example.com/blog``). The most specific rule wins: an exact host before a
+wildcard, a longer wildcard before a shorter one, and within a host the
+longest path prefix. The host trie is keyed by the reversed labels and every
+host rule holds a trie of path segments, so matching costs one step per label
+and path segment however many rules exist.
+
+The map is updated right away by changes made in this process and reloaded
+from the database when the redirects changed in another worker.
+"""
+import asyncio
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+from starlette.responses import RedirectResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from canary_cd.database import Redirect, _engine
+from canary_cd.settings import logger, REDIRECT_REFRESH
+
+
+def split_source(source: str) -> tuple[str, bool, list[str]]:
+    """
+    Parts of a redirect source
+
+    :return: host without the wildcard, wildcard or not, path segments
+    """
+    host, _, path = source.partition('/')
+    wildcard = host.startswith('*.')
+    return host.removeprefix('*.'), wildcard, [segment for segment in path.split('/') if segment]
+
+
+class _PathNode:
+    __slots__ = ('children', 'destination')
+
+    def __init__(self):
+        self.children: dict[str, _PathNode] = {}
+        self.destination: str | None = None
+
+    def match(self, segments: list[str]) -> tuple[str, int] | None:
+        """destination of the longest prefix and the number of segments it covers"""
+        node, best = self, None
+        if node.destination is not None:
+            best = (node.destination, 0)
+        for depth, segment in enumerate(segments, 1):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.destination is not None:
+                best = (node.destination, depth)
+        return best
+
+
+class _HostNode:
+    __slots__ = ('children', 'exact', 'wildcard')
+
+    def __init__(self):
+        self.children: dict[str, _HostNode] = {}
+        # path rules of the host itself and of all its subdomains
+        self.exact: _PathNode | None = None
+        self.wildcard: _PathNode | None = None
+
+
+class RedirectTrie:
+    """redirect rules keyed by reversed host labels"""
+
+    def __init__(self):
+        self.root = _HostNode()
+
+    def insert(self, source: str, destination: str):
+        host, wildcard, segments = split_source(source)
+        node = self.root
+        for label in reversed(host.split('.')):
+            node = node.children.setdefault(label, _HostNode())
+        attribute = 'wildcard' if wildcard else 'exact'
+        path = getattr(node, attribute)
+        if path is None:
+            path = _PathNode()
+            setattr(node, attribute, path)
+        for segment in segments:
+            path = path.children.setdefault(segment, _PathNode())
+        path.destination = destination
+
+    def delete(self, source: str):
+        host, wildcard, segments = split_source(source)
+        node = self.root
+        for label in reversed(host.split('.')):
+            node = node.children.get(label)
+            if node is None:
+                return
+        path = node.wildcard if wildcard else node.exact
+        for segment in segments:
+            if path is None:
+                return
+            path = path.children.get(segment)
+        if path is not None:
+            # empty nodes are dropped by the next load
+            path.destination = None
+
+    def match(self, host: str, path: str = '/') -> str | None:
+        """
+        Location of the most specific rule matching a request
+
+        The matched path prefix is replaced by the path of the destination,
+        the rest of the path is kept.
+        """
+        labels = host.split('.')
+        candidates, node = [], self.root
+        for label in reversed(labels):
+            # a wildcard only matches if at least one label is left
+            if node.wildcard is not None:
+                candidates.append(node.wildcard)
+            node = node.children.get(label)
+            if node is None:
+                break
+        else:
+            if node.exact is not None:
+                candidates.append(node.exact)
+        if not candidates:
+            return None
+
+        segments = path.split('/')[1:]
+        for rules in reversed(candidates):
+            found = rules.match(segments)
+            if found is not None:
+                destination, depth = found
+                rest = '/'.join(segments[depth:])
+                return f"https://{destination}/{rest}" if rest or not depth else f"https://{destination}"
+        return None
+
+
+class RedirectMap:
+    """redirect rules of the engine"""
+
+    def __init__(self):
+        self.rules: dict[str, str] = {}
+        self.trie = RedirectTrie()
+        self.signature: tuple | None = None
+
+    def set(self, source: str, destination: str):
+        self.rules[source] = destination
+        self.trie.insert(source, destination)
+
+    def remove(self, source: str):
+        if self.rules.pop(source, None) is not None:
+            self.trie.delete(source)
+
+    def lookup(self, host: str, path: str = '/') -> str | None:
+        """redirect location of a Host header and path, the port is ignored"""
+        return self.trie.match(host.rsplit(':', 1)[0].lower(), path)
+
+    @staticmethod
+    def _signature(db: Session) -> tuple:
+        # changes with every insert, update and delete
+        return tuple(db.exec(select(func.count(Redirect.id), func.max(Redirect.updated_at))).one())
+
+    def load(self):
+        with Session(_engine) as db:
+            self.signature = self._signature(db)
+            rules = {redirect.source: redirect.destination for redirect in db.exec(select(Redirect)).all()}
+        trie = RedirectTrie()
+        for source, destination in rules.items():
+            trie.insert(source, destination)
+        self.rules, self.trie = rules, trie
+        logger.debug(f"Redirect engine: loaded {len(rules)} redirects")
+
+    def refresh(self) -> bool:
+        """reload if the redirects changed since the last load"""
+        with Session(_engine) as db:
+            if self._signature(db) == self.signature:
+                return False
+        self.load()
+        return True
+
+    async def refresh_loop(self, interval: int = REDIRECT_REFRESH):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(f"Redirect engine refresh failed: {e}")
+
+
+redirect_map = RedirectMap()
+
+
+class RedirectMiddleware:
+    """answer requests for redirect hosts before they reach the API"""
+
+    def __init__(self, app: ASGIApp, redirects: RedirectMap = redirect_map):
+        self.app = app
+        self.redirects = redirects
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'http':
+            host = next((value.decode('latin-1') for key, value in scope['headers'] if key == b'host'), '')
+            path = scope.get('raw_path', b'').decode('latin-1').partition('?')[0] or scope['path']
+            location = self.redirects.lookup(host, path)
+            if location:
+                if scope.get('query_string'):
+                    location = f"{location}?{scope['query_string'].decode('latin-1')}"
+                await RedirectResponse(location, status_code=301)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
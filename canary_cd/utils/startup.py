@@ -0,0 +1,68 @@
+"""Startup Profile
+
+Import and startup time of the application, measured in a fresh interpreter
+with a temporary ``DATA_DIR``::
+
+    python -m canary_cd.utils.startup
+
+Heavy subsystems (GitPython, PyYAML, cryptography, httpx) are imported on
+first use, ``LAZY_MODULES`` must not be loaded by importing the application.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+from canary_cd.settings import BASE_DIR
+
+LAZY_MODULES = ['git', 'yaml', 'cryptography', 'httpx']
+
+STARTUP = """
+import asyncio, time
+start = time.perf_counter()
+from canary_cd.main import app, lifespan
+imported = time.perf_counter()
+async def startup():
+    async with lifespan(app):
+        pass
+asyncio.run(startup())
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def _run(args: list[str], workdir: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, DATA_DIR=workdir, LOGLEVEL='WARNING')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(BASE_DIR), env.get('PYTHONPATH')]))
+    return subprocess.run([sys.executable, *args], cwd=workdir, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def import_profile(module: str = 'canary_cd.main') -> dict[str, int]:
+    """cumulative import time in microseconds of every module imported by ``module``"""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = _run(['-X', 'importtime', '-c', f'import {module}'], workdir)
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = line.removeprefix('import time:').split('|')
+        profile[name.strip()] = int(cumulative)
+    return profile
+
+
+def startup_time() -> tuple[float, float]:
+    """seconds to import the application and to run its startup"""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = _run(['-c', STARTUP], workdir)
+    imported, started = result.stdout.split()[-2:]
+    return float(imported), float(started)
+
+
+if __name__ == '__main__':
+    imports = import_profile()
+    packages = {name: time for name, time in imports.items() if '.' not in name}
+    for name, time in sorted(packages.items(), key=lambda item: -item[1])[:15]:
+        print(f"{time / 1000:8.1f} ms  {name}")
+    print(f"loaded lazy modules: {[name for name in LAZY_MODULES if name in imports] or 'none'}")
+    import_seconds, startup_seconds = startup_time()
+    print(f"import {import_seconds:.3f}s, startup {startup_seconds:.3f}s")
@@ -0,0 +1,244 @@
+"""Live Deployment Output
+
+The worker running a deployment keeps its output in memory and streams it to
+its own clients. Every ``DEPLOY_LOG_FLUSH`` seconds it stores a snapshot of
+the output with the deployment, clients of other workers follow the
+snapshots. Output posted by remote agents may reach any worker, it is
+appended to the stored output right away and followed the same way.
+"""
+import asyncio
+import uuid
+import zlib
+from collections import deque
+from typing import AsyncIterator
+
+from sqlalchemy import update
+from sqlmodel import Session, select, col
+
+from canary_cd.database import Deployment, _engine
+from canary_cd.settings import DEPLOY_LOG_LIMIT, DEPLOY_LOG_FLUSH
+
+RUNNING = ('queued', 'running')
+TRUNCATED = '[output truncated]\n'
+
+
+class DeploymentLog:
+    """
+    Output of a running Deployment
+
+    Keeps at most ``limit`` characters of the most recent output, followers
+    read from the same buffer, so memory does not grow with the number of
+    clients or the length of the deployment.
+    """
+
+    def __init__(self, limit: int = DEPLOY_LOG_LIMIT):
+        self.limit = limit
+        self.chunks: deque[tuple[int, str, str]] = deque()
+        self.size = 0
+        self.seq = 0
+        self.truncated = False
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def write(self, stream: str, text: str):
+        """append output of a stream (stdout, stderr, info)"""
+        if not text:
+            return
+        self.seq += 1
+        self.chunks.append((self.seq, stream, text))
+        self.size += len(text)
+        while self.size > self.limit and len(self.chunks) > 1:
+            _seq, _stream, dropped = self.chunks.popleft()
+            self.size -= len(dropped)
+            self.truncated = True
+        self._notify()
+
+    def close(self):
+        self.closed = True
+        self._notify()
+
+    def text(self) -> str:
+        """retained output"""
+        output = ''.join(text for _seq, _stream, text in self.chunks)
+        return f'{TRUNCATED}{output}' if self.truncated else output
+
+    async def follow(self, keepalive: float = 15) -> AsyncIterator[tuple[str, str] | None]:
+        """
+        Yield ``(stream, text)`` chunks until the log is closed
+
+        Retained output is replayed first, ``None`` is yielded when nothing was
+        written for ``keepalive`` seconds.
+        """
+        cursor = 0
+        while True:
+            changed = self._changed
+            for seq, stream, text in list(self.chunks):
+                if seq > cursor:
+                    cursor = seq
+                    yield stream, text
+            if self.closed:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive)
+            except TimeoutError:
+                yield None
+
+
+_logs: dict[uuid.UUID, DeploymentLog] = {}
+
+
+def deployment_log(deployment_id: uuid.UUID) -> DeploymentLog:
+    """live log of a deployment, created on first access"""
+    return _logs.setdefault(deployment_id, DeploymentLog())
+
+
+def close_log(deployment_id: uuid.UUID) -> str:
+    """close the live log of a deployment and return its retained output"""
+    log = _logs.pop(deployment_id, None)
+    if log is None:
+        return ''
+    log.close()
+    return log.text()
+
+
+def compress(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'))
+
+
+def decompress(data: bytes | None) -> str:
+    return zlib.decompress(data).decode('utf-8') if data else ''
+
+
+def _store_output(deployment_id: uuid.UUID, output: bytes):
+    with Session(_engine) as db:
+        # never overwrites the output stored when the deployment finished
+        db.exec(update(Deployment)
+                .where(col(Deployment.id) == deployment_id, col(Deployment.status).in_(RUNNING))
+                .values(output=output))
+        db.commit()
+
+
+def append_output(db: Session, deployment_id: uuid.UUID, text: str, limit: int = DEPLOY_LOG_LIMIT) -> bool:
+    """
+    Append to the stored output of a running deployment, keeping at most ``limit`` characters
+
+    :return: False if the deployment is not running anymore
+    """
+    while True:
+        row = db.exec(select(Deployment.status, Deployment.output).where(Deployment.id == deployment_id)).first()
+        if row is None or row.status not in RUNNING:
+            return False
+        output = decompress(row.output).removeprefix(TRUNCATED) + text
+        if len(output) > limit:
+            output = f'{TRUNCATED}{output[-limit:]}'
+        # appends of other workers in between are not overwritten, the next attempt includes them
+        unchanged = col(Deployment.output).is_(None) if row.output is None else Deployment.output == row.output
+        result = db.exec(update(Deployment)
+                         .where(col(Deployment.id) == deployment_id, col(Deployment.status).in_(RUNNING), unchanged)
+                         .values(output=compress(output)))
+        db.commit()
+        if result.rowcount:
+            return True
+
+
+async def checkpoint_log(deployment_id: uuid.UUID, log: DeploymentLog, interval: float = DEPLOY_LOG_FLUSH):
+    """store snapshots of a running deployment's output until its log is closed"""
+    stored = 0
+    while not log.closed:
+        await asyncio.sleep(interval)
+        if log.seq != stored:
+            stored = log.seq
+            output = await asyncio.to_thread(compress, log.text())
+            await asyncio.to_thread(_store_output, deployment_id, output)
+
+
+def _stored(deployment_id: uuid.UUID) -> tuple[str, bytes | None]:
+    with Session(_engine) as db:
+        deployment = db.get(Deployment, deployment_id)
+        return deployment.status, deployment.output
+
+
+async def follow_stored(deployment_id: uuid.UUID,
+                        keepalive: float = 15,
+                        interval: float = DEPLOY_LOG_FLUSH) -> AsyncIterator[tuple[str, str] | None]:
+    """
+    Yield ``(stream, text)`` of the stored snapshots until the deployment finished
+
+    ``None`` is yielded when nothing changed for ``keepalive`` seconds.
+    """
+    sent, idle = '', 0.0
+    while True:
+        status, output = await asyncio.to_thread(_stored, deployment_id)
+        text = await asyncio.to_thread(decompress, output)
+        if text != sent:
+            # the snapshot dropped output past the limit, it is sent again as a whole
+            yield 'output', text[len(sent):] if text.startswith(sent) else text
+            sent, idle = text, 0.0
+        if status not in RUNNING:
+            return
+        await asyncio.sleep(interval)
+        idle += interval
+        if idle >= keepalive:
+            idle = 0.0
+            yield None
+
+
+def _event(event: str, data: str) -> str:
+    lines = '\n'.join(f'data: {line}' for line in data.splitlines() or [''])
+    return f'event: {event}\n{lines}\n\n'
+
+
+def _status(deployment_id: uuid.UUID) -> str:
+    with Session(_engine) as db:
+        return db.get(Deployment, deployment_id).status
+
+
+async def deployment_events(deployment: Deployment, keepalive: float = 15) -> AsyncIterator[str]:
+    """
+    Server-Sent Events of a deployment's output
+
+    Deployments running on this worker are followed live, those of other
+    workers or not started yet by their stored snapshots, finished ones are
+    replayed from the stored output. The stream ends with an ``end`` event
+    carrying the status.
+    """
+    deployment_id = deployment.id
+    status = deployment.status
+    streamed = False
+
+    log = _logs.get(deployment_id)
+    if log is None and status in RUNNING:
+        async for chunk in follow_stored(deployment_id, keepalive):
+            if chunk is None:
+                yield ': keep-alive\n\n'
+                continue
+            streamed = True
+            yield _event(*chunk)
+        status = _status(deployment_id)
+
+    if log is not None:
+        async for chunk in log.follow(keepalive):
+            if chunk is None:
+                yield ': keep-alive\n\n'
+                # stop following logs that were abandoned, e.g. by a restart
+                status = _status(deployment_id)
+                if status not in RUNNING:
+                    if _logs.get(deployment_id) is log and not log.chunks:
+                        _logs.pop(deployment_id)
+                    break
+                continue
+            streamed = True
+            yield _event(*chunk)
+        status = _status(deployment_id)
+
+    if not streamed:
+        with Session(_engine) as db:
+            output = decompress(db.get(Deployment, deployment_id).output)
+        if output:
+            yield _event('output', output)
+
+    yield _event('end', status)
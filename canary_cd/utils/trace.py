@@ -0,0 +1,55 @@
+"""Deployment Tracing"""
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterator
+
+from canary_cd.database import Deployment, DeploymentSpan, now
+
+
+@contextmanager
+def trace_span(deployment: Deployment | None, stage: str) -> Iterator[DeploymentSpan]:
+    """
+    Time a deployment stage
+
+    The yielded span can be annotated with ``exit_code`` and ``bytes``, it is
+    attached to the deployment when the stage finishes. Without a deployment
+    the span is discarded.
+    """
+    span = DeploymentSpan(stage=stage, started_at=now())
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span.duration = time.perf_counter() - start
+        if deployment is not None:
+            deployment.spans.append(span)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """nearest-rank percentile of a non-empty list"""
+    values = sorted(values)
+    rank = max(math.ceil(q / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def stage_stats(spans: list[DeploymentSpan]) -> list[dict]:
+    """duration statistics per stage, slowest p90 first"""
+    durations = defaultdict(list)
+    for span in spans:
+        durations[span.stage].append(span.duration)
+
+    stats = [
+        {
+            'stage': stage,
+            'count': len(values),
+            'mean': sum(values) / len(values),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': max(values),
+        }
+        for stage, values in durations.items()
+    ]
+    return sorted(stats, key=lambda s: s['p90'], reverse=True)
@@ -0,0 +1,173 @@
+"""Resumable Page Uploads
+
+A payload too large for a single request is uploaded in chunks:
+
+- an upload session reserves a sparse file of the payload size
+- chunks are written at their offset, in any order and in parallel, each is
+  verified with its ``Upload-Checksum`` (``sha256 <base64 digest>``) before it
+  is recorded as received, a chunk failing it discards the received chunks it
+  overlapped
+- an interrupted client asks for the received ranges and sends the rest
+- once every byte is received, the payload is moved out of the session by a
+  single request, verified with its checksum and handed to the page
+  extraction
+
+Sessions and received chunks are stored in the database, a chunk is a row of
+its own so parallel chunks of several workers never overwrite each other.
+Unfinished uploads are removed after ``UPLOAD_EXPIRY`` hours.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import AsyncIterator
+
+from sqlmodel import Session, select, col
+
+from canary_cd.database import Page, Upload, UploadChunk, now
+from canary_cd.settings import logger, UPLOAD_CACHE, UPLOAD_EXPIRY
+
+
+def upload_path(upload_id: uuid.UUID) -> Path:
+    return UPLOAD_CACHE / str(upload_id)
+
+
+def parse_checksum(header: str | None) -> bytes | None:
+    """digest of an ``Upload-Checksum: sha256 <base64>`` header, raises ValueError if not sha256"""
+    if not header:
+        return None
+    algorithm, _, digest = header.partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise ValueError(f"Unsupported checksum algorithm {algorithm}")
+    return base64.b64decode(digest)
+
+
+def expire_uploads(db: Session, hours: float = UPLOAD_EXPIRY):
+    """remove unfinished uploads not written to for ``hours``"""
+    expired = db.exec(select(Upload).where(col(Upload.updated_at) < now() - timedelta(hours=hours))).all()
+    for upload in expired:
+        logger.info(f"Upload {upload.id}: expired")
+        remove_upload(db, upload)
+
+
+def create_upload(db: Session, page: Page, size: int, checksum: str | None = None) -> Upload:
+    expire_uploads(db)
+    upload = Upload(page_id=page.id, size=size, checksum=checksum)
+    os.makedirs(UPLOAD_CACHE, exist_ok=True)
+    with open(upload_path(upload.id), 'wb') as f:
+        f.truncate(size)
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    return upload
+
+
+def remove_upload(db: Session, upload: Upload):
+    upload_path(upload.id).unlink(missing_ok=True)
+    db.delete(upload)
+    db.commit()
+
+
+async def write_chunk(upload: Upload, offset: int, stream: AsyncIterator[bytes]) -> tuple[int, bytes]:
+    """
+    Write a chunk at its offset
+
+    :return: bytes written and their sha256, nothing past the upload size is written
+    """
+    digest = hashlib.sha256()
+    written = 0
+    fd = os.open(upload_path(upload.id), os.O_WRONLY)
+    try:
+        async for data in stream:
+            data = data[:max(upload.size - offset - written, 0)]
+            await asyncio.to_thread(os.pwrite, fd, data, offset + written)
+            digest.update(data)
+            written += len(data)
+    finally:
+        os.close(fd)
+    return written, digest.digest()
+
+
+def add_chunk(db: Session, upload: Upload, offset: int, length: int):
+    db.add(UploadChunk(upload_id=upload.id, offset=offset, length=length))
+    upload.updated_at = now()
+    db.add(upload)
+    db.commit()
+
+
+def discard_range(db: Session, upload: Upload, offset: int, length: int):
+    """forget the chunks a failed write overlapped, their bytes may be overwritten"""
+    for chunk in db.exec(select(UploadChunk)
+                         .where(UploadChunk.upload_id == upload.id)
+                         .where(UploadChunk.offset < offset + length)
+                         .where(UploadChunk.offset + UploadChunk.length > offset)).all():
+        db.delete(chunk)
+    db.commit()
+
+
+def received_ranges(db: Session, upload: Upload) -> list[tuple[int, int]]:
+    """merged ``(start, end)`` byte ranges received"""
+    chunks = db.exec(select(UploadChunk.offset, UploadChunk.length)
+                     .where(UploadChunk.upload_id == upload.id)
+                     .order_by(UploadChunk.offset)).all()
+    ranges = []
+    for offset, length in chunks:
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], offset + length))
+        else:
+            ranges.append((offset, offset + length))
+    return ranges
+
+
+def received_offset(ranges: list[tuple[int, int]]) -> int:
+    """bytes received without a gap from the start"""
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def missing_ranges(ranges: list[tuple[int, int]], size: int) -> list[tuple[int, int]]:
+    missing, position = [], 0
+    for start, end in ranges:
+        if start > position:
+            missing.append((position, start))
+        position = max(position, end)
+    if position < size:
+        missing.append((position, size))
+    return missing
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while data := f.read(1024 * 1024):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def payload_path(temp_dir: tempfile.TemporaryDirectory) -> Path:
+    return Path(temp_dir.name) / 'stream-upload'
+
+
+def claim_payload(upload: Upload) -> tempfile.TemporaryDirectory | None:
+    """
+    Move the payload to a directory for ``extract_page``
+
+    :return: the directory, None if another request moved the payload first
+    """
+    temp_dir = tempfile.TemporaryDirectory(dir=UPLOAD_CACHE, delete=False)
+    try:
+        # atomic, a single request of several finishing the same upload gets the payload
+        os.rename(upload_path(upload.id), payload_path(temp_dir))
+    except FileNotFoundError:
+        temp_dir.cleanup()
+        return None
+    return temp_dir
+
+
+def release_payload(upload: Upload, temp_dir: tempfile.TemporaryDirectory):
+    """return a claimed payload to its upload"""
+    os.rename(payload_path(temp_dir), upload_path(upload.id))
+    temp_dir.cleanup()
@@ -0,0 +1,136 @@
+"""Remote Agent Tests"""
+import tempfile
+from pathlib import Path
+
+import git
+
+from context import *
+from canary_cd.agent import DeployAgent
+from canary_cd.dependencies import ch
+from canary_cd.utils import stream
+from test_deploy import fake_docker_fixture  # noqa: F401 pylint: disable=unused-import
+
+AUTHOR = git.Actor('canary', 'canary@example.com')
+
+
+@pytest.fixture(name='upstream', scope='module')
+def upstream_fixture():
+    """local upstream repository with a compose manifest"""
+    temp_dir = tempfile.TemporaryDirectory()
+    work = git.Repo.init(Path(temp_dir.name, 'work'), initial_branch='main')
+    Path(work.working_dir, 'compose.yml').write_text('services: {}')
+    work.index.add(['compose.yml'])
+    work.index.commit('initial commit', author=AUTHOR, committer=AUTHOR)
+    bare = work.clone(Path(temp_dir.name, 'upstream.git'), bare=True)
+    yield f'file://{bare.git_dir}'
+    temp_dir.cleanup()
+
+
+@pytest.fixture(name='agents')
+async def agents_fixture(client: AsyncClient):
+    """two agents on this machine, each with its own repository cache"""
+    temp_dir = tempfile.TemporaryDirectory()
+    agents = {}
+    for name, labels in [('agent-eu', 'eu,gpu'), ('agent-us', 'us')]:
+        response = await client.post('/agent', json={'name': name, 'labels': labels})
+        assert response.status_code == 201
+        agents[name] = DeployAgent(controller='http://test',
+                                   token=response.json()['token'],
+                                   repo_cache=Path(temp_dir.name, name),
+                                   log_interval=0.05,
+                                   transport=ASGITransport(app=app))
+    yield agents
+    for name, agent in agents.items():
+        await agent.close()
+        await client.delete(f'/agent/{name}')
+    temp_dir.cleanup()
+
+
+def add_project(session: Session, name: str, remote: str, variables: dict, **pin) -> Project:
+    project = Project(name=name, remote=remote, branch='main', **pin)
+    session.add(project)
+    for key, value in variables.items():
+        session.add(Secret(project=project, key=key, encrypted=ch.seal(value)))
+    session.commit()
+    return project
+
+
+@pytest.mark.anyio
+async def test_agents_pull_pinned_deployments(client: AsyncClient, session: Session, agents, upstream, fake_docker):
+    _repo_path, variables, calls = fake_docker
+    eu = add_project(session, 'agent-eu-project', upstream, variables, agent='agent-eu')
+    us = add_project(session, 'agent-us-project', upstream, variables, agent_label='us')
+
+    # the controller leaves pinned deployments queued
+    deployment_ids = {}
+    for project in [eu, us]:
+        response = await client.get(f'/deploy/{project.name}/start')
+        deployment_ids[project.name] = response.json()['deployment']
+        response = await client.get(f"/deployment/{deployment_ids[project.name]}")
+        assert response.json()['status'] == 'queued'
+
+    # each agent only gets the projects pinned to it
+    assert await agents['agent-us'].run_once()
+    assert not await agents['agent-us'].run_once()
+    assert await agents['agent-eu'].run_once()
+    assert not await agents['agent-eu'].run_once()
+
+    for name, agent_name in [(eu.name, 'agent-eu'), (us.name, 'agent-us')]:
+        response = await client.get(f"/deployment/{deployment_ids[name]}")
+        data = response.json()
+        assert data['status'] == 'success'
+        assert data['agent'] == agent_name
+        assert data['commit']
+        assert {'git_fetch', 'git_checkout', 'compose_up'} <= {span['stage'] for span in data['spans']}
+        assert 'Deploying' in data['output']
+        assert (agents[agent_name].repo_cache / name / 'compose.yml').is_file()
+    assert any('up' in call for call in calls())
+
+    response = await client.get('/agent')
+    assert {agent['name']: bool(agent['last_seen']) for agent in response.json()} == {
+        'agent-eu': True, 'agent-us': True,
+    }
+
+    for project in [eu, us]:
+        await client.delete(f'/project/{project.name}')
+
+
+@pytest.mark.anyio
+async def test_agent_job_of_another_agent(client: AsyncClient, session: Session, agents, upstream):
+    project = add_project(session, 'agent-claimed-project', upstream, {}, agent='agent-eu')
+    response = await client.get(f'/deploy/{project.name}/start')
+    deployment_id = response.json()['deployment']
+
+    job = await agents['agent-eu'].claim()
+    assert str(job.deployment) == deployment_id
+    # only the claiming agent reports on a job
+    assert not await agents['agent-us']._post_log(job.deployment, 'output')
+    assert await agents['agent-eu']._post_log(job.deployment, 'output')
+
+    response = await client.post('/agent/jobs/claim')
+    assert response.status_code == 400
+
+    await client.delete(f'/project/{project.name}')
+
+
+@pytest.mark.anyio
+async def test_agent_output_stored(client: AsyncClient, session: Session, agents, upstream):
+    project = add_project(session, 'agent-output-project', upstream, {}, agent='agent-eu')
+    response = await client.get(f'/deploy/{project.name}/start')
+    deployment_id = uuid.UUID(response.json()['deployment'])
+    job = await agents['agent-eu'].claim()
+
+    # posts may reach any worker, followers of every worker read the stored output
+    assert await agents['agent-eu']._post_log(job.deployment, 'first\n')
+    assert await agents['agent-eu']._post_log(job.deployment, 'second\n')
+    assert deployment_id not in stream._logs
+    chunks = stream.follow_stored(deployment_id, keepalive=1, interval=0.01)
+    assert await anext(chunks) == ('output', 'first\nsecond\n')
+    await chunks.aclose()
+
+    # at most the limit is stored
+    assert stream.append_output(session, deployment_id, 'third\n', limit=10)
+    session.expire_all()
+    assert stream.decompress(session.get(Deployment, deployment_id).output) == '[output truncated]\nond\nthird\n'
+
+    await client.delete(f'/project/{project.name}')
@@ -0,0 +1,24 @@
+"""Benchmark Tests"""
+import json
+import subprocess
+from pathlib import Path
+
+from context import *
+
+BENCH = Path(__file__).parent.parent / 'benchmarks' / 'bench.py'
+
+
+def test_benchmarks_quick(tmp_path: Path):
+    output = tmp_path / 'results.json'
+    subprocess.run([sys.executable, BENCH, '--quick', '--output', output],
+                   cwd=tmp_path, env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)), check=True, timeout=300)
+
+    report = json.loads(output.read_text())
+    results = report['results']
+    assert sorted(results) == ['deploys', 'export', 'lists', 'upload', 'webhook']
+    assert results['webhook']['requests_per_second'] > 0
+    assert results['export']['pages'] == 200
+    assert results['upload']['mb_per_second'] > 0
+    assert results['deploys']['count'] == 3
+    # runs in its own data directory
+    assert not (tmp_path / '.env').exists()
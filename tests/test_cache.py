@@ -0,0 +1,105 @@
+"""Repository Cache Tests"""
+import tempfile
+from pathlib import Path
+
+import git
+
+from context import *
+from canary_cd.utils import cache
+from canary_cd.utils.cache import evict
+from canary_cd.utils.mirror import mirror_path, mirror_maintenance
+from canary_cd.utils.tasks import git_pull
+
+AUTHOR = git.Actor('canary', 'canary@example.com')
+
+
+@pytest.fixture(name='upstream', scope='module')
+def upstream_fixture():
+    """local upstream repository with a single commit"""
+    temp_dir = tempfile.TemporaryDirectory()
+    work = git.Repo.init(Path(temp_dir.name, 'work'), initial_branch='main')
+    Path(work.working_dir, 'compose.yml').write_text('cache')
+    work.index.add(['compose.yml'])
+    work.index.commit('initial commit', author=AUTHOR, committer=AUTHOR)
+    bare = work.clone(Path(temp_dir.name, 'upstream.git'), bare=True)
+    yield f'file://{bare.git_dir}'
+    temp_dir.cleanup()
+
+
+@pytest.fixture(name='clones')
+async def clones_fixture(session: Session, upstream: str):
+    """clone of a project and of a deleted project, sharing a mirror"""
+    project = Project(name='cache-project', remote=upstream, branch='main')
+    session.add(project)
+    session.commit()
+    paths = [settings.REPO_CACHE / 'cache-project', settings.REPO_CACHE / 'cache-deleted']
+    for path in paths:
+        assert await git_pull(path, upstream, 'main', None, None)
+    yield paths
+    session.delete(project)
+    session.commit()
+
+
+def ours(evicted: list[Path], upstream: str) -> list[Path]:
+    """evicted paths of these tests, mirrors other tests left behind are orphans"""
+    return [path for path in evicted if path.name.startswith('cache-') or path == mirror_path(upstream)]
+
+
+def containers(*names: str):
+    """docker stand-in, knows containers of the named clones and of every clone of other tests"""
+    async def containers_exist(path: Path) -> bool:
+        return path.name in names or not path.name.startswith('cache-')
+    return containers_exist
+
+
+@pytest.mark.anyio
+async def test_cache_usage(client: AsyncClient, clones: list[Path], upstream: str):
+    response = await client.get('/cache')
+    assert response.status_code == 200
+    usage = response.json()
+
+    clone = {entry['name']: entry for entry in usage['clones']}
+    assert clone['cache-project']['projects'] == ['cache-project']
+    assert clone['cache-deleted']['projects'] == []
+    assert clone['cache-project']['mirror'] == mirror_path(upstream).name
+    mirror = {entry['name']: entry for entry in usage['mirrors']}[mirror_path(upstream).name]
+    assert mirror['projects'] == ['cache-project'] and mirror['bytes'] > 0
+    assert usage['total'] == sum(entry['bytes'] for entry in usage['clones'] + usage['mirrors'])
+
+
+@pytest.mark.anyio
+async def test_evict_deleted_projects(session: Session, clones: list[Path], upstream: str, monkeypatch):
+    project_clone, deleted_clone = clones
+
+    # containers still reference the clone of the deleted project
+    monkeypatch.setattr(cache, 'containers_exist', containers('cache-deleted'))
+    assert ours(await evict(session, budget=0), upstream) == []
+
+    monkeypatch.setattr(cache, 'containers_exist', containers())
+    assert ours(await evict(session, budget=0), upstream) == [deleted_clone]
+    assert project_clone.exists() and mirror_path(upstream).exists()
+
+
+@pytest.mark.anyio
+async def test_evict_idle_over_budget(session: Session, clones: list[Path], upstream: str, monkeypatch):
+    project_clone, deleted_clone = clones
+    monkeypatch.setattr(cache, 'containers_exist', containers('cache-deleted'))
+
+    # recently deployed projects are kept over the budget
+    assert ours(await evict(session, budget=1, idle_days=7), upstream) == []
+
+    # idle ones are evicted with the mirror no clone borrows from anymore
+    assert ours(await evict(session, budget=1, idle_days=0), upstream) == [project_clone]
+    assert deleted_clone.exists() and mirror_path(upstream).exists()
+
+    monkeypatch.setattr(cache, 'containers_exist', containers())
+    assert ours(await evict(session, budget=1, idle_days=0), upstream) == [deleted_clone, mirror_path(upstream)]
+
+
+@pytest.mark.anyio
+async def test_mirror_maintenance(clones: list[Path], upstream: str):
+    mirror = mirror_path(upstream)
+    assert await mirror_maintenance(mirror)
+    assert (mirror / 'objects' / 'info' / 'commit-graph').exists() or \
+           (mirror / 'objects' / 'info' / 'commit-graphs').exists()
+    assert git.Repo(clones[0]).git.log('--format=%s') == 'initial commit'
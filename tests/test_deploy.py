@@ -0,0 +1,547 @@
+"""Deployment Tests"""
+import asyncio
+import json
+from pathlib import Path
+
+import git
+from sqlalchemy import update
+
+from context import *
+from canary_cd.utils import tasks
+from canary_cd.utils.canary import add_canary, parse_steps, slot_conflicts, slot_projects
+from canary_cd.utils.httpd_conf import TraefikConfig
+from canary_cd.utils.lease import lease
+from canary_cd.utils.stream import DeploymentLog, checkpoint_log, compress, follow_stored
+from canary_cd.utils.tasks import service_deploy, canary_deploy
+
+TEST_NAME = 'deploy-test'
+TEST_PROJECT = {'name': TEST_NAME, 'remote': 'git@github.com:github/example.git', 'branch': 'main'}
+
+
+@pytest.fixture(name='create_deployments_dummy', scope='module')
+def create_deployments_dummy_fixture(session: Session):
+    project = Project(**TEST_PROJECT)
+    session.add(project)
+    for i in range(1, 11):
+        deployment = Deployment(project=project, status='success', duration=i + 1.0)
+        deployment.spans = [
+            DeploymentSpan(stage='git_fetch', duration=float(i), exit_code=0, bytes=1024),
+            DeploymentSpan(stage='compose_up', duration=0.1 * i, exit_code=0),
+        ]
+        session.add(deployment)
+    session.commit()
+    yield
+    session.delete(project)
+    session.commit()
+
+
+class TestDeployAPI:
+    @pytest.mark.anyio
+    @pytest.mark.usefixtures('create_deployments_dummy')
+    async def test_deploy_traces(self, client: AsyncClient):
+        response = await client.get(f'/deploy/{TEST_NAME}/traces', params={'limit': 5})
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 5
+        assert data[0]['status'] == 'success'
+        assert {span['stage'] for span in data[0]['spans']} == {'git_fetch', 'compose_up'}
+
+    @pytest.mark.anyio
+    @pytest.mark.usefixtures('create_deployments_dummy')
+    async def test_deploy_stats(self, client: AsyncClient):
+        response = await client.get(f'/deploy/{TEST_NAME}/stats')
+        assert response.status_code == 200
+        data = response.json()
+        assert data['deployments'] == 10
+
+        slowest = data['stages'][0]
+        assert slowest['stage'] == 'git_fetch'
+        assert slowest['count'] == 10
+        assert slowest['p50'] == 5.0
+        assert slowest['p90'] == 9.0
+        assert slowest['max'] == 10.0
+
+    @pytest.mark.anyio
+    async def test_deploy_stats_invalid_project(self, client: AsyncClient):
+        response = await client.get('/deploy/does-not-exist/stats')
+        assert response.status_code == 404
+        assert response.json()['detail'] == 'Project not found'
+
+    @pytest.mark.anyio
+    @pytest.mark.usefixtures('create_deployments_dummy')
+    async def test_deploy_history(self, client: AsyncClient, session: Session):
+        # project without remote, deployment fails right away
+        session.add(Project(name='deploy-history'))
+        session.commit()
+
+        response = await client.get('/deploy/deploy-history/start')
+        assert response.status_code == 200
+        deployment_id = response.json()['deployment']
+
+        response = await client.get(f'/deployment/{deployment_id}')
+        assert response.status_code == 200
+        data = response.json()
+        assert data['status'] == 'failed'
+        assert 'No Remote Found' in data['output']
+
+        response = await client.get(f'/deployment/{deployment_id}/stream')
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/event-stream')
+        assert 'No Remote Found' in response.text
+        assert response.text.endswith('event: end\ndata: failed\n\n')
+
+        response = await client.delete('/project/deploy-history')
+        assert response.status_code == 200
+
+    @pytest.mark.anyio
+    async def test_deployment_does_not_exist(self, client: AsyncClient):
+        response = await client.get(f'/deployment/{uuid.uuid4()}/stream')
+        assert response.status_code == 404
+        assert response.json()['detail'] == 'Deployment not found'
+
+
+@pytest.mark.anyio
+async def test_deployment_log_follow():
+    log = DeploymentLog(limit=10)
+    log.write('stdout', 'first\n')
+
+    async def follow():
+        return [chunk async for chunk in log.follow(keepalive=1)]
+
+    follower = asyncio.create_task(follow())
+    await asyncio.sleep(0)
+    log.write('stderr', 'second\n')
+    log.close()
+
+    assert await follower == [('stdout', 'first\n'), ('stderr', 'second\n')]
+    # retained output is bounded by the limit
+    assert log.text() == '[output truncated]\nsecond\n'
+
+
+@pytest.mark.anyio
+async def test_deployment_events_of_other_worker(session: Session):
+    project = Project(name='stream-test', branch='main')
+    deployment = Deployment(project=project, status='running')
+    session.add(deployment)
+    session.commit()
+    session.refresh(deployment)
+
+    # held by the deploying worker, running deployments of a project without owner are failed
+    async with lease(f'deploy:{project.id}') as owned:
+        assert owned
+        # the deploying worker's log is not registered in this one
+        log = DeploymentLog()
+        checkpoint = asyncio.create_task(checkpoint_log(deployment.id, log, interval=0.01))
+        log.write('stdout', 'first\n')
+
+        async def follow():
+            return [chunk async for chunk in follow_stored(deployment.id, keepalive=1, interval=0.01) if chunk]
+
+        follower = asyncio.create_task(follow())
+        await asyncio.sleep(0.1)
+        log.write('stdout', 'second\n')
+        await asyncio.sleep(0.1)
+        log.close()
+        checkpoint.cancel()
+        session.exec(update(Deployment).where(Deployment.id == deployment.id)
+                     .values(status='success', output=compress(log.text() + 'done\n')))
+        session.commit()
+
+        chunks = await asyncio.wait_for(follower, 5)
+    # output is followed while it is written, without being sent twice
+    assert len(chunks) > 1
+    assert ''.join(text for _stream, text in chunks) == 'first\nsecond\ndone\n'
+
+    session.delete(project)
+    session.commit()
+
+
+FAKE_DOCKER = '''#!/bin/sh
+echo "$@" >> "$FAKE_DOCKER_CALLS"
+case "$*" in
+  *"config --hash"*) printf "$FAKE_DOCKER_HASHES" ;;
+  *"config --format json"*) printf '%s' "$FAKE_DOCKER_CONFIG" ;;
+  *"ps --all --format json"*) printf '%s' "$FAKE_DOCKER_PS" ;;
+  "pull --quiet missing"*|"pull --quiet local"*) exit 1 ;;
+  "image inspect --format . missing"*) exit 1 ;;
+  "image inspect"*) shift 4; for image in "$@"; do echo "sha256:$(echo $image | md5sum | cut -c1-32)"; done ;;
+esac
+'''
+
+
+@pytest.fixture(name='fake_docker')
+def fake_docker_fixture():
+    """repository with a manifest and a docker stand-in recording its calls"""
+    temp_dir = tempfile.TemporaryDirectory()
+    root = Path(temp_dir.name)
+    (root / 'bin').mkdir()
+    (root / 'bin' / 'docker').write_text(FAKE_DOCKER)
+    (root / 'bin' / 'docker').chmod(0o755)
+    (root / 'repo').mkdir()
+    (root / 'repo' / 'compose.yml').write_text('services: {}')
+    variables = {
+        'PATH': f"{root / 'bin'}:{os.environ['PATH']}",
+        'FAKE_DOCKER_CALLS': str(root / 'calls'),
+        'FAKE_DOCKER_HASHES': 'web 2222\\ndb 1111\\nworker 3333\\n',
+        'FAKE_DOCKER_CONFIG': '',
+        'FAKE_DOCKER_PS': '',
+    }
+    yield root / 'repo', variables, lambda: (root / 'calls').read_text().splitlines()
+    temp_dir.cleanup()
+
+
+@pytest.mark.anyio
+async def test_service_deploy_recreates_changed(fake_docker):
+    repo_path, variables, calls = fake_docker
+    deployment = Deployment()
+
+    deployed, _out = await service_deploy(repo_path, variables, 'main', deployment,
+                                          previous_hashes={'web': '1234', 'db': '1111'})
+    assert deployed
+    assert deployment.services == {'web': '2222', 'db': '1111', 'worker': '3333'}
+    assert [call for call in calls() if ' up ' in call] == [
+        'compose -f compose.yml up -d --no-recreate',
+        'compose -f compose.yml up -d --force-recreate --no-deps web',
+    ]
+
+
+@pytest.mark.anyio
+async def test_service_deploy_first_deployment(fake_docker):
+    repo_path, variables, calls = fake_docker
+
+    deployed, _out = await service_deploy(repo_path, variables, 'main')
+    assert deployed
+    assert [call for call in calls() if ' up ' in call] == ['compose -f compose.yml up -d --force-recreate']
+
+
+@pytest.mark.anyio
+async def test_service_deploy_pulls_images_first(fake_docker):
+    repo_path, variables, calls = fake_docker
+    variables['FAKE_DOCKER_CONFIG'] = json.dumps({'services': {
+        'web': {'image': 'nginx:latest'},
+        'db': {'image': 'postgres:17'},
+        'worker': {'image': 'worker:local', 'build': {'context': '.'}},
+    }})
+    deployment = Deployment()
+    log = DeploymentLog()
+
+    deployed, _out = await service_deploy(repo_path, variables, 'main', deployment, log)
+    assert deployed
+
+    pulls = [call for call in calls() if call.startswith('pull')]
+    assert sorted(pulls) == ['pull --quiet nginx:latest', 'pull --quiet postgres:17']
+    assert max(calls().index(call) for call in pulls) < calls().index('compose -f compose.yml up -d --force-recreate')
+    assert '(2/2)' in log.text()
+
+    # image ids are part of the service hash, the built worker image is not pulled
+    assert deployment.services['web'].startswith('2222-')
+    assert deployment.services['worker'].startswith('3333-')
+    assert 'pull --quiet worker:local' not in calls()
+
+
+@pytest.mark.anyio
+async def test_service_deploy_pull_failure(fake_docker):
+    repo_path, variables, calls = fake_docker
+    variables['FAKE_DOCKER_CONFIG'] = json.dumps({'services': {'web': {'image': 'missing:latest'}}})
+
+    deployed, out = await service_deploy(repo_path, variables, 'main')
+    assert not deployed
+    assert out == 'Pulling images failed, nothing deployed'
+    assert not [call for call in calls() if ' up ' in call]
+
+
+@pytest.mark.anyio
+async def test_service_deploy_local_images(fake_docker):
+    repo_path, variables, calls = fake_docker
+    variables['FAKE_DOCKER_CONFIG'] = json.dumps({'services': {
+        'web': {'image': 'local:dev'},  # tagged locally, not in a registry
+        'db': {'image': 'postgres:17', 'pull_policy': 'missing'},
+        'worker': {'image': 'local:worker', 'pull_policy': 'never'},
+    }})
+
+    deployed, _out = await service_deploy(repo_path, variables, 'main')
+    assert deployed
+    assert [call for call in calls() if call.startswith('pull')] == ['pull --quiet local:dev']
+    assert 'compose -f compose.yml up -d --force-recreate' in calls()
+
+    # pull_policy: never does not deploy an image that is not available locally
+    variables['FAKE_DOCKER_CONFIG'] = json.dumps({'services': {
+        'web': {'image': 'missing:dev', 'pull_policy': 'never'},
+    }})
+    Path(variables['FAKE_DOCKER_CALLS']).unlink()
+    deployed, out = await service_deploy(repo_path, variables, 'main')
+    assert not deployed and out == 'Pulling images failed, nothing deployed'
+    assert not [call for call in calls() if call.startswith('pull')]
+
+
+@pytest.mark.anyio
+async def test_deploy_stop_and_status_of_slots(fake_docker, monkeypatch):
+    repo_path, variables, calls = fake_docker
+    for key, value in variables.items():
+        monkeypatch.setenv(key, value)
+    canary = Canary(fqdn='slots.example.com', service='web', active='blue', candidate='green')
+
+    await tasks.deploy_status(repo_path, 'main', slot_projects(canary, 'app'))
+    await tasks.deploy_stop(repo_path, slot_projects(canary, 'app'))
+    assert calls() == [
+        'compose -p app-blue -f compose.yml ps --format json',
+        'compose -p app-blue -f compose.yml logs --tail=25',
+        'compose -p app-green -f compose.yml ps --format json',
+        'compose -p app-green -f compose.yml logs --tail=25',
+        'compose -p app-blue down',
+        'compose -p app-green down',
+    ]
+
+    # projects without slots
+    Path(variables['FAKE_DOCKER_CALLS']).unlink()
+    await tasks.deploy_stop(repo_path, slot_projects(None, 'app'))
+    assert calls() == ['compose down']
+
+
+@pytest.mark.anyio
+async def test_service_deploy_builds_images(fake_docker):
+    repo_path, variables, calls = fake_docker
+    (repo_path / 'app').mkdir()
+    (repo_path / 'app' / 'Dockerfile').write_text('FROM scratch')
+    variables['FAKE_DOCKER_CONFIG'] = json.dumps({'name': 'repo', 'services': {
+        'web': {'build': {'context': str(repo_path / 'app'), 'dockerfile': 'Dockerfile'}},
+        'worker': {'image': 'worker:local', 'build': {'context': str(repo_path / 'app'), 'target': 'worker'}},
+    }})
+    deployment = Deployment()
+
+    deployed, _out = await service_deploy(repo_path, variables, 'main', deployment)
+    assert deployed
+    builds = sorted(call for call in calls() if call.startswith('buildx build'))
+    assert len(builds) == 2
+    assert builds[0].startswith('buildx build --tag repo-web --load --file ')
+    assert '--target worker' in builds[1]
+    assert f"--cache-to type=local,dest={settings.BUILD_CACHE / 'repo' / 'web'}.new,mode=max" in builds[0]
+    assert set(deployment.builds) == {'web', 'worker'}
+
+    # unchanged contexts with existing images are not built again
+    previous_builds = deployment.builds
+    Path(variables['FAKE_DOCKER_CALLS']).unlink()
+    deployed, _out = await service_deploy(repo_path, variables, 'main', deployment, previous_builds=previous_builds)
+    assert deployed
+    assert not [call for call in calls() if call.startswith('buildx build')]
+
+    (repo_path / 'app' / 'Dockerfile').write_text('FROM alpine')
+    deployed, _out = await service_deploy(repo_path, variables, 'main', deployment, previous_builds=previous_builds)
+    assert len([call for call in calls() if call.startswith('buildx build')]) == 2
+
+
+@pytest.mark.anyio
+async def test_context_hash_outside_git(tmp_path: Path):
+    (tmp_path / 'Dockerfile').write_text('FROM scratch')
+    digest = await tasks.context_hash(tmp_path, {'context': '.'})
+    assert digest == await tasks.context_hash(tmp_path, {})
+
+    (tmp_path / 'Dockerfile').write_text('FROM alpine')
+    assert await tasks.context_hash(tmp_path, {}) != digest
+
+
+@pytest.mark.anyio
+async def test_context_hash_of_git_tree(tmp_path: Path):
+    repo = git.Repo.init(tmp_path, initial_branch='main')
+    author = git.Actor('Canary', 'canary@example.com')
+    (tmp_path / '.docker').mkdir()
+    (tmp_path / '.docker' / 'Dockerfile').write_text('FROM scratch')
+    (tmp_path / 'Dockerfile').write_text('FROM scratch')
+    repo.index.add(['.docker/Dockerfile', 'Dockerfile'])
+    repo.index.commit('build', author=author, committer=author)
+
+    root = await tasks.context_hash(tmp_path, {'context': '.'})
+    docker = await tasks.context_hash(tmp_path, {'context': '.docker'})
+    assert root != docker
+
+    # uncommitted changes are not part of the tree
+    (tmp_path / '.docker' / 'Dockerfile').write_text('FROM alpine')
+    assert await tasks.context_hash(tmp_path, {'context': '.docker'}) == docker
+    repo.index.add(['.docker/Dockerfile'])
+    repo.index.commit('update', author=author, committer=author)
+    assert await tasks.context_hash(tmp_path, {'context': '.docker'}) != docker
+
+    # contexts not committed yet are hashed file by file
+    (tmp_path / 'app').mkdir()
+    (tmp_path / 'app' / 'Dockerfile').write_text('FROM scratch')
+    untracked = await tasks.context_hash(tmp_path, {'context': 'app'})
+    (tmp_path / 'app' / 'Dockerfile').write_text('FROM alpine')
+    assert await tasks.context_hash(tmp_path, {'context': 'app'}) != untracked
+
+
+@pytest.mark.anyio
+async def test_service_deploy_unhealthy(fake_docker):
+    repo_path, variables, _calls = fake_docker
+    variables['FAKE_DOCKER_PS'] = '\n'.join(json.dumps(container) for container in [
+        {'Name': 'app-web-1', 'State': 'running', 'Health': 'unhealthy'},
+        {'Name': 'app-migrate-1', 'State': 'exited', 'Health': '', 'ExitCode': 0},
+    ])
+    deployment = Deployment()
+
+    deployed, out = await service_deploy(repo_path, variables, 'main', deployment)
+    assert not deployed
+    assert 'Unhealthy containers: app-web-1' in out
+    assert [span.exit_code for span in deployment.spans if span.stage == 'health'] == [1]
+
+
+@pytest.mark.anyio
+async def test_wait_healthy_deadline(fake_docker):
+    repo_path, variables, _calls = fake_docker
+    variables['FAKE_DOCKER_PS'] = json.dumps([{'Name': 'app-web-1', 'State': 'running', 'Health': 'starting'}])
+
+    healthy, reason = await tasks.wait_healthy('docker compose', repo_path, variables, timeout=0.2, interval=0.1)
+    assert not healthy
+    assert reason == 'Containers not healthy after 0.2s: app-web-1'
+
+    variables['FAKE_DOCKER_PS'] = json.dumps([{'Name': 'app-web-1', 'State': 'running', 'Health': 'healthy'}])
+    assert await tasks.wait_healthy('docker compose', repo_path, variables, timeout=0) == (True, '1 containers healthy')
+
+
+@pytest.mark.anyio
+async def test_rollback(fake_docker, session: Session):
+    repo_path, variables, calls = fake_docker
+    repo = git.Repo.init(repo_path, initial_branch='main')
+    author = git.Actor('Canary', 'canary@example.com')
+    repo.index.add(['compose.yml'])
+    good = repo.index.commit('good', author=author, committer=author).hexsha
+    (repo_path / 'compose.yml').write_text('services: {web: {image: nginx:latest}}')
+    repo.index.add(['compose.yml'])
+    bad = repo.index.commit('bad', author=author, committer=author).hexsha
+
+    project = Project(name='rollback-test', branch='main')
+    session.add(project)
+    session.add(Deployment(project=project, status='success', commit=good,
+                           services={'web': '1111'}, images={'nginx:latest': 'sha256:1234'}))
+    variables['FAKE_DOCKER_HASHES'] = 'web 1111\\n'
+    deployment = Deployment(project=project, status='running', commit=bad, services={'web': '2222'})
+    deployment.spans = [DeploymentSpan(stage='compose_up', duration=0.1, exit_code=1)]
+    session.add(deployment)
+    session.commit()
+
+    # held by the deploying worker, running deployments of a project without owner are failed
+    async with lease(f'deploy:{project.id}') as owned:
+        assert owned
+        assert await tasks.rollback(session, project, repo_path, variables, deployment)
+        assert repo.head.commit.hexsha == good
+        assert 'tag sha256:1234 nginx:latest' in calls()
+        assert not [call for call in calls() if call.startswith('pull')]
+        assert deployment.services == {'web': '1111'}
+        assert [span.stage for span in deployment.spans] == ['compose_up', 'rollback']
+        assert [call for call in calls() if ' up ' in call] == ['compose -f compose.yml up -d --no-recreate',
+                                                                'compose -f compose.yml up -d --force-recreate --no-deps web']
+        session.delete(project)
+        session.commit()
+
+
+@pytest.mark.anyio
+async def test_rollback_after_pull_failure(fake_docker, session: Session):
+    repo_path, variables, calls = fake_docker
+    variables['FAKE_DOCKER_CONFIG'] = json.dumps({'services': {'web': {'image': 'missing'}}})
+    project = Project(name='rollback-pull-test', branch='main')
+    session.add(project)
+    session.add(Deployment(project=project, status='success', commit='1234', services={'web': '1111'}))
+    deployment = Deployment(project=project, status='running')
+    session.add(deployment)
+    session.commit()
+
+    # held by the deploying worker, running deployments of a project without owner are failed
+    async with lease(f'deploy:{project.id}') as owned:
+        assert owned
+        deployed, out = await service_deploy(repo_path, variables, 'main', deployment)
+        assert not deployed
+        assert out == 'Pulling images failed, nothing deployed'
+        # the previous revision is still running
+        assert not await tasks.rollback(session, project, repo_path, variables, deployment)
+        assert not [call for call in calls() if ' up ' in call or call.startswith('tag')]
+        session.delete(project)
+        session.commit()
+
+
+def test_parse_steps():
+    assert parse_steps('50,10') == [10, 50, 100]
+    assert parse_steps('100') == [100]
+    assert parse_steps('') == [100]
+
+
+SLOT_CONFIG = {
+    'services': {'web': {'networks': {'proxy': None}}, 'db': {'volumes': [{'type': 'bind', 'source': '/srv'}]}},
+    'networks': {'proxy': {'name': 'proxy', 'external': True}},
+}
+
+
+def test_slot_conflicts():
+    assert slot_conflicts(SLOT_CONFIG, 'web') == []
+    config = {
+        'services': {'web': {'networks': {'default': None}},
+                     'db': {'container_name': 'db', 'ports': [{'target': 5432, 'published': '5432'}],
+                            'volumes': [{'type': 'volume', 'source': 'data'}]}},
+        'networks': {'default': {'name': 'canary-test-blue_default'}},
+    }
+    assert slot_conflicts(config, 'web') == ['db publishes host ports', 'db sets a container_name',
+                                             'db mounts a named volume', 'web is not attached to an external network']
+    assert slot_conflicts(config, 'app') == ['db publishes host ports', 'db sets a container_name',
+                                             'db mounts a named volume', 'app is not defined']
+
+
+@pytest.mark.anyio
+async def test_canary_deploy_rejects_conflicts(fake_docker, session: Session):
+    repo_path, variables, calls = fake_docker
+    variables['FAKE_DOCKER_CONFIG'] = json.dumps({'services': {'web': {'ports': [{'target': 80, 'published': '80'}]}}})
+    project = Project(name='canary-conflict', branch='main')
+    project.canary = Canary(fqdn='canary-conflict.com', service='web', port=80, steps='50', interval=0)
+    session.add(project)
+    session.commit()
+
+    deployed, out = await canary_deploy(session, project, repo_path, variables)
+    assert not deployed
+    assert 'web publishes host ports' in out
+    assert project.canary.status == 'aborted'
+    assert not any(' up ' in call for call in calls())
+
+    session.delete(project)
+    session.commit()
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures('client')
+async def test_canary_deploy_shifts_traffic(fake_docker, session: Session, monkeypatch):
+    repo_path, variables, calls = fake_docker
+    variables['FAKE_DOCKER_CONFIG'] = json.dumps(SLOT_CONFIG)
+    # retiring a slot runs without the project environment
+    monkeypatch.setenv('PATH', variables['PATH'])
+    monkeypatch.setenv('FAKE_DOCKER_CALLS', variables['FAKE_DOCKER_CALLS'])
+
+    project = Project(name='canary-test', branch='main')
+    project.canary = Canary(fqdn='canary-test.com', service='web', port=8080, steps='50', interval=0)
+    session.add(project)
+    session.commit()
+
+    # the first deployment takes all traffic right away
+    deployed, _out = await canary_deploy(session, project, repo_path, variables)
+    assert deployed
+    assert (project.canary.active, project.canary.status) == ('blue', 'done')
+    assert 'compose -p canary-test-blue -f compose.yml up -d --force-recreate' in calls()
+
+    # the next one starts beside it with the first step
+    deployed, _out = await canary_deploy(session, project, repo_path, variables)
+    assert deployed
+    assert (project.canary.candidate, project.canary.weight, project.canary.status) == ('green', 50, 'shifting')
+
+    tc = TraefikConfig()
+    add_canary(tc, project.canary, project.name)
+    services = tc.render()['http']['services']
+    assert services['canary-service-canary-test']['weighted']['services'] == [
+        {'name': 'canary-service-canary-test-blue', 'weight': 50},
+        {'name': 'canary-service-canary-test-green', 'weight': 50},
+    ]
+    assert services['canary-service-canary-test-green']['loadBalancer']['servers'] == [
+        {'url': 'http://canary-test-green-web-1:8080'}
+    ]
+
+    await asyncio.wait_for(tasks._shifts[project.id], 5)  # pylint: disable=protected-access
+    session.refresh(project.canary)
+    assert (project.canary.active, project.canary.candidate, project.canary.status) == ('green', None, 'done')
+    assert calls()[-1] == 'compose -p canary-test-blue down'
+
+    session.delete(project)
+    session.commit()
@@ -30,3 +30,19 @@ class TestExportAPI:
         assert data['http']['routers'][f'backend-router-{TEST_FQDN}']['rule'] == f'Host(`{TEST_FQDN}`)'
         assert data['http']['services'].get('backend-service-static-pages')
         assert type(data['http']['services']['backend-service-static-pages']['loadBalancer']['servers']) == list
+
+    @pytest.mark.anyio
+    async def test_export_traefik_json_canary(self, client: AsyncClient, session: Session):
+        project = Project(name='export-canary')
+        project.canary = Canary(fqdn='canary.export-test.com', service='web', active='blue', candidate='green', weight=10)
+        session.add(project)
+        session.commit()
+
+        response = await client.get('/export/traefik.json')
+        session.delete(project)
+        session.commit()
+
+        data = response.json()
+        assert data['http']['routers']['canary-router-export-canary']['rule'] == 'Host(`canary.export-test.com`)'
+        weighted = data['http']['services']['canary-service-export-canary']['weighted']['services']
+        assert [service['weight'] for service in weighted] == [90, 10]
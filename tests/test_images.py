@@ -0,0 +1,140 @@
+"""Docker Image Garbage Collection Tests"""
+import json
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from context import *
+from canary_cd.utils import images
+from canary_cd.utils.images import Image, collectable, image_gc
+
+FAKE_DOCKER = '''#!{python}
+import json, sys
+state = json.load(open({state!r}))
+args = sys.argv[1:]
+if args[:2] == ['image', 'ls']:
+    print('\\n'.join(state['images']))
+elif args[:2] == ['image', 'inspect']:
+    for image_id in args[4:]:
+        image = state['images'][image_id]
+        print(image_id, image['size'], '2020-01-01T00:00:00.123456789Z', ','.join(image['tags']))
+elif args[:2] == ['image', 'rm']:
+    for name in args[2:]:
+        image_id = next(image_id for image_id, image in state['images'].items()
+                        if image_id == name or name in image['tags'])
+        if image_id in state['in_use']:
+            sys.exit('image is being used by a running container')
+        state['images'][image_id]['tags'] = [tag for tag in state['images'][image_id]['tags'] if tag != name]
+        if name == image_id or not state['images'][image_id]['tags']:
+            del state['images'][image_id]
+    json.dump(state, open({state!r}, 'w'))
+'''
+
+
+@pytest.fixture(name='docker_images')
+def docker_images_fixture(monkeypatch):
+    """docker stand-in holding the images of a state file"""
+    temp_dir = tempfile.TemporaryDirectory()
+    root = Path(temp_dir.name)
+    state = root / 'state.json'
+    (root / 'docker').write_text(FAKE_DOCKER.format(python=sys.executable, state=str(state)))
+    (root / 'docker').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{root}:{os.environ['PATH']}")
+    monkeypatch.setattr(images, 'deploy_backlog', lambda db: 0)
+
+    def write(local: dict[str, tuple[int, list[str]]], in_use: list[str] | None = None):
+        state.write_text(json.dumps({'images': {image_id: {'size': size, 'tags': tags}
+                                                for image_id, (size, tags) in local.items()},
+                                     'in_use': in_use or []}))
+
+    yield write, lambda: set(json.loads(state.read_text())['images'])
+    temp_dir.cleanup()
+
+
+@pytest.fixture(name='history')
+def history_fixture(session: Session):
+    """five deployments of a project, each with its own app image"""
+    project = Project(name='image-gc-test', branch='main')
+    session.add(project)
+    for number in range(1, 6):
+        session.add(Deployment(project=project, status='success', created_at=now() + timedelta(seconds=number),
+                               images={f'app:v{number}': f'sha256:app{number}', 'redis:7': 'sha256:redis'}))
+    session.commit()
+    yield project
+    session.delete(project)
+    session.commit()
+
+
+@pytest.mark.anyio
+async def test_image_gc_keeps_recent_deployments(client: AsyncClient, docker_images, history: Project):
+    write, local = docker_images
+    write({
+        **{f'sha256:app{number}': (100, [f'app:v{number}']) for number in range(2, 6)},
+        'sha256:app1': (100, []),  # dangling since app:v1 was pulled again
+        'sha256:redis': (50, ['redis:7']),
+        'sha256:dangling': (10, []),  # not deployed by canary-cd
+        'sha256:traefik': (80, ['traefik:v3']),
+    })
+
+    report = await image_gc(keep=3, budget=0, pause=0)
+    assert sorted(report.removed) == ['sha256:app1', 'sha256:app2']
+    assert report.reclaimed == 200 and report.kept == 4 and report.failed == 0
+    assert local() == {'sha256:app3', 'sha256:app4', 'sha256:app5', 'sha256:redis', 'sha256:traefik',
+                       'sha256:dangling'}
+    assert images.last_report is report
+
+    response = await client.get('/cache/images')
+    assert response.status_code == 200
+    usage = response.json()
+    assert usage['total'] == 440 and usage['collectable'] == 0
+    assert usage['last_run']['reclaimed'] == 200
+    kept = {image['id']: image['projects'] for image in usage['images'] if image['kept']}
+    assert kept == {f'sha256:app{number}': ['image-gc-test'] for number in [3, 4, 5]} | \
+           {'sha256:redis': ['image-gc-test']}
+
+
+@pytest.mark.anyio
+async def test_image_gc_in_use_and_queued(docker_images, history: Project, monkeypatch):
+    write, local = docker_images
+    write({f'sha256:app{number}': (100, [f'app:v{number}']) for number in range(1, 6)}, in_use=['sha256:app1'])
+
+    # images of containers are left to docker
+    report = await image_gc(keep=3, budget=0, pause=0)
+    assert report.removed == ['sha256:app2'] and report.failed == 1
+    assert 'sha256:app1' in local()
+
+    # queued deployments go first
+    monkeypatch.setattr(images, 'deploy_backlog', lambda db: 1)
+    write({f'sha256:app{number}': (100, [f'app:v{number}']) for number in range(1, 6)})
+    assert (await image_gc(keep=3, budget=0, pause=0)).removed == []
+
+
+@pytest.mark.anyio
+async def test_image_gc_keeps_last_success(docker_images, history: Project, session: Session):
+    write, local = docker_images
+    write({f'sha256:app{number}': (100, [f'app:v{number}']) for number in range(1, 6)})
+    for deployment in history.deployments:
+        if deployment.images[next(iter(deployment.images))] in ('sha256:app4', 'sha256:app5'):
+            deployment.status = 'failed'
+            session.add(deployment)
+    session.commit()
+
+    # a rollback redeploys the last successful deployment
+    report = await image_gc(keep=2, budget=0, pause=0)
+    assert sorted(report.removed) == ['sha256:app1', 'sha256:app2']
+    assert local() == {'sha256:app3', 'sha256:app4', 'sha256:app5'}
+
+
+def test_collectable_budget():
+    created = now()
+    local = {
+        'old': Image('old', 100, created - timedelta(days=3), ['app:v1'], {'app'}),
+        'older': Image('older', 100, created - timedelta(days=2), ['app:v2'], {'app'}, created - timedelta(days=5)),
+        'new': Image('new', 100, created - timedelta(days=1), ['app:v3'], {'app'}),
+        'kept': Image('kept', 100, created, ['app:v4'], {'app'}, kept=True),
+        'foreign': Image('foreign', 100, created - timedelta(days=9), ['traefik:v3']),
+    }
+    # least recently deployed first, until the rest fits into the budget
+    assert [image.id for image in collectable(local, budget=150)] == ['older', 'old']
+    assert [image.id for image in collectable(local, budget=300)] == []
+    assert [image.id for image in collectable(local, budget=0)] == ['older', 'old', 'new']
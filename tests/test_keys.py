@@ -0,0 +1,122 @@
+"""Encryption Key Rotation Tests"""
+import asyncio
+import subprocess
+import tempfile
+from pathlib import Path
+
+from cryptography.exceptions import InvalidTag
+
+from context import *
+from canary_cd.dependencies import ch
+from canary_cd.utils.crypto import CryptoHelper, KEY_HEADER, generate_salt, key_version, write_keyring
+from canary_cd.utils.keys import reencrypt
+
+
+def test_salt_shared_by_workers():
+    temp_dir = tempfile.TemporaryDirectory()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), DATA_DIR=temp_dir.name)
+    env.pop('SALT', None)
+    script = 'from canary_cd.settings import get_salt; print(get_salt())'
+    # workers starting at the same time, outside of the repository and its .env
+    workers = [subprocess.Popen([sys.executable, '-c', script], cwd=temp_dir.name, env=env,
+                                stdout=subprocess.PIPE, text=True) for _ in range(4)]
+    salts = {worker.communicate(timeout=30)[0].strip() for worker in workers}
+
+    salt_file = Path(temp_dir.name, 'salt')
+    assert salts == {salt_file.read_text().strip()}
+    assert salt_file.stat().st_mode & 0o777 == 0o600
+    temp_dir.cleanup()
+
+
+def test_seal_with_keyring():
+    temp_dir = tempfile.TemporaryDirectory()
+    keyring = Path(temp_dir.name, 'keyring')
+    salt = generate_salt()
+    worker, other = CryptoHelper(salt, keyring), CryptoHelper(salt, keyring)
+
+    legacy = worker.seal('value')
+    assert key_version(legacy) == 0 and len(legacy) == KEY_HEADER.size + 12 + len('value') + 16
+    assert worker.unseal(legacy) == 'value'
+
+    # a key added by another worker encrypts from the next value on
+    write_keyring(keyring, {1: generate_salt()})
+    assert key_version(other.seal('value')) == 1
+    assert worker.unseal(other.seal('value')) == 'value'
+    assert worker.unseal(legacy) == 'value'
+
+    # the key version is authenticated
+    with pytest.raises(InvalidTag):
+        worker.unseal(KEY_HEADER.pack(0) + other.seal('value')[KEY_HEADER.size:])
+    write_keyring(keyring, {})
+    with pytest.raises(KeyError):
+        worker.unseal(KEY_HEADER.pack(1) + legacy[KEY_HEADER.size:])
+
+    # values of earlier releases
+    nonce, ciphertext = worker.encrypt('value')
+    assert worker.decrypt_record(Secret(key='KEY', nonce=nonce, ciphertext=ciphertext)) == 'value'
+    temp_dir.cleanup()
+
+
+async def reencrypted(client: AsyncClient) -> dict:
+    """key status once every value is sealed with the active key"""
+    for _attempt in range(200):
+        status = (await client.get('/keys')).json()
+        in_use = [version for version, count in status['versions'].items() if count]
+        if not status['running'] and not status['legacy'] and in_use == [str(status['active'])]:
+            return status
+        await asyncio.sleep(0.05)
+    raise TimeoutError(status)
+
+
+@pytest.fixture(name='legacy_values')
+def legacy_values_fixture(session: Session):
+    """auth key and secrets stored by an earlier release"""
+    auth = Auth(name='key-rotation-auth', auth_type='pat', nonce=(pat := ch.encrypt('gh_pat'))[0], ciphertext=pat[1])
+    project = Project(name='key-rotation-test', auth=auth)
+    session.add(project)
+    for number in range(10):
+        nonce, ciphertext = ch.encrypt(f'value {number}')
+        session.add(Secret(project=project, key=f'VAR_{number}', nonce=nonce, ciphertext=ciphertext))
+    session.commit()
+    yield project
+    session.delete(project)
+    session.delete(auth)
+    session.commit()
+
+
+@pytest.mark.anyio
+async def test_rotate_key(client: AsyncClient, session: Session, legacy_values: Project):
+    updated = {secret.id: secret.updated_at for secret in legacy_values.secrets}
+    response = await client.get('/keys')
+    assert response.status_code == 200
+    assert response.json()['active'] == ch.active_version
+
+    # values are re-encrypted in the background
+    response = await client.post('/keys')
+    assert response.status_code == 201
+    version = response.json()['active']
+    assert version == ch.active_version > 0
+
+    status = await reencrypted(client)
+    assert status['versions'][str(version)] >= 11
+
+    session.expire_all()
+    secrets = session.exec(select(Secret).where(Secret.project_id == legacy_values.id)).all()
+    assert all(key_version(secret.encrypted) == version and secret.ciphertext == '' for secret in secrets)
+    assert {secret.id: secret.updated_at for secret in secrets} == updated
+    values = {secret['key']: secret['value'] for secret in (await client.get('/secret/key-rotation-test')).json()}
+    assert values == {f'VAR_{number}': f'value {number}' for number in range(10)}
+    assert ch.decrypt_record(legacy_values.auth) == 'gh_pat'
+
+    # earlier keys no value uses are retired, the active one and the SALT stay
+    assert (await client.delete(f'/keys/{version}')).status_code == 409
+    assert (await client.delete('/keys/0')).status_code == 409
+    for previous in range(1, version):
+        assert (await client.delete(f'/keys/{previous}')).status_code == 200
+    assert sorted(ch.keys()) == [0, version]
+
+
+@pytest.mark.anyio
+async def test_reencrypt_in_batches(legacy_values: Project):
+    assert await reencrypt(batch_size=3, pause=0) >= 11
+    assert await reencrypt(batch_size=3, pause=0) == 0
@@ -0,0 +1,94 @@
+"""Lease Tests"""
+import asyncio
+import subprocess
+
+from sqlmodel import delete
+
+from context import *
+from canary_cd.utils import tasks
+from canary_cd.utils.lease import acquire, renew, release, lease
+
+
+@pytest.mark.anyio
+async def test_lease_acquire_release(session: Session):
+    assert acquire('test:acquire', 'a')
+    assert not acquire('test:acquire', 'b')
+    assert renew('test:acquire', 'a')
+    assert not renew('test:acquire', 'b')
+
+    release('test:acquire', 'b')
+    assert not acquire('test:acquire', 'b')
+    release('test:acquire', 'a')
+    assert acquire('test:acquire', 'b')
+    release('test:acquire', 'b')
+
+
+@pytest.mark.anyio
+async def test_lease_expired_is_taken_over(session: Session):
+    assert acquire('test:expired', 'dead-worker', ttl=-1)
+    assert acquire('test:expired', 'b')
+    # the former owner notices on renewal
+    assert not renew('test:expired', 'dead-worker')
+    release('test:expired', 'b')
+
+
+@pytest.mark.anyio
+async def test_lease_single_owner_across_processes(session: Session):
+    script = 'from canary_cd.utils.lease import acquire; import os; print(acquire("test:processes", str(os.getpid())))'
+    workers = [subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True,
+                                env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+               for _ in range(4)]
+    results = [worker.communicate()[0].strip() for worker in workers]
+    assert sorted(results) == ['False', 'False', 'False', 'True']
+    session.exec(delete(Lease).where(Lease.name == 'test:processes'))
+    session.commit()
+
+
+@pytest.mark.anyio
+async def test_lease_excludes_tasks_of_a_worker(session: Session):
+    async with lease('test:tasks') as first:
+        async with lease('test:tasks') as second:
+            assert first and not second
+    async with lease('test:tasks') as third:
+        assert third
+
+
+@pytest.mark.anyio
+async def test_deploy_queue_single_executor(session: Session, monkeypatch):
+    project = Project(name='lease-test')
+    session.add(project)
+    session.add(Deployment(project=project, status='running'))  # left behind by a stopped worker
+    session.commit()
+    for _ in range(4):
+        session.add(Deployment(project_id=project.id))
+        session.commit()
+
+    running, order = [], []
+
+    async def deploy(_db, _project, deployment, _log):
+        running.append(deployment.id)
+        assert len(running) == 1
+        order.append(deployment.id)
+        await asyncio.sleep(0.05)
+        running.remove(deployment.id)
+        return 'success'
+
+    monkeypatch.setattr(tasks, '_deploy', deploy)
+
+    # three workers, each with its own session
+    async def worker() -> int:
+        with Session(session.get_bind()) as db:
+            return await tasks.deploy_queue(db, project.id)
+
+    counts = await asyncio.gather(*[worker() for _ in range(3)])
+    assert sum(counts) == 4
+
+    session.expire_all()
+    deployments = session.exec(select(Deployment)
+                               .where(Deployment.project_id == project.id)
+                               .order_by(Deployment.created_at)).all()
+    assert [deployment.status for deployment in deployments] == ['failed'] + ['success'] * 4
+    assert order == [deployment.id for deployment in deployments[1:]]
+
+    session.delete(project)
+    session.commit()
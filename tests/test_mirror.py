@@ -0,0 +1,89 @@
+"""Shared Mirror Tests"""
+import tempfile
+from pathlib import Path
+
+import git
+
+from context import *
+from canary_cd.utils.mirror import normalize_remote, mirror_path
+from canary_cd.utils.prefetch import prefetch
+from canary_cd.utils.tasks import git_pull
+
+AUTHOR = git.Actor('canary', 'canary@example.com')
+
+
+@pytest.fixture(name='upstream', scope='module')
+def upstream_fixture():
+    """local upstream repository with a main and a staging branch"""
+    temp_dir = tempfile.TemporaryDirectory()
+    work = git.Repo.init(Path(temp_dir.name, 'work'), initial_branch='main')
+    for branch, content in [('main', 'production'), ('staging', 'staging')]:
+        work.git.checkout('-B', branch)
+        Path(work.working_dir, 'compose.yml').write_text(content)
+        work.index.add(['compose.yml'])
+        work.index.commit(f'{branch} commit', author=AUTHOR, committer=AUTHOR)
+    bare = work.clone(Path(temp_dir.name, 'upstream.git'), bare=True)
+    yield f'file://{bare.git_dir}'
+    temp_dir.cleanup()
+
+
+def test_normalize_remote():
+    keys = {normalize_remote(remote) for remote in [
+        'git@github.com:user/repo.git',
+        'https://github.com/user/repo',
+        'https://token@GitHub.com/user/repo.git/',
+        'ssh://git@github.com/user/repo.git',
+    ]}
+    assert keys == {'github.com/user/repo'}
+    assert normalize_remote('ssh://git@example.com:2222/user/repo.git') == 'example.com:2222/user/repo'
+    assert mirror_path('git@github.com:user/repo.git') == mirror_path('https://github.com/user/repo')
+
+
+@pytest.mark.anyio
+async def test_shared_mirror(upstream: str):
+    prod = settings.REPO_CACHE / 'mirror-prod'
+    staging = settings.REPO_CACHE / 'mirror-staging'
+
+    assert await git_pull(prod, upstream, 'main', None, None)
+    assert await git_pull(staging, upstream, 'staging', None, None)
+
+    assert (prod / 'compose.yml').read_text() == 'production'
+    assert (staging / 'compose.yml').read_text() == 'staging'
+
+    # both projects borrow objects from the same mirror
+    mirror = mirror_path(upstream)
+    for repo_path in [prod, staging]:
+        alternates = (repo_path / '.git' / 'objects' / 'info' / 'alternates').read_text().strip()
+        assert alternates == str(mirror / 'objects')
+    assert set(git.Repo(mirror).git.branch('--format=%(refname:short)').split()) == {'main', 'staging'}
+
+
+@pytest.mark.anyio
+async def test_mirror_invalid_branch(upstream: str):
+    assert not await git_pull(settings.REPO_CACHE / 'mirror-invalid', upstream, 'does-not-exist', None, None)
+
+
+@pytest.mark.anyio
+async def test_prefetch(upstream: str):
+    repo_path = settings.REPO_CACHE / 'mirror-prefetch'
+    assert await git_pull(repo_path, upstream, 'main', None, None)
+
+    # push a new commit upstream
+    temp_dir = tempfile.TemporaryDirectory()
+    work = git.Repo.clone_from(upstream, temp_dir.name, branch='main')
+    Path(work.working_dir, 'compose.yml').write_text('prefetched')
+    work.index.add(['compose.yml'])
+    head = work.index.commit('prefetch commit', author=AUTHOR, committer=AUTHOR)
+    work.remote().push('main')
+    temp_dir.cleanup()
+
+    projects = [
+        Project(name='prefetch-prod', remote=upstream, branch='main'),
+        Project(name='prefetch-staging', remote=upstream, branch='staging'),
+    ]
+    assert await prefetch(projects, jitter=0) == 1
+    assert git.Repo(mirror_path(upstream)).git.rev_parse('refs/heads/main') == head.hexsha
+
+    # deploy only fast-forwards from the warm mirror
+    assert await git_pull(repo_path, upstream, 'main', None, None)
+    assert (repo_path / 'compose.yml').read_text() == 'prefetched'
@@ -0,0 +1,69 @@
+"""Notification Outbox Tests"""
+import json
+
+import httpx
+
+from context import *
+from canary_cd.utils import notify
+
+WEBHOOK = 'https://discord.com/api/webhooks/outbox/test'
+
+
+@pytest.fixture(name='requests')
+def requests_fixture(session: Session):
+    """configure a discord webhook and capture posts on a mocked transport"""
+    requests = []
+    responses = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(responses.pop(0) if responses else 204)
+
+    for notification in session.exec(select(Notification)).all():
+        session.delete(notification)
+    session.add(Config(key='DISCORD_WEBHOOK', value=WEBHOOK))
+    session.commit()
+    notify._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    notify._last_sent.clear()
+
+    yield requests, responses
+
+    for notification in session.exec(select(Notification)).all():
+        session.delete(notification)
+    session.delete(session.get(Config, 'DISCORD_WEBHOOK'))
+    session.commit()
+    notify._client = None
+
+
+@pytest.mark.anyio
+async def test_outbox_batching(requests, session: Session):
+    sent, _responses = requests
+    for i in range(3):
+        notify.notify(session, f'message {i}')
+
+    assert await notify.outbox_flush() == 3
+    assert len(sent) == 1
+    assert json.loads(sent[0].content)['content'] == 'message 0\nmessage 1\nmessage 2'
+    assert session.exec(select(Notification)).all() == []
+
+
+@pytest.mark.anyio
+async def test_outbox_retry(requests, session: Session):
+    sent, responses = requests
+    responses.append(500)
+    notify.notify(session, 'retry')
+
+    assert await notify.outbox_flush() == 0
+    notification = session.exec(select(Notification)).one()
+    session.refresh(notification)
+    assert notification.attempts == 1
+    assert notification.status == 'pending'
+
+    # not due yet and rate limited
+    assert await notify.outbox_flush() == 0
+    assert len(sent) == 1
+
+
+def test_notify_unconfigured_channel(session: Session):
+    notify.notify(session, 'nobody listens', channels=['slack'])
+    assert session.exec(select(Notification)).all() == []
@@ -2,6 +2,7 @@
 import yaml
 
 from context import *
+from canary_cd.utils.proxy import proxy
 
 TEST_FQDN = 'example.com'
 TEST_CORS = 'https://example2.com'
@@ -20,9 +21,10 @@ class TestPageAPI:
     @pytest.mark.anyio
     @pytest.mark.dependency()
     async def test_page_dynamic_traefik_config_file(self, client: AsyncClient, session: Session):
-        dynamic_config = settings.DYN_CONFIG_CACHE / f'{TEST_FQDN}.yml'
-        assert os.path.isfile(dynamic_config)
-        with open(dynamic_config, 'r') as f:
+        await proxy.flush()
+        config_file = settings.DYN_CONFIG_CACHE / 'dynamic.yml'
+        assert os.path.isfile(config_file)
+        with open(config_file, 'r') as f:
             data = yaml.load(f, Loader=yaml.SafeLoader)
             assert 'http' in data
             assert type(data['http']) == dict
@@ -0,0 +1,65 @@
+"""Request Instrumentation Tests"""
+import logging
+
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlmodel import create_engine
+
+from context import *
+from canary_cd.utils.profiling import TimingMiddleware, Profiler, instrument_engine
+
+
+@pytest.mark.anyio
+async def test_server_timing_and_slow_queries(caplog):
+    engine = create_engine('sqlite://')
+    instrument_engine(engine, slow_query_ms=0.001)
+    timing_app = FastAPI()
+    timing_app.add_middleware(TimingMiddleware, timing=True, slow_request_ms=0.001, profiles=Profiler())
+
+    @timing_app.get('/query')
+    async def query():
+        with Session(engine) as db:
+            db.exec(text('SELECT 1'))
+            db.exec(text('SELECT 2'))
+        return {}
+
+    caplog.set_level(logging.WARNING)
+    async with AsyncClient(transport=ASGITransport(app=timing_app), base_url='http://test') as client:
+        response = await client.get('/query')
+
+    metrics = dict(metric.split(';', 1) for metric in response.headers['server-timing'].split(', '))
+    assert set(metrics) == {'app', 'db'}
+    assert metrics['db'].endswith('desc="2 queries"')
+    assert 'Slow query' in caplog.text and 'SELECT 2' in caplog.text
+    assert 'Slow request GET /query' in caplog.text
+
+
+@pytest.mark.anyio
+async def test_profile_next_requests(client: AsyncClient):
+    response = await client.post('/profile', json={'path': '/project', 'method': 'GET', 'count': 2})
+    assert response.status_code == 201
+
+    # only the armed path and method, without timing enabled no header otherwise
+    response = await client.get('/page')
+    assert 'server-timing' not in response.headers
+    for _ in range(3):
+        await client.get('/project')
+
+    response = await client.get('/profile')
+    data = response.json()
+    assert data['armed'] == []
+    assert [(profile['method'], profile['path']) for profile in data['profiles']] == [('GET', '/project')] * 2
+
+    profile_id = data['profiles'][0]['id']
+    response = await client.get(f'/profile/{profile_id}')
+    assert response.status_code == 200
+    assert 'project_list' in response.text
+
+    await client.post('/profile', json={'path': '/project', 'count': 5})
+    response = await client.get('/project')
+    assert 'profile;desc="' in response.headers['server-timing']
+    await client.delete('/profile')
+    assert (await client.get('/profile')).json()['armed'] == []
+
+    response = await client.get(f'/profile/{uuid.uuid4()}')
+    assert response.status_code == 404
@@ -128,6 +128,30 @@ class TestProjectAPI:
         assert response.status_code == 404
         assert response.json()['detail'] == 'Project not found'
 
+    @pytest.mark.anyio
+    @pytest.mark.dependency(depends=['TestProjectAPI::test_project_create'])
+    async def test_project_canary(self, client: AsyncClient):
+        response = await client.get(f'/project/{TEST_NAME}/canary')
+        assert response.status_code == 404
+
+        canary = {'fqdn': 'canary.example.com', 'service': 'web', 'port': 8080, 'steps': [50, 10], 'interval': 30}
+        response = await client.put(f'/project/{TEST_NAME}/canary', json=canary)
+        assert response.status_code == 200
+        data = response.json()
+        assert data['steps'] == [50, 10]
+        assert data['status'] == 'idle'
+        assert data['active'] is None
+
+        response = await client.get(f'/project/{TEST_NAME}/canary')
+        assert response.json()['fqdn'] == 'canary.example.com'
+
+        response = await client.put(f'/project/{TEST_NAME}/canary', json={**canary, 'steps': [0, 100]})
+        assert response.status_code == 422
+
+        response = await client.delete(f'/project/{TEST_NAME}/canary')
+        assert response.status_code == 200
+        assert response.json()['detail'] == f'{TEST_NAME} canary removed'
+
     @pytest.mark.anyio
     @pytest.mark.dependency(depends=['TestProjectAPI::test_project_create'])
     async def test_project_delete(self, client: AsyncClient):
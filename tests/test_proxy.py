@@ -0,0 +1,245 @@
+"""Proxy Backend Tests"""
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import yaml
+
+from context import *
+from canary_cd.utils.proxy import CaddyBackend, NginxBackend, DynamicConfigWriter
+from canary_cd.utils.proxy.base import ENGINE_HOST
+
+
+@pytest.fixture(name='config_dir')
+def config_dir_fixture():
+    temp_dir = tempfile.TemporaryDirectory()
+    yield Path(temp_dir.name)
+    temp_dir.cleanup()
+
+
+def read_routers(config_dir: Path) -> dict:
+    routers = {}
+    for file in config_dir.glob('*.yml'):
+        routers.update(yaml.safe_load(file.read_text())['http']['routers'])
+    return routers
+
+
+@pytest.mark.anyio
+async def test_traefik_sharded_flush(config_dir: Path):
+    writer = DynamicConfigWriter(config_dir, shards=4, debounce=60)
+    for i in range(100):
+        writer.set_page(f'page-{i}.example.com')
+    writer.set_redirect('www.example.com', 'example.com')
+
+    assert await writer.flush() == 4
+    assert sorted(file.name for file in config_dir.iterdir()) == [f'dynamic-{i:03d}.yml' for i in range(4)]
+    routers = read_routers(config_dir)
+    assert len(routers) == 101
+    assert 'forward-router-www.example.com' in routers
+
+    # only the shard of a changed host is written again
+    writer.remove('www.example.com')
+    assert await writer.flush() == 1
+    assert 'forward-router-www.example.com' not in read_routers(config_dir)
+    assert await writer.flush() == 0
+
+
+@pytest.mark.anyio
+async def test_traefik_debounced_flush(config_dir: Path):
+    writer = DynamicConfigWriter(config_dir, debounce=0.05)
+    writer.set_page('a.example.com')
+    writer.set_page('b.example.com')
+    assert not (config_dir / 'dynamic.yml').exists()
+
+    await asyncio.sleep(0.2)
+    assert set(read_routers(config_dir)) == {'backend-router-a.example.com', 'backend-router-b.example.com'}
+    # no temporary files are left behind
+    assert [file.name for file in config_dir.iterdir()] == ['dynamic.yml']
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures('client')
+async def test_traefik_rebuild(config_dir: Path, session: Session):
+    # a file per host of an earlier version, shards of another shard count and a file of the proxy setup
+    for name in ['rebuild.example.com.yml', 'dynamic-003.yml', 'middlewares.yml']:
+        (config_dir / name).write_text('http: {routers: {}}')
+    session.add(Redirect(source='rebuild.example.com', destination='example.com'))
+    session.commit()
+
+    writer = DynamicConfigWriter(config_dir)
+    await writer.rebuild()
+    assert sorted(file.name for file in config_dir.iterdir()) == ['dynamic.yml', 'middlewares.yml']
+    assert 'forward-router-rebuild.example.com' in read_routers(config_dir)
+    assert (config_dir / 'dynamic.yml').stat().st_mode & 0o777 == 0o644
+
+    session.delete(session.exec(select(Redirect).where(Redirect.source == 'rebuild.example.com')).one())
+    session.commit()
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures('client')
+async def test_traefik_workers(config_dir: Path, session: Session):
+    workers = [DynamicConfigWriter(config_dir, debounce=60) for _ in range(2)]
+    for worker in workers:
+        await worker.rebuild()
+
+    # each worker adds a page, the file written last has both
+    for worker, fqdn in zip(workers, ['one.workers.example.com', 'two.workers.example.com']):
+        session.add(Page(fqdn=fqdn))
+        session.commit()
+        worker.set_page(fqdn)
+        await worker.flush()
+    assert {'backend-router-one.workers.example.com',
+            'backend-router-two.workers.example.com'} <= set(read_routers(config_dir))
+
+    # a page removed by one worker is not written again by the other
+    session.delete(session.exec(select(Page).where(Page.fqdn == 'one.workers.example.com')).one())
+    session.commit()
+    workers[0].remove('one.workers.example.com')
+    await workers[0].flush()
+    workers[1].set_page('two.workers.example.com')
+    await workers[1].flush()
+    routers = read_routers(config_dir)
+    assert 'backend-router-one.workers.example.com' not in routers
+    assert 'backend-router-two.workers.example.com' in routers
+
+    session.delete(session.exec(select(Page).where(Page.fqdn == 'two.workers.example.com')).one())
+    session.commit()
+
+
+class MockCaddy:
+    """admin API keeping routes by @id"""
+
+    def __init__(self):
+        self.routes: list[dict] = []
+        self.requests: list[tuple[str, str]] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path))
+        ids = [route['@id'] for route in self.routes]
+        if request.url.path.startswith('/id/'):
+            route_id = request.url.path.removeprefix('/id/')
+            if route_id not in ids:
+                return httpx.Response(404, json={'error': f'unknown object ID {route_id}'})
+            if request.method == 'DELETE':
+                self.routes.pop(ids.index(route_id))
+            else:
+                self.routes[ids.index(route_id)] = json.loads(request.content)
+            return httpx.Response(200)
+        if request.method == 'POST':
+            self.routes.append(json.loads(request.content))
+        else:
+            self.routes = json.loads(request.content)
+        return httpx.Response(200)
+
+
+@pytest.mark.anyio
+async def test_caddy_incremental():
+    caddy = MockCaddy()
+    backend = CaddyBackend('http://caddy:2019', 'canary', transport=httpx.MockTransport(caddy.handler), debounce=60)
+    backend.hosts = {'a.example.com': backend.page('a.example.com')}
+    backend.full = True
+    assert await backend.flush() == 1
+    assert caddy.requests == [('PATCH', '/config/apps/http/servers/canary/routes')]
+
+    # a new host is appended, an existing one patched, a removed one deleted
+    caddy.requests.clear()
+    backend.set_redirect('b.example.com', 'example.com')
+    await backend.flush()
+    backend.set_page('a.example.com', 'example.org')
+    backend.remove('b.example.com')
+    await backend.flush()
+    assert caddy.requests == [
+        ('PATCH', '/id/canary-cd-b.example.com'),
+        ('POST', '/config/apps/http/servers/canary/routes'),
+        ('PATCH', '/id/canary-cd-a.example.com'),
+        ('DELETE', '/id/canary-cd-b.example.com'),
+    ]
+    assert [route['@id'] for route in caddy.routes] == ['canary-cd-a.example.com']
+    assert caddy.routes[0]['handle'][0]['handler'] == 'subroute'
+    assert caddy.routes[0]['handle'][1]['upstreams'] == [{'dial': 'static-pages:80'}]
+    await backend.close()
+
+
+@pytest.mark.anyio
+async def test_caddy_retry():
+    failing = httpx.MockTransport(lambda request: httpx.Response(500))
+    backend = CaddyBackend(transport=failing, debounce=60)
+    backend.set_page('a.example.com')
+    with pytest.raises(httpx.HTTPStatusError):
+        await backend.flush()
+    # the change is kept for the next push
+    assert backend.dirty == {'a.example.com'}
+    await backend.close()
+
+
+@pytest.mark.anyio
+async def test_nginx_map_files(config_dir: Path):
+    backend = NginxBackend(config_dir, reload=f"touch {config_dir / 'reloaded'}", debounce=60)
+    backend.set_page('a.example.com')
+    backend.set_redirect('www.example.com', 'example.com')
+    backend.set_canary(Canary(fqdn='app.example.com', service='web', port=8080,
+                              active='blue', candidate='green', weight=10), 'app')
+    await backend.flush()
+
+    assert (config_dir / 'backends.map').read_text() == (
+        'a.example.com http://static-pages;\n'
+        'app.example.com $canary_app_example_com;\n'
+    )
+    assert (config_dir / 'redirects.map').read_text() == 'www.example.com example.com;\n'
+    assert (config_dir / 'canary.conf').read_text() == (
+        'split_clients $request_id $canary_app_example_com {\n'
+        '    10% http://app-green-web-1:8080;\n'
+        '    * http://app-blue-web-1:8080;\n'
+        '}\n'
+    )
+    assert (config_dir / 'reloaded').exists()
+
+    # several changes, one reload; nothing changed, no reload
+    backend.set_page('b.example.com')
+    backend.set_page('c.example.com')
+    await backend.flush()
+    assert backend.reloads == 2
+    backend.set_page('c.example.com')
+    await backend.flush()
+    assert backend.reloads == 2
+
+
+@pytest.mark.anyio
+async def test_traefik_redirect_engine(config_dir: Path):
+    writer = DynamicConfigWriter(config_dir, debounce=60, redirect_engine=True)
+    writer.set_redirect('b.example.com', 'example.com')
+    writer.set_redirect('a.example.com', 'example.com')
+    await writer.flush()
+
+    config = yaml.safe_load((config_dir / 'dynamic.yml').read_text())['http']
+    assert list(config['routers']) == ['redirect-engine-router']
+    assert config['routers']['redirect-engine-router']['tls']['domains'] == [
+        {'main': 'a.example.com'}, {'main': 'b.example.com'},
+    ]
+    assert 'middlewares' not in config
+
+    writer.remove('a.example.com')
+    writer.remove('b.example.com')
+    await writer.flush()
+    assert not (config_dir / 'dynamic.yml').exists()
+
+
+@pytest.mark.anyio
+async def test_redirect_engine_patterns(config_dir: Path):
+    backend = NginxBackend(config_dir, reload='true', debounce=60, redirect_engine=True)
+    backend.set_redirect('a.example.com/docs', 'docs.example.com')
+    backend.set_redirect('a.example.com/blog', 'blog.example.com')
+    backend.set_redirect('*.old.example.com', 'example.com')
+    await backend.flush()
+    assert (config_dir / 'backends.map').read_text() == (
+        '*.old.example.com http://canary-cd;\n'
+        'a.example.com http://canary-cd;\n'
+    )
+
+    # path prefixes share the route of their host
+    backend.remove('a.example.com/docs')
+    assert backend.hosts[ENGINE_HOST] == ('engine', ('*.old.example.com', 'a.example.com'))
+    backend.remove('a.example.com/blog')
+    assert backend.hosts[ENGINE_HOST] == ('engine', ('*.old.example.com',))
@@ -0,0 +1,89 @@
+"""Webhook Rate Limit Tests"""
+from functools import partial
+
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from context import *
+from canary_cd.dependencies import ch
+from canary_cd.routers import webhook
+from canary_cd.utils import ratelimit
+from canary_cd.utils.ratelimit import RateLimiter, admit_deployment, deploy_backlog
+
+
+def test_token_bucket(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: clock[0])
+    limiter = RateLimiter(rate=0.5, burst=2, max_keys=2)
+
+    assert limiter.take('a') == 0
+    assert limiter.take('a') == 0
+    assert limiter.take('a') == 2
+    clock[0] += 1
+    assert limiter.take('a') == 1
+    clock[0] += 1
+    assert limiter.take('a') == 0
+    # keys have their own buckets, the least recently used is dropped
+    assert limiter.take('b') == 0
+    assert limiter.take('c') == 0
+    assert list(limiter.buckets) == ['b', 'c']
+    assert RateLimiter(rate=0, burst=0).take('a') == 0
+
+
+@pytest.mark.anyio
+async def test_webhook_rate_limits(client: AsyncClient, session: Session, monkeypatch):
+    monkeypatch.setattr(webhook, 'token_limiter', RateLimiter(rate=0.01, burst=2))
+    monkeypatch.setattr(ratelimit, 'ip_limiter', RateLimiter(rate=0.01, burst=4))
+    session.add(Project(name='ratelimit-test', token=ch.hash('ratelimit-token')))
+    session.add(Project(name='ratelimit-other', token=ch.hash('ratelimit-other-token')))
+    session.commit()
+
+    statuses = [(await client.post('/webhook/project/ratelimit-token')).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = await client.post('/webhook/project/ratelimit-token')
+    assert response.json()['detail'] == 'Too many requests'
+    assert 90 <= int(response.headers['retry-after']) <= 100
+
+    # the client ip used up its burst, whatever the token
+    response = await client.post('/webhook/project/ratelimit-other-token')
+    assert response.status_code == 429
+    response = await client.post('/webhook/page/invalid-token')
+    assert response.status_code == 429
+
+    for name in ['ratelimit-test', 'ratelimit-other']:
+        await client.delete(f'/project/{name}')
+
+
+@pytest.mark.anyio
+async def test_webhook_ip_limit_spoofed_header(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'ip_limiter', RateLimiter(rate=0.01, burst=2))
+    proxied = ProxyHeadersMiddleware(app, trusted_hosts='10.0.0.2')
+
+    async def statuses(peer: str) -> list[int]:
+        transport = ASGITransport(app=proxied, client=(peer, 1234))
+        async with AsyncClient(transport=transport, base_url='http://test') as client:
+            return [(await client.post('/webhook/page/invalid-token',
+                                       headers={'X-Forwarded-For': f'198.51.100.{i}'})).status_code
+                    for i in range(3)]
+
+    # clients cannot pick their ip, only the trusted proxy sets it
+    assert await statuses('203.0.113.7') == [403, 403, 429]
+    assert await statuses('10.0.0.2') == [403, 403, 403]
+
+
+@pytest.mark.anyio
+async def test_webhook_deploy_backlog(client: AsyncClient, session: Session, monkeypatch):
+    project = Project(name='backlog-test', token=ch.hash('backlog-token'), agent='backlog-agent')
+    session.add(project)
+    session.add(Deployment(project=project, status='success', duration=12.3))
+    session.commit()
+    monkeypatch.setattr(webhook, 'admit_deployment', partial(admit_deployment, limit=deploy_backlog(session) + 1))
+
+    # deployments of an agent pinned project stay queued
+    response = await client.post('/webhook/project/backlog-token')
+    assert response.status_code == 200
+    response = await client.post('/webhook/project/backlog-token')
+    assert response.status_code == 429
+    assert response.json()['detail'] == 'Deployment queue is full'
+    assert response.headers['retry-after'] == '13'
+
+    await client.delete('/project/backlog-test')
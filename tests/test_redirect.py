@@ -67,3 +67,19 @@ class TestRedirectAPI:
     async def test_redirect_delete_does_not_exist(self, client: AsyncClient):
         response = await client.delete(f'/redirect/null.com')
         assert response.status_code == 404
+
+    @pytest.mark.anyio
+    async def test_redirect_pattern_needs_engine(self, client: AsyncClient):
+        for source in ['*.old-brand.com', 'example.org/blog']:
+            response = await client.post("/redirect", json={'source': source, 'destination': TEST_DEST})
+            assert response.status_code == 400
+
+        response = await client.post("/redirect", json={'source': '*old-brand.com', 'destination': TEST_DEST})
+        assert response.status_code == 422
+
+    @pytest.mark.anyio
+    async def test_redirect_delete_path(self, client: AsyncClient, session: Session):
+        session.add(Redirect(source='example.org/blog', destination=TEST_DEST))
+        session.commit()
+        response = await client.delete("/redirect/example.org/blog")
+        assert response.status_code == 200
@@ -0,0 +1,99 @@
+"""Redirect Engine Tests"""
+from starlette.responses import PlainTextResponse
+
+from context import *
+from canary_cd.utils.redirects import RedirectMap, RedirectMiddleware, RedirectTrie
+
+
+async def api(scope, receive, send):
+    await PlainTextResponse('api')(scope, receive, send)
+
+
+@pytest.mark.anyio
+async def test_redirect_middleware():
+    redirects = RedirectMap()
+    redirects.set('old.example.com', 'new.example.com')
+    transport = ASGITransport(app=RedirectMiddleware(api, redirects))
+
+    async with AsyncClient(transport=transport, base_url='http://old.example.com') as client:
+        response = await client.get('/path/page?a=1')
+        assert response.status_code == 301
+        assert response.headers['location'] == 'https://new.example.com/path/page?a=1'
+
+        # the port is ignored, unknown hosts reach the application
+        response = await client.get('/', headers={'Host': 'OLD.example.com:443'})
+        assert response.status_code == 301
+        response = await client.get('/', headers={'Host': 'api.example.com'})
+        assert response.text == 'api'
+
+
+@pytest.mark.anyio
+async def test_redirect_map_refresh(session: Session):
+    redirects = RedirectMap()
+    redirects.load()
+    assert not redirects.refresh()
+
+    redirect = Redirect(source='refresh.example.com', destination='example.com')
+    session.add(redirect)
+    session.commit()
+    assert redirects.refresh()
+    assert redirects.lookup('refresh.example.com') == 'https://example.com/'
+
+    session.delete(redirect)
+    session.commit()
+    assert redirects.refresh()
+    assert redirects.lookup('refresh.example.com') is None
+
+
+def test_redirect_trie_most_specific():
+    trie = RedirectTrie()
+    trie.insert('*.old.com', 'new.com')
+    trie.insert('*.shop.old.com', 'shop.new.com')
+    trie.insert('www.shop.old.com', 'www.new.com')
+    trie.insert('old.com/blog', 'blog.new.com/archive')
+    trie.insert('old.com/blog/2019', 'blog.new.com/2019')
+
+    # exact host before the longer wildcard before the shorter one
+    assert trie.match('www.shop.old.com', '/a') == 'https://www.new.com/a'
+    assert trie.match('cart.shop.old.com', '/a') == 'https://shop.new.com/a'
+    assert trie.match('a.b.c.old.com', '/') == 'https://new.com/'
+    # a wildcard does not cover the host itself
+    assert trie.match('shop.old.com', '/') == 'https://new.com/'
+    assert trie.match('old.com', '/') is None
+
+    # the longest path prefix wins, the rest of the path is kept
+    assert trie.match('old.com', '/blog') == 'https://blog.new.com/archive'
+    assert trie.match('old.com', '/blog/post') == 'https://blog.new.com/archive/post'
+    assert trie.match('old.com', '/blog/2019/01') == 'https://blog.new.com/2019/01'
+    assert trie.match('old.com', '/blogs') is None
+
+    trie.delete('old.com/blog/2019')
+    assert trie.match('old.com', '/blog/2019/01') == 'https://blog.new.com/archive/2019/01'
+    trie.delete('*.shop.old.com')
+    assert trie.match('cart.shop.old.com', '/') == 'https://new.com/'
+
+
+def test_redirect_trie_path_falls_back_to_wildcard():
+    trie = RedirectTrie()
+    trie.insert('*.old.com', 'new.com')
+    trie.insert('www.old.com/docs', 'docs.new.com')
+    assert trie.match('www.old.com', '/docs/a') == 'https://docs.new.com/a'
+    # no rule of the exact host matches the path
+    assert trie.match('www.old.com', '/about') == 'https://new.com/about'
+
+
+@pytest.mark.anyio
+async def test_redirect_middleware_patterns():
+    redirects = RedirectMap()
+    redirects.set('*.old.example.com', 'new.example.com')
+    redirects.set('blog.example.com/2019', 'archive.example.com/blog')
+    transport = ASGITransport(app=RedirectMiddleware(api, redirects))
+
+    async with AsyncClient(transport=transport, base_url='http://a.b.old.example.com') as client:
+        response = await client.get('/page?a=1')
+        assert response.headers['location'] == 'https://new.example.com/page?a=1'
+
+        response = await client.get('/2019/post', headers={'Host': 'blog.example.com'})
+        assert response.headers['location'] == 'https://archive.example.com/blog/post'
+        response = await client.get('/2020/post', headers={'Host': 'blog.example.com'})
+        assert response.text == 'api'
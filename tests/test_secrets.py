@@ -1,5 +1,6 @@
 """Project Test"""
 from context import *
+from canary_cd.dependencies import ch
 from canary_cd.models import ProjectDetails
 
 TEST_NAME = 'test-project-for-secret'
@@ -71,4 +72,66 @@ class TestSecretAPI:
         response = await client.delete(f'/secret/does-not-exist/key')
         data = response.json()
         assert response.status_code == 403
-        assert data['detail'] == 'Project does not exists'
\ No newline at end of file
+        assert data['detail'] == 'Project does not exists'
+
+TEST_BATCH_NAME = 'test-project-for-secret-batch'
+
+
+@pytest.fixture(name='batch_projects')
+def batch_projects_fixture(session: Session):
+    projects = [Project(name=TEST_BATCH_NAME), Project(name=f'{TEST_BATCH_NAME}-other')]
+    session.add_all(projects)
+    session.commit()
+    yield projects
+    for project in projects:
+        session.delete(project)
+    session.commit()
+
+
+@pytest.mark.anyio
+async def test_secret_set_batch(client: AsyncClient, session: Session, batch_projects: list[Project]):
+    project, other = batch_projects
+    # the same key of another project is not touched
+    response = await client.put(f"/secret/{other.name}", json={'key': 'VAR_0', 'value': 'other'})
+    assert response.status_code == 200
+
+    variables = {f'VAR_{number}': f'value {number}' for number in range(200)}
+    response = await client.put(f"/secret/{TEST_BATCH_NAME}/batch", json={'variables': variables})
+    assert response.status_code == 200
+    assert len(response.json()['created']) == 200 and response.json()['updated'] == []
+
+    response = await client.put(f"/secret/{TEST_BATCH_NAME}/batch",
+                                json={'variables': {'VAR_0': 'changed', 'new_var': 'new'}})
+    assert response.json() == {'created': ['NEW_VAR'], 'updated': ['VAR_0']}
+
+    secrets = {secret['key']: secret['value'] for secret in
+               [*(await client.get(f"/secret/{TEST_BATCH_NAME}?limit=100")).json(),
+                *(await client.get(f"/secret/{TEST_BATCH_NAME}?offset=100&limit=100")).json(),
+                *(await client.get(f"/secret/{TEST_BATCH_NAME}?offset=200&limit=100")).json()]}
+    assert len(secrets) == 201 and secrets['VAR_0'] == 'changed' and secrets['VAR_199'] == 'value 199'
+    assert (await client.get(f"/secret/{other.name}")).json()[0]['value'] == 'other'
+
+    # nothing is written if a single variable is invalid
+    response = await client.put(f"/secret/{TEST_BATCH_NAME}/batch",
+                                json={'variables': {'VAR_1': 'changed', 'INVALID-KEY': 'value', 'EMPTY': ''}})
+    assert response.status_code == 422
+    assert response.json()['detail'] == 'Invalid variables: INVALID-KEY, EMPTY'
+    secret = session.exec(select(Secret).where(Secret.project_id == project.id).where(Secret.key == 'VAR_1')).one()
+    assert ch.decrypt_record(secret) == 'value 1'
+
+
+@pytest.mark.anyio
+async def test_secret_import_env(client: AsyncClient, batch_projects: list[Project]):
+    env = (b'# database\n'
+           b'export DB_HOST=db.example.com\n'
+           b'DB_PASSWORD="p4ss # word"\n'
+           b"GREETING='hello ${NAME}'\n")
+    response = await client.put(f"/secret/{TEST_BATCH_NAME}/env", files={'file': ('.env', env)})
+    assert response.status_code == 200
+    assert response.json() == {'created': ['DB_HOST', 'DB_PASSWORD', 'GREETING'], 'updated': []}
+
+    secrets = {secret['key']: secret['value'] for secret in (await client.get(f"/secret/{TEST_BATCH_NAME}")).json()}
+    assert secrets == {'DB_HOST': 'db.example.com', 'DB_PASSWORD': 'p4ss # word', 'GREETING': 'hello ${NAME}'}
+
+    response = await client.put(f"/secret/{TEST_BATCH_NAME}/env", files={'file': ('.env', b'NO_VALUE\n')})
+    assert response.status_code == 422
@@ -0,0 +1,28 @@
+"""Startup Tests"""
+import subprocess
+
+from context import *
+from canary_cd.utils.startup import LAZY_MODULES, import_profile, startup_time
+
+# generous, the import of fastapi and sqlmodel alone takes most of it
+IMPORT_BUDGET = float(os.getenv('IMPORT_BUDGET', 3))
+
+
+def test_import_is_lazy():
+    profile = import_profile()
+    assert 'canary_cd.main' in profile
+    assert [name for name in LAZY_MODULES if name in profile] == []
+
+
+def test_import_time():
+    import_seconds, startup_seconds = startup_time()
+    logger.info(f"import {import_seconds:.3f}s, startup {startup_seconds:.3f}s")
+    assert import_seconds < IMPORT_BUDGET
+
+
+def test_settings_have_no_side_effects():
+    with tempfile.TemporaryDirectory() as workdir:
+        subprocess.run([sys.executable, '-c', 'import canary_cd.settings, canary_cd.dependencies'],
+                       cwd=workdir, check=True,
+                       env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), DATA_DIR=workdir))
+        assert os.listdir(workdir) == []
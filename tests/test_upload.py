@@ -0,0 +1,163 @@
+"""Resumable Upload Tests"""
+import asyncio
+import base64
+import hashlib
+import io
+import tarfile
+
+from context import *
+from canary_cd.routers import upload
+from canary_cd.utils import ratelimit
+from canary_cd.utils.ratelimit import RateLimiter
+from canary_cd.utils.uploads import claim_payload, release_payload
+
+TEST_FQDN = 'upload-test.com'
+
+
+def payload_archive(files: dict[str, bytes]) -> bytes:
+    payload = io.BytesIO()
+    with tarfile.open(fileobj=payload, mode='w:gz') as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return payload.getvalue()
+
+
+def checksum(data: bytes) -> str:
+    return f"sha256 {base64.b64encode(hashlib.sha256(data).digest()).decode()}"
+
+
+@pytest.fixture(autouse=True)
+def no_ip_limit(monkeypatch):
+    # chunks would use up the bucket of the test client for the webhook tests
+    monkeypatch.setattr(ratelimit, 'ip_limiter', RateLimiter(rate=0, burst=1))
+
+
+@pytest.fixture(name='page_token')
+async def page_token_fixture(client: AsyncClient):
+    await client.post('/page', json={'fqdn': TEST_FQDN})
+    response = await client.get(f'/page/{TEST_FQDN}/refresh-token')
+    yield response.json()['token']
+    await client.delete(f'/page/{TEST_FQDN}')
+
+
+@pytest.mark.anyio
+async def test_resumable_upload(client: AsyncClient, page_token: str):
+    payload = payload_archive({'dist/index.html': b'chunked', 'dist/asset.bin': os.urandom(200_000)})
+    base = f'/webhook/page/{page_token}/uploads'
+    response = await client.post(base, json={'size': len(payload), 'checksum': hashlib.sha256(payload).hexdigest()})
+    assert response.status_code == 201
+    upload_id = response.json()['id']
+    assert response.json()['missing'] == [[0, len(payload)]]
+
+    chunk_size = 64 * 1024
+    chunks = [(offset, payload[offset:offset + chunk_size]) for offset in range(0, len(payload), chunk_size)]
+
+    # a corrupted chunk is not received
+    response = await client.put(f'{base}/{upload_id}', params={'offset': 0}, content=b'x' * chunk_size,
+                                headers={'Upload-Checksum': checksum(chunks[0][1])})
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Checksum mismatch'
+
+    # only the last chunk arrived before the connection dropped
+    for offset, chunk in chunks[-1:]:
+        await client.put(f'{base}/{upload_id}', params={'offset': offset}, content=chunk,
+                         headers={'Upload-Checksum': checksum(chunk)})
+    response = await client.post(f'{base}/{upload_id}/finish')
+    assert response.status_code == 409
+
+    response = await client.get(f'{base}/{upload_id}')
+    assert response.headers['upload-offset'] == '0'
+    start, end = response.json()['missing'][0]
+    # the missing ones are sent in parallel
+    assert (start, end) == (0, chunks[-1][0])
+    await asyncio.gather(*[client.put(f'{base}/{upload_id}', params={'offset': offset}, content=chunk,
+                                      headers={'Upload-Checksum': checksum(chunk)})
+                           for offset, chunk in chunks if start <= offset < end])
+    response = await client.get(f'{base}/{upload_id}')
+    assert response.json()['received'] == [[0, len(payload)]]
+    assert response.headers['upload-offset'] == str(len(payload))
+
+    response = await client.post(f'{base}/{upload_id}/finish')
+    assert response.status_code == 200
+    assert response.json()['detail'] == f"{TEST_FQDN} uploaded"
+    assert (settings.PAGES_CACHE / TEST_FQDN / 'index.html').read_bytes() == b'chunked'
+
+    # the session is gone with its data
+    response = await client.get(f'{base}/{upload_id}')
+    assert response.status_code == 404
+    assert not list(settings.UPLOAD_CACHE.glob(f'{upload_id}*'))
+
+
+@pytest.mark.anyio
+async def test_upload_checksum_and_admin(client: AsyncClient, page_token: str):
+    payload = payload_archive({'index.html': b'admin'})
+    base = f'/upload/{TEST_FQDN}/uploads'
+
+    response = await client.post(base, json={'size': len(payload), 'checksum': '0' * 64})
+    upload_id = response.json()['id']
+    await client.put(f'{base}/{upload_id}', content=payload)
+    # chunks without a checksum are only verified with the upload
+    response = await client.post(f'{base}/{upload_id}/finish')
+    assert response.status_code == 400
+    response = await client.get(f'{base}/{upload_id}')
+    assert response.json()['received'] == []
+
+    response = await client.put(f'{base}/{upload_id}', params={'offset': len(payload)}, content=b'x')
+    assert response.status_code == 400
+    response = await client.put(f'{base}/{upload_id}', content=payload, headers={'Upload-Checksum': 'md5 abc'})
+    assert response.status_code == 400
+
+    # uploads of other pages are not found
+    response = await client.get(f'/webhook/page/{page_token}/uploads/{uuid.uuid4()}')
+    assert response.status_code == 404
+
+    response = await client.delete(f'{base}/{upload_id}')
+    assert response.json()['detail'] == 'upload removed'
+    assert not (settings.UPLOAD_CACHE / upload_id).exists()
+
+    response = await client.post(base, json={'size': settings.UPLOAD_MAX_SIZE + 1})
+    assert response.status_code == 413
+    response = await client.post('/upload/missing.example.com/uploads', json={'size': 1})
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_upload_finished_once(client: AsyncClient, page_token: str, session: Session):
+    payload = payload_archive({'index.html': b'once'})
+    base = f'/webhook/page/{page_token}/uploads'
+    response = await client.post(base, json={'size': len(payload)})
+    upload_id = response.json()['id']
+    await client.put(f'{base}/{upload_id}', content=payload)
+
+    # of several requests finishing the upload, a single one gets the payload
+    upload = session.get(Upload, uuid.UUID(upload_id))
+    claimed = claim_payload(upload)
+    assert claimed is not None
+    assert claim_payload(upload) is None
+    response = await client.post(f'{base}/{upload_id}/finish')
+    assert response.status_code == 409
+    release_payload(upload, claimed)
+
+    response = await client.post(f'{base}/{upload_id}/finish')
+    assert response.status_code == 200
+    response = await client.post(f'{base}/{upload_id}/finish')
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_upload_rate_limit(client: AsyncClient, page_token: str, monkeypatch):
+    monkeypatch.setattr(upload, 'upload_limiter', RateLimiter(rate=0.01, burst=2))
+    base = f'/webhook/page/{page_token}/uploads'
+
+    response = await client.post(base, json={'size': 1})
+    upload_id = response.json()['id']
+    assert (await client.get(f'{base}/{upload_id}')).status_code == 200
+    response = await client.put(f'{base}/{upload_id}', content=b'x')
+    assert response.status_code == 429
+    assert 'retry-after' in response.headers
+
+    # admins are not limited
+    response = await client.get(f'/upload/{TEST_FQDN}/uploads/{upload_id}')
+    assert response.status_code == 200